@@ -7,4 +7,6 @@ def main(global_config, **settings):        # pragma: no cover, tests have own a
     from .config import configure
     settings['config_ini_path'] = global_config['__file__']
     config = configure(global_config, **settings)
+    from .reachability import get_reachability_monitor
+    get_reachability_monitor().watch_devices_file(settings['devices_path'])
     return config.make_wsgi_app()
@@ -1,9 +1,8 @@
 import json
 import logging
 
-import yaml
-
 from . import supervisor
+from .nuimo_app_config import update_config
 from .views.nuimo_components import create_component
 
 
@@ -56,17 +55,13 @@ def create_nuimo_app_cfg(settings):
     nuimo_app_config_file_path = settings['nuimo_app_config_path']
     logger.debug("Nuimo app config path: %s" % nuimo_app_config_file_path)
 
-    if os.path.isfile(nuimo_app_config_file_path) is False:
-        with open(nuimo_app_config_file_path, 'w') as f:
+    def add_nuimo(config):
+        if not config:
             logger.debug("%s not present, creating..." % nuimo_app_config_file_path)
             logger.info("No Nuimos registered do far. Creating init file for Nuimos.")
 
-            config = generate_nuimo_app_configuration(nuimo_mac_address, devices)
-            logger.debug("Writing %s into %s" % (config, nuimo_app_config_file_path))
-            yaml.dump(config, f, default_flow_style=False)
-    else:
-        with open(nuimo_app_config_file_path, 'r+') as f:
-            config = yaml.load(f) or None
+            config.update(generate_nuimo_app_configuration(nuimo_mac_address, devices))
+        else:
             logger.debug("%s present" % nuimo_app_config_file_path)
             logger.info("A nuimo has beed registered on this Hub")
 
@@ -75,10 +70,9 @@ def create_nuimo_app_cfg(settings):
                 'name': 'My NUIMO ' + str(len(config['nuimos']) + 1),
                 'components': components,
             }
-            f.seek(0)  # We want to overwrite the config file with the new configuration
-            f.truncate()
-            logger.debug("Writing %s into %s" % (config, nuimo_app_config_file_path))
-            yaml.dump(config, f, default_flow_style=False)
+        logger.debug("Writing %s into %s" % (config, nuimo_app_config_file_path))
+
+    update_config(nuimo_app_config_file_path, add_nuimo)
 
     if supervisor.program_status('nuimo_app') != 'RUNNING':
         supervisor.start_program('nuimo_app')
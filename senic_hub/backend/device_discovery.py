@@ -8,21 +8,27 @@ import sys
 import time
 import xml.etree.ElementTree as ET
 
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from enum import IntEnum
+from threading import Lock
 
 import click
 import requests
 
-from os.path import abspath
+from os.path import abspath, dirname, join
 from datetime import datetime, timedelta
 from pyramid.paster import get_app
-from requests.exceptions import ConnectionError
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, RequestException
 from json.decoder import JSONDecodeError
 
 from .lockfile import open_locked
 from .network_discovery import NetworkDiscovery
 from .hub_metadata import HubMetaData
+from .ssdp_listener import SSDPListener
+from ..hue_transport import get_hue_transport
+from ..nuimo_app.status import publish_change
 
 
 if os.path.isfile('/etc/senic_hub.ini'):  # pragma: no cover
@@ -42,6 +48,27 @@ SUPPORTED_DEVICES = [
 
 DEFAULT_SCAN_INTERVAL_SECONDS = 1 * 60  # 1 minute
 
+# in passive mode devices announce themselves, we only search for devices
+# that were missed at this interval
+DEFAULT_SWEEP_INTERVAL_SECONDS = 30 * 60  # 30 minutes
+
+# device descriptions are fetched concurrently, a device not responding
+# within the timeout is skipped in this discovery run
+MAX_CONCURRENT_DESCRIPTION_REQUESTS = 8
+DESCRIPTION_TIMEOUT_SECONDS = 5
+
+# how long a successful authentication check with a Philips Hue bridge is
+# trusted as long as neither its address nor the username changed
+AUTHENTICATION_TTL_SECONDS = 10 * 60  # 10 minutes
+
+DESCRIPTION_CACHE_FILE_NAME = 'device_descriptions.json'
+
+# fields that change in every discovery run, they are stored in a separate
+# file so that the devices file is only written when devices changed
+VOLATILE_DEVICE_FIELDS = frozenset(['discovered'])
+
+JOURNAL_MAX_BYTES = 64 * 1024
+
 
 class UnsupportedDeviceTypeException(Exception):
     pass
@@ -63,8 +90,13 @@ def command(config, verbose):  # pragma: no cover
     logging.getLogger("urllib3.connectionpool").setLevel(logging.CRITICAL)
 
     devices_path = app.registry.settings['devices_path']
+    description_cache = DescriptionCache(app.registry.settings.get(
+        'device_description_cache_path', join(dirname(devices_path), DESCRIPTION_CACHE_FILE_NAME)))
     scan_interval_seconds = int(app.registry.settings.get(
         'device_scan_interval_seconds', DEFAULT_SCAN_INTERVAL_SECONDS))
+    sweep_interval_seconds = int(app.registry.settings.get(
+        'device_sweep_interval_seconds', DEFAULT_SWEEP_INTERVAL_SECONDS))
+    passive = app.registry.settings.get('device_discovery_mode', 'passive') == 'passive'
 
     # install Ctrl+C handler
     def sigint_handler(*args):
@@ -72,18 +104,118 @@ def command(config, verbose):  # pragma: no cover
         sys.exit(0)
     signal.signal(signal.SIGINT, sigint_handler)
 
+    if passive:
+        discovery = PassiveDiscovery(devices_path, SSDPListener(), sweep_interval_seconds, description_cache)
+        # SIGUSR1 triggers a search, see `views.setup_devices.devices_discover_view`
+        signal.signal(signal.SIGUSR1, lambda *args: discovery.sweep_requested.set())
+        while True:
+            discovery.run_once()
+
+    sweep_requested = SweepRequest()
+    signal.signal(signal.SIGUSR1, lambda *args: sweep_requested.set())
     while True:
         now = datetime.utcnow()
-        discover_and_merge_devices(devices_path, now)
+        discover_and_merge_devices(devices_path, now, description_cache)
 
         next_scan = now + timedelta(seconds=scan_interval_seconds)
         logger.info("Next device discovery run scheduled for %s", next_scan)
-        time.sleep(scan_interval_seconds)
+        sweep_requested.wait(scan_interval_seconds)
+        sweep_requested.clear()
+
+
+class SweepRequest:
+    """
+    Flag set by the SIGUSR1 handler to request a search for all devices.
+
+    `threading.Event` can't be used as setting it takes a lock, which
+    deadlocks when the signal arrives while the main thread holds that lock
+    in `Event.wait()` or `Event.clear()`. Setting a plain attribute is safe
+    and the main thread polls it instead.
+    """
+
+    POLL_INTERVAL = 1  # seconds
+
+    def __init__(self):
+        self.requested = False
+
+    def set(self):
+        self.requested = True
+
+    def is_set(self):
+        return self.requested
+
+    def clear(self):
+        self.requested = False
+
+    def wait(self, timeout):
+        """
+        Return once a sweep was requested or after `timeout` seconds.
+        """
+        deadline = time.time() + timeout
+        while not self.requested:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, self.POLL_INTERVAL))
+        return self.requested
+
+
+class PassiveDiscovery:
+    """
+    Updates the devices file whenever a device announces itself, see
+    `ssdp_listener`. All devices are only searched for actively on start,
+    when requested with `sweep_requested` or every `sweep_interval_seconds`
+    to find devices whose announcements were missed.
+    """
+
+    # further announcements of a device within this time are ignored
+    ANNOUNCEMENT_INTERVAL = 60  # seconds
+
+    def __init__(self, devices_path, listener, sweep_interval_seconds, description_cache=None):
+        self.devices_path = devices_path
+        self.listener = listener
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self.description_cache = description_cache
+        self.sweep_requested = SweepRequest()
+        self.next_sweep = 0
+        # USN of a device -> time its last announcement was handled
+        self.announcement_times = {}
+
+    def run_once(self, timeout=1):
+        if self.sweep_requested.is_set() or time.time() >= self.next_sweep:
+            self.sweep_requested.clear()
+            discover_and_merge_devices(self.devices_path, datetime.utcnow(), self.description_cache)
+            self.next_sweep = time.time() + self.sweep_interval_seconds
+
+        announcement = self.listener.receive(timeout)
+        if announcement is not None:
+            self.handle_announcement(announcement, datetime.utcnow())
+
+    def handle_announcement(self, announcement, now):
+        if not announcement.alive:
+            logger.info("Device %s left the network", announcement.usn)
+            self.announcement_times.pop(announcement.usn, None)
+            return
+
+        if time.time() - self.announcement_times.get(announcement.usn, 0) < self.ANNOUNCEMENT_INTERVAL:
+            return
+        self.announcement_times[announcement.usn] = time.time()
 
+        device_description = fetch_device_description(announcement.device_type, announcement.device_info, self.description_cache)
+        if device_description is not None:
+            merge_into_devices_file(self.devices_path, [device_description], now, authenticate_all=False)
 
-def discover_and_merge_devices(devices_path, now):
-    discovered_devices = discover_devices()
 
+def discover_and_merge_devices(devices_path, now, description_cache=None):
+    discovered_devices = discover_devices(description_cache=description_cache)
+    merge_into_devices_file(devices_path, discovered_devices, now)
+
+
+def merge_into_devices_file(devices_path, discovered_devices, now, authenticate_all=True):
+    """
+    Merge discovered devices into the devices file. The authentication
+    status is updated for all devices or only for the discovered ones.
+    """
     try:
         with open_locked(devices_path, 'r') as f:
             known_devices = json.load(f)
@@ -93,21 +225,119 @@ def discover_and_merge_devices(devices_path, now):
 
     merged_devices = merge_devices(known_devices, discovered_devices, now)
 
-    add_authentication_status(merged_devices)
+    if authenticate_all:
+        add_authentication_status(merged_devices)
+    else:
+        discovered_ids = {d['id'] for d in discovered_devices}
+        add_authentication_status([d for d in merged_devices if d['id'] in discovered_ids])
+
+    # volatile fields are stored separately, see `VOLATILE_DEVICE_FIELDS`
+    volatile_fields = read_json(volatile_fields_path(devices_path), {})
+    for device in merged_devices:
+        fields = {k: device.pop(k) for k in VOLATILE_DEVICE_FIELDS if k in device}
+        volatile_fields[device['id']] = dict(volatile_fields.get(device['id'], {}), **fields)
+    volatile_fields = {d['id']: volatile_fields[d['id']] for d in merged_devices}
+    write_json(volatile_fields_path(devices_path), volatile_fields)
+
+    diff = diff_devices(known_devices, merged_devices)
+    if not diff and not any(VOLATILE_DEVICE_FIELDS & d.keys() for d in known_devices):
+        return
+
+    write_json(devices_path, merged_devices)
+
+    if diff:
+        append_to_journal(devices_path, dict(diff, time=str(now)))
+        # let clients waiting for updates know, see `views.nuimos.get_update_service`
+        try:
+            publish_change()
+        except OSError as e:
+            logger.error("Failed to publish device changes: %s", e)
+
+
+def volatile_fields_path(devices_path):
+    return devices_path + '.volatile'
+
+
+def journal_path(devices_path):
+    return devices_path + '.journal'
+
+
+def read_json(file_path, default):
+    try:
+        with open_locked(file_path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, JSONDecodeError):
+        return default
+
 
+def write_json(file_path, data):
     try:
-        with open_locked(devices_path, 'w') as f:
-            json.dump(merged_devices, f)
-    except (FileNotFoundError, JSONDecodeError) as e:  # pragma: no cover
+        with open_locked(file_path, 'w') as f:
+            json.dump(data, f)
+    except OSError as e:  # pragma: no cover
         logger.error(e)
 
 
-def discover_devices(discovery_class=NetworkDiscovery):
+def read_volatile_fields(devices_path):
+    """
+    Return the volatile fields of all devices by device ID, see
+    `VOLATILE_DEVICE_FIELDS`.
+    """
+    return read_json(volatile_fields_path(devices_path), {})
+
+
+def diff_devices(old_devices, new_devices):
+    """
+    Return the difference of two device lists, ignoring volatile fields:
+    the devices that were added, the IDs of the devices that were removed
+    and the new values of the fields that changed by device ID. Fields
+    that were removed have the value None. Returns an empty dictionary if
+    nothing changed.
+    """
+    def by_id(devices):
+        return {d['id']: {k: v for k, v in d.items() if k not in VOLATILE_DEVICE_FIELDS} for d in devices}
+
+    old_devices, new_devices = by_id(old_devices), by_id(new_devices)
+    diff = {
+        'added': [new_devices[i] for i in sorted(new_devices.keys() - old_devices.keys())],
+        'removed': sorted(old_devices.keys() - new_devices.keys()),
+        'changed': {
+            i: {k: new_devices[i].get(k) for k in old_devices[i].keys() | new_devices[i].keys()
+                if old_devices[i].get(k) != new_devices[i].get(k)}
+            for i in old_devices.keys() & new_devices.keys() if old_devices[i] != new_devices[i]
+        },
+    }
+    return {k: v for k, v in diff.items() if v}
+
+
+def append_to_journal(devices_path, entry):
+    """
+    Append a change of the devices to the journal, one JSON object per line,
+    so that consumers can follow it with `tail -F`. The journal is rotated
+    when it exceeds `JOURNAL_MAX_BYTES`.
+    """
+    path = journal_path(devices_path)
+    try:
+        if os.path.getsize(path) > JOURNAL_MAX_BYTES:
+            os.replace(path, path + '.1')
+    except FileNotFoundError:
+        pass
+
+    try:
+        with open(path, 'a') as f:
+            f.write(json.dumps(entry, sort_keys=True) + '\n')
+    except OSError as e:  # pragma: no cover
+        logger.error("Failed to write devices journal: %s", e)
+
+
+def discover_devices(discovery_class=NetworkDiscovery, description_cache=None):
     """
     Return a list of all discovered devices.
 
     :param discovery_class: Allow overriding what class to use for
     discovery. Used only in unit tests.
+    :param description_cache: Optional `DescriptionCache` of the
+    descriptions of devices discovered before.
 
     """
     logger.info("Starting device discovery...")
@@ -117,11 +347,20 @@ def discover_devices(discovery_class=NetworkDiscovery):
     netdisco = discovery_class(SUPPORTED_DEVICES)
     netdisco.scan()
 
-    for device_type in netdisco.discover():
-        for device_info in netdisco.get_info(device_type):
-            device_description = get_device_description(device_type, device_info)
-            logger.info("Discovered %s device with ip %s", device_type, device_description["ip"])
-            devices.append(device_description)
+    found_devices = [
+        (device_type, device_info)
+        for device_type in netdisco.discover()
+        for device_info in netdisco.get_info(device_type)
+    ]
+
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DESCRIPTION_REQUESTS) as executor:
+        for device_description in executor.map(lambda d: fetch_device_description(*d, description_cache), found_devices):
+            if device_description is not None:
+                devices.append(device_description)
+
+    if description_cache is not None:
+        description_cache.expire()
+        description_cache.save()
 
     netdisco.stop()
     logger.info("Device discovery finished.")
@@ -129,48 +368,94 @@ def discover_devices(discovery_class=NetworkDiscovery):
     return devices
 
 
-def merge_devices(known_devices, discovered_devices, now):
-    # TODO: Do we need to make a deep copy? Are arrays not passed by-value, but by-ref?
-    known_devices = deepcopy(known_devices)
+def fetch_device_description(device_type, device_info, description_cache=None):
+    """
+    Return the description of a discovered device or None if it couldn't
+    be fetched, so that a single failing device doesn't abort the
+    discovery of all others.
+    """
+    try:
+        device_description = get_device_description(device_type, device_info, description_cache)
+    except (RequestException, UpstreamError, ET.ParseError) as e:
+        logger.warning("Failed to get description of %s device %s: %s", device_type, device_info, e)
+        return None
+
+    logger.info("Discovered %s device with ip %s", device_type, device_description["ip"])
+    return device_description
+
 
-    # TODO: `merged_devices` can be directly assigned with a list comprehension
-    merged_devices = []
+def merge_devices(known_devices, discovered_devices, now):
+    """
+    Return the known devices updated with the discovered ones, sorted by ID.
+    Devices that weren't discovered again are kept. Neither of the given
+    lists nor their devices are modified.
+    """
+    merged_devices = {d["id"]: dict(d) for d in known_devices}
 
     for device in discovered_devices:
-        # make sure we get updates for devices we already had discovered before
-        known_device = next((d for d in known_devices if d["id"] == device["id"]), None)
-        if known_device:
-            known_devices.remove(known_device)
-
-            # Copy "extra" attributes from existing device if not present in newly found
-            # device. These attributes are typically added later such as during
-            # authentication of Philipe Hue bridge.
-            merged_extra = known_device.get('extra', None)
-            if merged_extra:
-                merged_extra.update(device.get('extra', {}))
-                device['extra'] = merged_extra
+        device = dict(device)
 
-        device['discovered'] = str(now)
-        merged_devices.append(device)
+        # Copy "extra" attributes from existing device if not present in newly found
+        # device. These attributes are typically added later such as during
+        # authentication of Philipe Hue bridge.
+        known_device = merged_devices.get(device["id"])
+        if known_device and known_device.get('extra'):
+            device['extra'] = dict(known_device['extra'], **device.get('extra', {}))
 
-    # add already known devices that were not found in this discovery
-    # run or it was found that they didn't have any updates
-    merged_devices.extend(known_devices)
+        device['discovered'] = str(now)
+        merged_devices[device["id"]] = device
 
-    return sorted(merged_devices, key=lambda d: d["id"])
+    return sorted(merged_devices.values(), key=lambda d: d["id"])
 
 
 def add_authentication_status(devices):
+    """
+    Set whether the hub is authenticated with every device. Philips Hue
+    bridges are asked concurrently unless they were successfully asked
+    within `AUTHENTICATION_TTL_SECONDS` with the same address and username.
+    """
+    hue_bridges = []
     for device in devices:
-        if not device["authenticationRequired"]:
+        if device["authenticationRequired"] and device["type"] == "philips_hue":
+            hue_bridges.append(device)
+        else:
             device["authenticated"] = True
-            continue
 
-        if device["type"] == "philips_hue":
-            api = PhilipsHueBridgeApiClient(device["ip"], device['extra'].get('username'))
-            device["authenticated"] = api.is_authenticated()
+    if not hue_bridges:
+        return
+
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DESCRIPTION_REQUESTS) as executor:
+        for device, authenticated in zip(hue_bridges, executor.map(is_bridge_authenticated, hue_bridges)):
+            device["authenticated"] = authenticated
+
+
+# (device id, ip address, username) -> time of the last successful check
+_authenticated_bridges = {}
+_authenticated_bridges_lock = Lock()
+
+
+def is_bridge_authenticated(device):
+    username = device['extra'].get('username')
+    key = (device["id"], device["ip"], username)
+    with _authenticated_bridges_lock:
+        checked = _authenticated_bridges.get(key)
+    if checked is not None and time.time() - checked < AUTHENTICATION_TTL_SECONDS:
+        return True
+
+    api = PhilipsHueBridgeApiClient(device["ip"], username)
+    try:
+        authenticated = api.is_authenticated()
+    except (RequestException, UpstreamError) as e:
+        # keep the last known status rather than failing the whole discovery
+        logger.warning("Failed to check authentication with Hue bridge %s: %s", device["ip"], e)
+        return device.get("authenticated", False)
+
+    with _authenticated_bridges_lock:
+        if authenticated:
+            _authenticated_bridges[key] = time.time()
         else:
-            device["authenticated"] = True
+            _authenticated_bridges.pop(key, None)
+    return authenticated
 
 
 class UnauthenticatedDeviceError(Exception):
@@ -188,15 +473,130 @@ class PhilipsHueBridgeError(IntEnum):
     button_not_pressed = 101
 
 
-def get_device_description(device_type, device_info):
+def get_device_description(device_type, device_info, description_cache=None):
     if device_type == "philips_hue":
         device_class = PhilipsHueBridgeDeviceDescription
     else:
         device_class = SonosSpeakerDeviceDescription
 
+    if description_cache is not None:
+        return description_cache.get(device_type, device_info, device_class)
+
     return device_class(device_info).device_description
 
 
+class DescriptionCache:
+    """
+    Descriptions of discovered devices, stored in a file so that they
+    survive restarts. Entries are keyed by the device type and the URL of
+    its description, hence a device whose address didn't change isn't
+    asked for its description again within `TTL`. After that the description is
+    revalidated with the ETag and Last-Modified headers of the previous
+    response, if the device sent any.
+
+    Entries of devices that weren't discovered in more than
+    `MAX_MISSED_RUNS` discovery runs are removed, see `expire()`.
+    """
+
+    TTL = 60 * 60  # seconds
+
+    MAX_MISSED_RUNS = 10
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.lock = Lock()
+        # keys of the devices discovered since the last `expire()`
+        self.seen = set()
+
+        try:
+            with open(file_path) as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, JSONDecodeError) as e:
+            logger.info("No device descriptions cached: %s", e)
+            self.entries = {}
+
+    def get(self, device_type, device_info, device_class):
+        url = device_class.description_url(device_info)
+        key = json.dumps([device_type, url])
+        with self.lock:
+            self.seen.add(key)
+            entry = self.entries.get(key)
+
+        if entry is not None and time.time() - entry['fetched'] < self.TTL:
+            return entry['description']
+
+        headers = {}
+        if entry is not None and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry is not None and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        response = get_http_session().get(url, headers=headers, timeout=DESCRIPTION_TIMEOUT_SECONDS)
+        if entry is not None and response.status_code == 304:
+            description = entry['description']
+        else:
+            description = device_class(device_info, response).device_description
+
+        with self.lock:
+            self.entries[key] = {
+                'description': description,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched': time.time(),
+                'missed_runs': 0,
+            }
+
+        return description
+
+    def expire(self):
+        """
+        Count a discovery run in which the devices not asked for since the
+        last call weren't discovered and remove the ones missing for too
+        many runs.
+        """
+        with self.lock:
+            for key, entry in list(self.entries.items()):
+                if key in self.seen:
+                    entry['missed_runs'] = 0
+                    continue
+
+                entry['missed_runs'] += 1
+                if entry['missed_runs'] > self.MAX_MISSED_RUNS:
+                    logger.info("Removing cached description of missing device %s", entry['description']['id'])
+                    del self.entries[key]
+
+            self.seen = set()
+
+    def save(self):
+        with self.lock:
+            entries = deepcopy(self.entries)
+
+        try:
+            with open(self.file_path, 'w') as f:
+                json.dump(entries, f)
+        except OSError as e:
+            logger.error("Failed to save device descriptions: %s", e)
+
+
+_http_session = None
+_http_session_lock = Lock()
+
+
+def get_http_session():
+    """
+    Return the session shared by all description requests, its connection
+    pool is large enough for all concurrent requests.
+    """
+    global _http_session
+
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=MAX_CONCURRENT_DESCRIPTION_REQUESTS)
+            _http_session.mount('http://', adapter)
+        return _http_session
+
+
 class username_required:
     def __init__(self, method):
         self.method = method
@@ -219,13 +619,12 @@ class PhilipsHueBridgeApiClient:
 
         self.username = username
 
-        self._http_session = requests.Session()
+        self._transport = get_hue_transport(ip_address)
 
-    def _request(self, url, method="GET", payload=None, timeout=5):
-        request = requests.Request(method, url, data=payload)
-        response = self._http_session.send(request.prepare(), timeout=timeout)
+    def _request(self, path, method="GET", payload=None, timeout=5):
+        response = self._transport.request(method, path, payload, timeout=timeout)
         if response.status_code != 200:
-            logger.debug("Response from Hue bridge %s: %s", url, response.status_code)
+            logger.debug("Response from Hue bridge %s%s: %s", self._transport.base_url, path, response.status_code)
             return
 
         data = response.json()
@@ -257,7 +656,7 @@ class PhilipsHueBridgeApiClient:
         """
         try:
             payload = json.dumps({"devicetype": self.app_name})
-            response = self._request(self.bridge_url, method="POST", payload=payload)
+            response = self._request("/api", method="POST", payload=payload)
             if response:
                 self.username = response["success"]["username"]
         except UnauthenticatedDeviceError:
@@ -272,10 +671,11 @@ class PhilipsHueBridgeApiClient:
 
     def is_authenticated(self):
         # Verify that we can still authenticate with the bridge using
-        # the username that we have saved. We do this by getting the
-        # bridge configuration.
+        # the username that we have saved. We do this by getting group 0
+        # (all lights), the smallest resource that requires a username,
+        # instead of the whole bridge state.
         try:
-            self.get_state()
+            self.get_group(0)
         except UnauthenticatedDeviceError:
             return False
 
@@ -285,25 +685,26 @@ class PhilipsHueBridgeApiClient:
         return True
 
     @username_required
-    def get_state(self):
-        url = "{}/{}".format(self.bridge_url, self.username)
-        return self._request(url)
+    def get_lights(self):
+        path = "/api/{}/lights".format(self.username)
+        return self._request(path)
 
     @username_required
-    def get_lights(self):
-        url = "{}/{}/lights".format(self.bridge_url, self.username)
-        return self._request(url)
+    def get_group(self, group_id):
+        path = "/api/{}/groups/{}".format(self.username, group_id)
+        return self._request(path)
 
     @username_required
     def get_config(self):
-        url = "{}/{}/config".format(self.bridge_url, self.username)
-        return self._request(url)
+        path = "/api/{}/config".format(self.username)
+        return self._request(path)
 
 
 class SonosSpeakerDeviceDescription:
-    def __init__(self, device_info):
+    def __init__(self, device_info, response=None):
         self.ip_address = device_info
-        response = requests.get('http://{}:1400/xml/device_description.xml'.format(self.ip_address))
+        if response is None:
+            response = get_http_session().get(self.description_url(device_info), timeout=DESCRIPTION_TIMEOUT_SECONDS)
         if response.status_code != 200:
             logger.warn("Response from Sonos speaker %s: status_code: %s, body: %s", self.ip_address,
                         response.status_code, response.text)
@@ -316,6 +717,10 @@ class SonosSpeakerDeviceDescription:
         self.room_name = device.findtext('{urn:schemas-upnp-org:device-1-0}roomName')
         self.udn = device.findtext('{urn:schemas-upnp-org:device-1-0}UDN')
 
+    @staticmethod
+    def description_url(device_info):
+        return 'http://{}:1400/xml/device_description.xml'.format(device_info)
+
     @property
     def device_description(self):
         return {
@@ -331,12 +736,12 @@ class SonosSpeakerDeviceDescription:
 
 
 class PhilipsHueBridgeDeviceDescription:
-    def __init__(self, device_info):
+    def __init__(self, device_info, response=None):
         self.bridge_url = device_info[1]
-        url = '{}description.xml'.format(self.bridge_url)
-        response = requests.get(url)
+        if response is None:
+            response = get_http_session().get(self.description_url(device_info), timeout=DESCRIPTION_TIMEOUT_SECONDS)
         if response.status_code != 200:
-            logger.warn("Response from Hue bridge %s: status_code: %s, body: %s", url, response.status_code, response.text)
+            logger.warn("Response from Hue bridge %s: status_code: %s, body: %s", response.url, response.status_code, response.text)
             raise UpstreamError(error_type=response.status_code)
 
         xml = ET.fromstring(response.text)
@@ -345,6 +750,10 @@ class PhilipsHueBridgeDeviceDescription:
         self.serial_number = device.findtext('{urn:schemas-upnp-org:device-1-0}serialNumber')
         self.name = device.findtext('{urn:schemas-upnp-org:device-1-0}friendlyName')
 
+    @staticmethod
+    def description_url(device_info):
+        return '{}description.xml'.format(device_info[1])
+
     @property
     def device_description(self):
         return {
@@ -0,0 +1,366 @@
+"""
+Process-wide, in-memory cache of the Nuimo app configuration (`nuimo_app.cfg`).
+
+The configuration file is parsed once and served as an immutable
+`NuimoAppConfig` snapshot. A snapshot is only re-parsed when the file's
+inode, size or modification time changed, or when an inotify event for it
+was received.
+
+Changes are made with `NuimoAppConfigStore.update()` which applies them to
+a copy of the latest snapshot and atomically replaces the file, so that
+readers (e.g. nuimo_app) never see a partially written configuration.
+"""
+import logging
+import os
+import threading
+
+from os import path, stat
+from tempfile import mkstemp
+from time import sleep
+
+import yaml
+
+from fasteners import InterProcessLock
+
+try:
+    import pyinotify
+except ImportError:  # pragma: no cover, pyinotify is only installed on Linux
+    pyinotify = None
+
+
+logger = logging.getLogger(__name__)
+
+
+class FrozenDict(dict):
+    """
+    Read-only dictionary. Copying it returns a regular, mutable `dict`.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Nuimo app configuration snapshots are read-only")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+
+def freeze(value):
+    """
+    Return a read-only copy of a parsed YAML structure: dictionaries become
+    `FrozenDict` and lists become tuples.
+    """
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """
+    Inverse of `freeze()`, returns a mutable copy of `value`.
+    """
+    if isinstance(value, dict):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(v) for v in value]
+    return value
+
+
+class ConfigConflictError(Exception):
+    message = "Nuimo app configuration was modified concurrently"
+
+
+class NuimoAppConfig:
+    """
+    Immutable snapshot of `nuimo_app.cfg` with an index of all components
+    by Nuimo MAC address and component id.
+
+    `generation` is incremented by the store for every new snapshot.
+    """
+
+    def __init__(self, config, generation=0):
+        self.config = freeze(config or {})
+        self.generation = generation
+        self.nuimos = self.config.get('nuimos') or FrozenDict()
+
+        self._components = {}
+        for mac_address, nuimo in self.nuimos.items():
+            for component in (nuimo or {}).get('components') or ():
+                self._components[(mac_address, component['id'])] = component
+
+    def nuimo(self, mac_address):
+        """
+        Return configuration of the Nuimo, raises `KeyError` if there is none.
+        """
+        return self.nuimos[mac_address]
+
+    def component(self, mac_address, component_id):
+        """
+        Return a component of a Nuimo, raises `KeyError` if there is none.
+        """
+        return self._components[(mac_address, component_id)]
+
+
+class NuimoAppConfigStore:
+    # how long to wait for more changes before writing a batch of them
+    COMMIT_DELAY = 0.05  # seconds
+
+    # how often to re-apply changes if the file was modified by another process
+    MAX_COMMIT_ATTEMPTS = 3
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.reload_count = 0
+        self.write_count = 0
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._file_key = None
+        self._generation = 0
+        self._commit_lock = threading.Lock()
+        self._pending_changes = []
+        self._file_lock = InterProcessLock(file_path + '.lock')
+
+    def snapshot(self):
+        """
+        Return the current `NuimoAppConfig`, raises `FileNotFoundError` if the
+        configuration file doesn't exist.
+        """
+        return self._current()[0]
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+            self._file_key = None
+
+    def update(self, change, generation=None):
+        """
+        Call `change(config)` with a mutable copy of the current configuration
+        and atomically write the modified configuration back to the file.
+        Returns the return value of `change`.
+
+        Changes requested concurrently are applied one after another to the
+        same copy and written at once. If the file was modified by another
+        process in the meantime all changes are re-applied to the new
+        content, hence `change` may be called more than once. An exception
+        raised by `change` discards only that change and is re-raised.
+
+        If `generation` is given, the change is only applied if the
+        configuration is still the one of the snapshot with that generation,
+        otherwise `ConfigConflictError` is raised.
+        """
+        pending_change = _PendingChange(change, generation)
+        with self._lock:
+            self._pending_changes.append(pending_change)
+
+        with self._commit_lock:
+            if not pending_change.done:
+                sleep(self.COMMIT_DELAY)
+                with self._lock:
+                    changes, self._pending_changes = self._pending_changes, []
+                self._commit(changes)
+
+        return pending_change.result()
+
+    def _current(self):
+        file_key = self._get_file_key()
+
+        with self._lock:
+            if self._snapshot is None or file_key != self._file_key:
+                self._generation += 1
+                self._snapshot = self._load(self._generation)
+                self._file_key = file_key
+
+            return self._snapshot, self._file_key
+
+    def _commit(self, changes):
+        try:
+            for _ in range(self.MAX_COMMIT_ATTEMPTS):
+                try:
+                    snapshot, file_key = self._current()
+                    original, generation = snapshot.config, snapshot.generation
+                except FileNotFoundError:
+                    original, generation, file_key = {}, None, None
+
+                original = thaw(original)
+                config = original
+                for change in changes:
+                    config = change.apply(config, generation)
+
+                if config == original:
+                    return
+
+                with self._file_lock:
+                    if self._get_file_key(missing_ok=True) != file_key:
+                        logger.info("%s was modified by another process, re-applying changes", self.file_path)
+                        continue
+                    new_file_key = self._write(config)
+
+                with self._lock:
+                    self._generation += 1
+                    self._snapshot = NuimoAppConfig(config, self._generation)
+                    self._file_key = new_file_key
+                return
+
+            raise ConfigConflictError()
+        except Exception as e:
+            for change in changes:
+                change.error = e
+        finally:
+            for change in changes:
+                change.done = True
+
+    def _write(self, config):
+        directory = path.dirname(self.file_path)
+        fd, temp_path = mkstemp(prefix='.nuimo_app.', dir=directory)
+        try:
+            with open(fd, 'w') as f:
+                yaml.dump(config, f, default_flow_style=False)
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                os.chmod(temp_path, stat(self.file_path).st_mode)
+            except FileNotFoundError:
+                os.chmod(temp_path, 0o644)
+            os.rename(temp_path, self.file_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+        self.write_count += 1
+        logger.debug("Wrote %s", self.file_path)
+        return self._get_file_key()
+
+    def _get_file_key(self, missing_ok=False):
+        try:
+            s = stat(self.file_path)
+        except FileNotFoundError:
+            if missing_ok:
+                return None
+            raise
+        return (s.st_dev, s.st_ino, s.st_size, s.st_mtime_ns)
+
+    def _load(self, generation):
+        logger.debug("Loading %s", self.file_path)
+        with open(self.file_path, 'r') as f:
+            config = yaml.load(f)
+        self.reload_count += 1
+        return NuimoAppConfig(config, generation)
+
+
+class _PendingChange:
+    def __init__(self, change, generation):
+        self.change = change
+        self.generation = generation
+        self.done = False
+        self.error = None
+        self.value = None
+
+    def apply(self, config, generation):
+        """
+        Apply the change to a copy of `config` and return the copy, or
+        return `config` untouched if the change failed.
+        """
+        if self.generation is not None and self.generation != generation:
+            self.error = ConfigConflictError()
+            return config
+
+        candidate = thaw(config)
+        try:
+            self.value = self.change(candidate)
+        except Exception as e:
+            self.error = e
+            return config
+
+        self.error = None
+        return candidate
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+_watcher = None
+
+
+def get_config_store(file_path):
+    """
+    Return the process-wide `NuimoAppConfigStore` of the given file.
+    """
+    file_path = path.abspath(file_path)
+
+    with _stores_lock:
+        store = _stores.get(file_path)
+        if store is None:
+            store = _stores[file_path] = NuimoAppConfigStore(file_path)
+            _watch(file_path)
+
+    return store
+
+
+def load_config(file_path):
+    """
+    Shortcut returning the current snapshot of the given configuration file.
+    """
+    return get_config_store(file_path).snapshot()
+
+
+def update_config(file_path, change):
+    """
+    Shortcut for `NuimoAppConfigStore.update()` of the given configuration file.
+    """
+    return get_config_store(file_path).update(change)
+
+
+def _watch(file_path):  # pragma: no cover, pyinotify is only installed on Linux
+    global _watcher
+
+    if pyinotify is None:
+        return
+
+    if _watcher is None:
+        _watcher = _ConfigWatcher()
+
+    _watcher.add(path.dirname(file_path))
+
+
+class _ConfigWatcher:  # pragma: no cover, pyinotify is only installed on Linux
+    """
+    Invalidates stores on inotify events. The parent directory is watched
+    instead of the file itself so that the watch survives the file being
+    replaced by a rename.
+    """
+
+    def __init__(self):
+        self.directories = set()
+        self.watch_manager = pyinotify.WatchManager()
+        self.notifier = pyinotify.ThreadedNotifier(self.watch_manager, self.process_event)
+        self.notifier.daemon = True
+        self.notifier.start()
+
+    def add(self, directory):
+        if directory in self.directories:
+            return
+
+        mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO | pyinotify.IN_DELETE
+        self.watch_manager.add_watch(directory, mask)
+        self.directories.add(directory)
+
+    def process_event(self, event):
+        store = _stores.get(getattr(event, 'pathname', None))
+        if store is not None:
+            logger.debug("%s changed, invalidating cached configuration", event.pathname)
+            store.invalidate()
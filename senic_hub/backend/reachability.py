@@ -0,0 +1,191 @@
+"""
+Process-wide monitor of whether devices in the local network are reachable.
+
+Devices are probed by connecting to a TCP port of their API (1400 for Sonos
+speakers, 80 for Philips Hue bridges) instead of pinging them, so that no
+process needs to be forked. Devices listed in the devices file and devices
+that were asked for are probed concurrently in the background, hence views
+read their reachability from the cache without waiting for the network.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from json import JSONDecodeError
+from time import time
+
+from .lockfile import open_locked
+from ..nuimo_app.status import publish_change
+
+
+logger = logging.getLogger(__name__)
+
+
+PORTS = {
+    'philips_hue': 80,
+    'sonos': 1400,
+}
+
+
+class ReachabilityMonitor:
+
+    # how long a probe result is used before probing the device again
+    TTL = 30  # seconds
+
+    # how often devices are probed in the background, must be less than `TTL`
+    PROBE_INTERVAL = 10  # seconds
+
+    CONNECT_TIMEOUT = 1  # seconds
+
+    MAX_CONCURRENT_PROBES = 8
+
+    # devices nobody asked for within this time are no longer probed
+    FORGET_AFTER = 10 * 60  # seconds
+
+    def __init__(self):
+        # (ip address, port) -> (reachable, time of the probe)
+        self.results = {}
+        # (ip address, port) -> time it was asked for
+        self.requested = {}
+        # (ip address, port) of the devices in the devices file
+        self.known = set()
+        self.devices_path = None
+        self._devices_file_key = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT_PROBES)
+        self.thread = None
+
+    def is_reachable(self, ip_address, device_type='sonos'):
+        """
+        Return whether the device accepts connections. Only blocks if the
+        device wasn't probed within `TTL`, e.g. when it's asked for the
+        first time.
+        """
+        target = (ip_address, PORTS[device_type])
+        with self.lock:
+            result = self.results.get(target)
+            self.requested[target] = time()
+            self._start()
+
+        if result is not None and time() - result[1] < self.TTL:
+            return result[0]
+
+        return self.update(target)
+
+    def watch_devices_file(self, devices_path):
+        """
+        Probe the devices of the given devices file in the background right
+        away, so that the first request for one of them doesn't block. The
+        file is read again whenever it changed.
+        """
+        with self.lock:
+            self.devices_path = devices_path
+            self._start()
+
+    def _start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='reachability', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        if self.read_devices_file():
+            self.probe_all()
+
+        while not self.stop_event.wait(self.PROBE_INTERVAL):
+            self.read_devices_file()
+            self.probe_all()
+
+    def read_devices_file(self):
+        """
+        Replace the devices to probe with the ones of the devices file if it
+        changed. Returns whether they were replaced.
+        """
+        if self.devices_path is None:
+            return False
+
+        try:
+            s = os.stat(self.devices_path)
+            file_key = (s.st_ino, s.st_size, s.st_mtime_ns)
+            if file_key == self._devices_file_key:
+                return False
+            with open_locked(self.devices_path, 'r') as f:
+                devices = json.load(f)
+        except (FileNotFoundError, JSONDecodeError):
+            file_key, devices = None, []
+
+        known = {(d['ip'], PORTS[d['type']]) for d in devices if d.get('type') in PORTS and d.get('ip')}
+        with self.lock:
+            self._devices_file_key = file_key
+            for target in self.known - known:
+                if target not in self.requested:
+                    self.results.pop(target, None)
+            self.known = known
+
+        logger.debug("Probing %d devices of %s", len(known), self.devices_path)
+        return True
+
+    def stop(self):
+        self.stop_event.set()
+
+    def probe_all(self):
+        """
+        Probe all devices of the devices file and all devices that were
+        asked for recently at the same time.
+        """
+        with self.lock:
+            for target, requested in list(self.requested.items()):
+                if time() - requested > self.FORGET_AFTER:
+                    del self.requested[target]
+                    if target not in self.known:
+                        self.results.pop(target, None)
+            targets = list(self.known | self.requested.keys())
+
+        list(self.executor.map(self.update, targets))
+
+    def update(self, target):
+        reachable = probe(*target, timeout=self.CONNECT_TIMEOUT)
+
+        with self.lock:
+            previous = self.results.get(target)
+            self.results[target] = (reachable, time())
+
+        if previous is not None and previous[0] != reachable:
+            logger.info("%s:%d became %s", target[0], target[1], "reachable" if reachable else "unreachable")
+            # let clients waiting for updates know, see `views.nuimos.get_update_service`
+            try:
+                publish_change()
+            except OSError as e:
+                logger.error("Failed to publish reachability change: %s", e)
+
+        return reachable
+
+
+def probe(ip_address, port, timeout):
+    """
+    Return whether a TCP connection to the given port can be established.
+    """
+    try:
+        socket.create_connection((ip_address, port), timeout=timeout).close()
+    except OSError:
+        return False
+    return True
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_reachability_monitor():
+    """
+    Return the process-wide `ReachabilityMonitor`.
+    """
+    global _monitor
+
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = ReachabilityMonitor()
+        return _monitor
@@ -0,0 +1,96 @@
+"""
+Passive SSDP discovery: instead of searching for devices, listen for the
+NOTIFY messages devices multicast when they join the network, periodically
+while they are alive and when they leave it.
+"""
+import logging
+import select
+import socket
+import struct
+
+from collections import namedtuple
+from urllib.parse import urlparse
+
+
+logger = logging.getLogger(__name__)
+
+
+SSDP_GROUP = '239.255.255.250'
+SSDP_PORT = 1900
+
+ALIVE = 'ssdp:alive'
+BYEBYE = 'ssdp:byebye'
+
+# notification types announcing the devices we support, every device
+# announces several types but we only need to handle one of them
+SONOS_NOTIFICATION_TYPE = 'urn:schemas-upnp-org:device:ZonePlayer:1'
+ROOT_DEVICE_NOTIFICATION_TYPE = 'upnp:rootdevice'
+
+
+# `device_type` and `device_info` are the same as reported by
+# `NetworkDiscovery`, they are None for byebye announcements which only
+# identify the device by its `usn`
+Announcement = namedtuple('Announcement', ['alive', 'usn', 'device_type', 'device_info'])
+
+
+def parse_announcement(data):
+    """
+    Return the `Announcement` of a NOTIFY message of a supported device or
+    None.
+    """
+    lines = data.decode('utf-8', 'replace').split('\r\n')
+    if not lines[0].startswith('NOTIFY '):
+        return None
+
+    headers = {}
+    for line in lines[1:]:
+        name, separator, value = line.partition(':')
+        if separator:
+            headers[name.strip().lower()] = value.strip()
+
+    usn = headers.get('usn', '').split('::')[0]
+    notification_type = headers.get('nt')
+    if headers.get('nts') == BYEBYE:
+        return Announcement(False, usn, None, None) if notification_type == ROOT_DEVICE_NOTIFICATION_TYPE else None
+    if headers.get('nts') != ALIVE or 'location' not in headers:
+        return None
+
+    host = urlparse(headers['location']).hostname
+    if notification_type == SONOS_NOTIFICATION_TYPE:
+        return Announcement(True, usn, 'sonos', host)
+    if notification_type == ROOT_DEVICE_NOTIFICATION_TYPE and ('hue-bridgeid' in headers or 'IpBridge' in headers.get('server', '')):
+        return Announcement(True, usn, 'philips_hue', ('', 'http://{}:80/'.format(host)))
+
+    return None
+
+
+class SSDPListener:
+    """
+    Receives the SSDP announcements multicast in the local network.
+    """
+
+    def __init__(self, address=('', SSDP_PORT), group=SSDP_GROUP):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(address)
+        if group is not None:  # pragma: no cover, multicast isn't available in tests
+            membership = struct.pack('4sl', socket.inet_aton(group), socket.INADDR_ANY)
+            self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+
+    def receive(self, timeout):
+        """
+        Return the next announcement of a supported device or None if none
+        was received within `timeout` seconds.
+        """
+        readable, _, _ = select.select([self.socket], [], [], timeout)
+        if not readable:
+            return None
+
+        data, sender = self.socket.recvfrom(4096)
+        announcement = parse_announcement(data)
+        if announcement is not None:
+            logger.debug("Received announcement from %s: %s", sender[0], announcement)
+        return announcement
+
+    def close(self):
+        self.socket.close()
@@ -38,3 +38,7 @@ def stop_program(name):
 
 def start_program(name):
     get_supervisor_rpc_client().startProcess(name)
+
+
+def signal_program(name, signal):
+    get_supervisor_rpc_client().signalProcess(name, signal)
@@ -1,19 +1,33 @@
+import json
+import os
+
 from datetime import datetime, timedelta
 from unittest.mock import MagicMock, patch
 
-from pytest import fixture, raises
+from pytest import fixture, raises, yield_fixture
 
 import responses
 
+from requests.exceptions import ConnectionError
+
 from senic_hub.backend.device_discovery import (
+    AUTHENTICATION_TTL_SECONDS,
+    DescriptionCache,
+    PassiveDiscovery,
     add_authentication_status,
+    diff_devices,
     discover_devices,
     discover_and_merge_devices,
     get_device_description,
+    get_http_session,
+    merge_into_devices_file,
+    read_volatile_fields,
     merge_devices,
     PhilipsHueBridgeApiClient,
+    SweepRequest,
     UpstreamError,
 )
+from senic_hub.backend.ssdp_listener import Announcement
 from senic_hub.backend.testing import temp_asset_path
 
 
@@ -41,6 +55,101 @@ def test_devices_are_discovered_and_merged_with_empty_devices_file(
     # discover_devices_mock.assert_called_once()
 
 
+@patch('senic_hub.backend.device_discovery.publish_change')
+@patch('senic_hub.backend.device_discovery.discover_devices')
+@patch('senic_hub.backend.device_discovery.add_authentication_status')
+def test_discovering_new_devices_publishes_change(
+        add_authentication_status_mock, discover_devices_mock, publish_change_mock):
+    discover_devices_mock.return_value = [{"id": "1", "name": "first"}]
+    with temp_asset_path('empty') as devices_path:
+        discover_and_merge_devices(devices_path, datetime.utcnow())
+    publish_change_mock.assert_called_once_with()
+
+
+@patch('senic_hub.backend.device_discovery.publish_change')
+@patch('senic_hub.backend.device_discovery.discover_devices')
+@patch('senic_hub.backend.device_discovery.add_authentication_status')
+def test_failing_to_publish_change_is_ignored(
+        add_authentication_status_mock, discover_devices_mock, publish_change_mock):
+    discover_devices_mock.return_value = [{"id": "1", "name": "first"}]
+    publish_change_mock.side_effect = PermissionError()
+    with temp_asset_path('empty') as devices_path:
+        discover_and_merge_devices(devices_path, datetime.utcnow())
+    publish_change_mock.assert_called_once_with()
+
+
+def test_diff_devices_ignores_discovery_time():
+    now = datetime.utcnow()
+    known_devices = [{"id": "1", "name": "first", 'discovered': str(now - timedelta(minutes=2))}]
+    assert diff_devices(known_devices, [{"id": "1", "name": "first", 'discovered': str(now)}]) == {}
+    assert diff_devices(known_devices, [{"id": "1", "authenticated": False, 'discovered': str(now)}]) == {
+        'changed': {"1": {"name": None, "authenticated": False}},
+    }
+    assert diff_devices(known_devices, [{"id": "2"}]) == {'added': [{"id": "2"}], 'removed': ["1"]}
+
+
+@yield_fixture
+def devices_path():
+    with temp_asset_path('empty') as devices_path:
+        yield devices_path
+        for suffix in ('.volatile', '.journal', '.journal.1'):
+            if os.path.exists(devices_path + suffix):
+                os.remove(devices_path + suffix)
+
+
+def read_journal(devices_path):
+    with open(devices_path + '.journal') as f:
+        return [json.loads(line) for line in f]
+
+
+@patch('senic_hub.backend.device_discovery.publish_change')
+@patch('senic_hub.backend.device_discovery.add_authentication_status')
+def test_devices_file_is_only_written_when_devices_change(add_authentication_status_mock, publish_change_mock, devices_path):
+    now = datetime.utcnow()
+    merge_into_devices_file(devices_path, [{"id": "1", "name": "first"}], now)
+    mtime = os.stat(devices_path).st_mtime_ns
+    with open(devices_path) as f:
+        assert json.load(f) == [{"id": "1", "name": "first"}]
+
+    later = now + timedelta(minutes=1)
+    os.utime(devices_path, ns=(0, 0))
+    merge_into_devices_file(devices_path, [{"id": "1", "name": "first"}], later)
+    assert os.stat(devices_path).st_mtime_ns == 0
+    assert read_volatile_fields(devices_path) == {"1": {"discovered": str(later)}}
+    assert mtime != 0
+
+    merge_into_devices_file(devices_path, [{"id": "1", "name": "renamed"}], later)
+    assert read_journal(devices_path) == [
+        {'added': [{"id": "1", "name": "first"}], 'time': str(now)},
+        {'changed': {"1": {"name": "renamed"}}, 'time': str(later)},
+    ]
+    assert publish_change_mock.call_count == 2
+
+
+@patch('senic_hub.backend.device_discovery.add_authentication_status')
+def test_volatile_fields_are_moved_out_of_devices_file(add_authentication_status_mock, devices_path):
+    now = datetime.utcnow()
+    with open(devices_path, 'w') as f:
+        json.dump([{"id": "1", "name": "first", "discovered": str(now)}], f)
+
+    merge_into_devices_file(devices_path, [], now)
+    with open(devices_path) as f:
+        assert json.load(f) == [{"id": "1", "name": "first"}]
+    assert read_volatile_fields(devices_path) == {"1": {"discovered": str(now)}}
+    assert not os.path.exists(devices_path + '.journal')
+
+
+@patch('senic_hub.backend.device_discovery.JOURNAL_MAX_BYTES', 0)
+@patch('senic_hub.backend.device_discovery.publish_change')
+@patch('senic_hub.backend.device_discovery.add_authentication_status')
+def test_journal_is_rotated(add_authentication_status_mock, publish_change_mock, devices_path):
+    now = datetime.utcnow()
+    merge_into_devices_file(devices_path, [{"id": "1"}], now)
+    merge_into_devices_file(devices_path, [{"id": "2"}], now)
+    assert read_journal(devices_path) == [{'added': [{"id": "2"}], 'time': str(now)}]
+    assert os.path.exists(devices_path + '.journal.1')
+
+
 def test_add_authentication_status_sets_authenticated_if_authentication_not_required():
     device = dict(authenticationRequired=False)
     add_authentication_status([device])
@@ -53,20 +162,75 @@ def test_add_authentication_status_sets_authenticated_if_authentication_required
     assert(device['authenticated'])
 
 
+@yield_fixture
+def authenticated_bridges():
+    with patch.dict('senic_hub.backend.device_discovery._authenticated_bridges', clear=True) as bridges:
+        yield bridges
+
+
+@fixture
+def hue_bridge_device():
+    return dict(id='ph1', ip='0.0.0.0', type='philips_hue', authenticationRequired=True, extra=dict(username='23'))
+
+
 @patch.object(PhilipsHueBridgeApiClient, 'is_authenticated')
-def test_add_authentication_status_sets_authenticated_if_philips_hue_api_says_yes(is_authenticated_mock):
+def test_add_authentication_status_sets_authenticated_if_philips_hue_api_says_yes(
+        is_authenticated_mock, authenticated_bridges, hue_bridge_device):
     is_authenticated_mock.return_value = True
-    device = dict(ip='0.0.0.0', type='philips_hue', authenticationRequired=True, extra=dict())
-    add_authentication_status([device])
-    assert(device['authenticated'])
+    add_authentication_status([hue_bridge_device])
+    assert(hue_bridge_device['authenticated'])
+
+
+@patch.object(PhilipsHueBridgeApiClient, 'is_authenticated')
+def test_add_authentication_status_sets_authenticated_if_philips_hue_api_says_no(
+        is_authenticated_mock, authenticated_bridges, hue_bridge_device):
+    is_authenticated_mock.return_value = False
+    add_authentication_status([hue_bridge_device])
+    assert(not hue_bridge_device['authenticated'])
+
+
+@patch.object(PhilipsHueBridgeApiClient, 'is_authenticated')
+def test_add_authentication_status_skips_recently_authenticated_bridges(
+        is_authenticated_mock, authenticated_bridges, hue_bridge_device):
+    is_authenticated_mock.return_value = True
+    add_authentication_status([hue_bridge_device])
+    add_authentication_status([dict(hue_bridge_device)])
+    assert is_authenticated_mock.call_count == 1
+
+    add_authentication_status([dict(hue_bridge_device, ip='0.0.0.1')])
+    assert is_authenticated_mock.call_count == 2
 
 
 @patch.object(PhilipsHueBridgeApiClient, 'is_authenticated')
-def test_add_authentication_status_sets_authenticated_if_philips_hue_api_says_no(is_authenticated_mock):
+def test_add_authentication_status_checks_bridges_again_after_ttl(
+        is_authenticated_mock, authenticated_bridges, hue_bridge_device):
+    is_authenticated_mock.return_value = True
+    add_authentication_status([hue_bridge_device])
+    for key in authenticated_bridges:
+        authenticated_bridges[key] -= AUTHENTICATION_TTL_SECONDS
     is_authenticated_mock.return_value = False
-    device = dict(ip='0.0.0.0', type='philips_hue', authenticationRequired=True, extra=dict())
+    add_authentication_status([hue_bridge_device])
+    assert is_authenticated_mock.call_count == 2
+    assert not hue_bridge_device['authenticated']
+    assert not authenticated_bridges
+
+
+@patch.object(PhilipsHueBridgeApiClient, 'is_authenticated')
+def test_add_authentication_status_keeps_status_of_unreachable_bridges(
+        is_authenticated_mock, authenticated_bridges, hue_bridge_device):
+    is_authenticated_mock.side_effect = ConnectionError()
+    add_authentication_status([dict(hue_bridge_device, authenticated=True), hue_bridge_device])
+    assert not hue_bridge_device['authenticated']
+
+    device = dict(hue_bridge_device, authenticated=True)
     add_authentication_status([device])
-    assert(not device['authenticated'])
+    assert device['authenticated']
+
+
+@responses.activate
+def test_philips_hue_bridge_authentication_is_checked_with_group_of_all_lights():
+    responses.add(responses.GET, 'http://127.0.0.1/api/23/groups/0', json={'name': 'Group 0'}, status=200)
+    assert PhilipsHueBridgeApiClient('127.0.0.1', '23').is_authenticated()
 
 
 @fixture
@@ -125,6 +289,63 @@ def test_get_device_description_of_sonos_speaker_throws_when_getting_description
     assert e.value.error_type == 404
 
 
+@yield_fixture
+def description_cache():
+    with temp_asset_path('empty') as cache_path:
+        yield DescriptionCache(cache_path)
+
+
+@responses.activate
+def test_cached_description_isnt_fetched_again(description_cache, sonos_device_info, sonos_speaker_description):
+    responses.add(responses.GET, 'http://192.168.1.42:1400/xml/device_description.xml', body=sonos_speaker_description, status=200)
+    first = get_device_description("sonos", sonos_device_info, description_cache)
+    assert get_device_description("sonos", sonos_device_info, description_cache) == first
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_expired_description_is_revalidated(description_cache, philips_hue_bridge_device_info, philips_hue_bridge_description):
+    responses.add(responses.GET, 'http://127.0.0.1:80/description.xml', body=philips_hue_bridge_description, status=200,
+                  adding_headers={'ETag': '"1"', 'Last-Modified': 'Mon, 02 Oct 2017 10:00:00 GMT'})
+    first = get_device_description("philips_hue", philips_hue_bridge_device_info, description_cache)
+
+    description_cache.TTL = 0
+    responses.reset()
+    responses.add(responses.GET, 'http://127.0.0.1:80/description.xml', status=304)
+    assert get_device_description("philips_hue", philips_hue_bridge_device_info, description_cache) == first
+    assert responses.calls[0].request.headers['If-None-Match'] == '"1"'
+    assert responses.calls[0].request.headers['If-Modified-Since'] == 'Mon, 02 Oct 2017 10:00:00 GMT'
+
+
+@responses.activate
+def test_descriptions_are_persisted(description_cache, sonos_device_info, sonos_speaker_description):
+    responses.add(responses.GET, 'http://192.168.1.42:1400/xml/device_description.xml', body=sonos_speaker_description, status=200)
+    description = get_device_description("sonos", sonos_device_info, description_cache)
+    description_cache.save()
+
+    assert get_device_description("sonos", sonos_device_info, DescriptionCache(description_cache.file_path)) == description
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_descriptions_of_missing_devices_expire(description_cache, sonos_device_info, sonos_speaker_description):
+    responses.add(responses.GET, 'http://192.168.1.42:1400/xml/device_description.xml', body=sonos_speaker_description, status=200)
+    get_device_description("sonos", sonos_device_info, description_cache)
+    description_cache.expire()
+    assert len(description_cache.entries) == 1
+
+    for _ in range(DescriptionCache.MAX_MISSED_RUNS):
+        description_cache.expire()
+    assert len(description_cache.entries) == 1
+
+    description_cache.expire()
+    assert description_cache.entries == {}
+
+
+def test_failing_to_save_descriptions_is_ignored():
+    DescriptionCache('/no/such/dir/descriptions.json').save()
+
+
 class MockPhilipsDiscovery(MagicMock):
     def scan(self):
         pass
@@ -153,6 +374,33 @@ def test_discover_philips_hue_device(philips_hue_bridge_description):
     assert discover_devices(MockPhilipsDiscovery) == [expected]
 
 
+class MockTwoPhilipsDiscovery(MockPhilipsDiscovery):
+    def get_info(self, device_type):
+        return [("", "http://127.0.0.1:80/"), ("", "http://127.0.0.2:80/")]
+
+
+@responses.activate
+def test_discover_devices_skips_device_whose_description_fails(philips_hue_bridge_description):
+    responses.add(responses.GET, 'http://127.0.0.1:80/description.xml', status=500)
+    responses.add(responses.GET, 'http://127.0.0.2:80/description.xml', body=philips_hue_bridge_description, status=200)
+    devices = discover_devices(MockTwoPhilipsDiscovery)
+    assert [d['ip'] for d in devices] == ['127.0.0.2']
+
+
+@responses.activate
+def test_discover_devices_expires_and_saves_description_cache(philips_hue_bridge_description):
+    responses.add(responses.GET, 'http://127.0.0.1:80/description.xml', body=philips_hue_bridge_description, status=200)
+    description_cache = MagicMock()
+    description_cache.get.return_value = {"id": "ph1", "ip": "127.0.0.1"}
+    assert discover_devices(MockPhilipsDiscovery, description_cache) == [{"id": "ph1", "ip": "127.0.0.1"}]
+    description_cache.expire.assert_called_once_with()
+    description_cache.save.assert_called_once_with()
+
+
+def test_description_requests_share_one_session():
+    assert get_http_session() is get_http_session()
+
+
 def test_discover_devices_for_the_first_time_return_all_devices():
     known_devices = []
     discovered_devices = [{
@@ -273,3 +521,101 @@ def test_merging_devices_keeps_hue_username():
     }]
     expected = known_devices
     assert merge_devices(known_devices, discovered_devices, now) == expected
+
+
+def test_merging_devices_doesnt_modify_known_devices():
+    now = datetime.utcnow()
+    known_devices = [{"id": "1", "extra": {"username": "light-bringer"}}]
+    merged_devices = merge_devices(known_devices, [{"id": "1", "extra": {"lights": {}}}], now)
+    assert merged_devices[0]['extra'] == {"username": "light-bringer", "lights": {}}
+    assert known_devices == [{"id": "1", "extra": {"username": "light-bringer"}}]
+
+
+class CountingId(str):
+    """
+    Device ID counting how often it's compared for equality.
+    """
+    comparisons = 0
+
+    def __eq__(self, other):
+        CountingId.comparisons += 1
+        return str.__eq__(self, other)
+
+    __hash__ = str.__hash__
+
+
+def test_merging_10k_devices_takes_linear_time():
+    now = datetime.utcnow()
+    known_devices = [{"id": CountingId("%05d" % i), "extra": {"username": str(i)}} for i in range(0, 10000, 2)]
+    discovered_devices = [{"id": CountingId("%05d" % i), "extra": {}} for i in reversed(range(10000))]
+
+    CountingId.comparisons = 0
+    merged_devices = merge_devices(known_devices, discovered_devices, now)
+
+    assert [d["id"] for d in merged_devices] == ["%05d" % i for i in range(10000)]
+    assert merged_devices[2]["extra"] == {"username": "2"}
+    # IDs are looked up instead of searched, the quadratic implementation
+    # compared them about 25 million times
+    assert CountingId.comparisons < 3 * 10000
+
+
+def test_sweep_request_wait_returns_once_requested():
+    sweep_requested = SweepRequest()
+    with patch('senic_hub.backend.device_discovery.time.sleep', side_effect=lambda seconds: sweep_requested.set()) as sleep_mock:
+        assert sweep_requested.wait(60)
+    sleep_mock.assert_called_once_with(SweepRequest.POLL_INTERVAL)
+
+    sweep_requested.clear()
+    assert not sweep_requested.is_set()
+
+
+def test_sweep_request_wait_times_out():
+    sweep_requested = SweepRequest()
+    assert not sweep_requested.wait(0.01)
+
+
+@yield_fixture
+def passive_discovery():
+    with temp_asset_path('devices.json') as devices_path:
+        yield PassiveDiscovery(devices_path, MagicMock(), 60)
+
+
+@patch('senic_hub.backend.device_discovery.discover_and_merge_devices')
+def test_passive_discovery_searches_on_start_and_when_requested(discover_and_merge_devices_mock, passive_discovery):
+    passive_discovery.listener.receive.return_value = None
+    passive_discovery.run_once()
+    passive_discovery.run_once()
+    assert discover_and_merge_devices_mock.call_count == 1
+
+    passive_discovery.sweep_requested.set()
+    passive_discovery.run_once()
+    assert discover_and_merge_devices_mock.call_count == 2
+
+
+@patch('senic_hub.backend.device_discovery.discover_and_merge_devices')
+@patch('senic_hub.backend.device_discovery.add_authentication_status')
+@patch('senic_hub.backend.device_discovery.publish_change')
+@patch('senic_hub.backend.device_discovery.get_device_description')
+def test_passive_discovery_merges_announced_device(
+        get_device_description_mock, publish_change_mock, add_authentication_status_mock, discover_and_merge_devices_mock,
+        passive_discovery):
+    get_device_description_mock.return_value = {"id": "new", "type": "sonos", "ip": "192.168.1.42"}
+    passive_discovery.listener.receive.return_value = Announcement(True, 'uuid:RINCON_123', 'sonos', '192.168.1.42')
+    passive_discovery.run_once()
+    passive_discovery.run_once()
+
+    with open(passive_discovery.devices_path) as f:
+        devices = json.load(f)
+    assert "new" in [d['id'] for d in devices]
+    assert get_device_description_mock.call_count == 1
+    add_authentication_status_mock.assert_called_once_with([get_device_description_mock.return_value])
+    publish_change_mock.assert_called_once_with()
+
+
+@patch('senic_hub.backend.device_discovery.get_device_description')
+def test_passive_discovery_handles_device_again_after_it_left(get_device_description_mock, passive_discovery):
+    get_device_description_mock.side_effect = UpstreamError(error_type=500)
+    passive_discovery.handle_announcement(Announcement(True, 'uuid:RINCON_123', 'sonos', '192.168.1.42'), datetime.utcnow())
+    passive_discovery.handle_announcement(Announcement(False, 'uuid:RINCON_123', None, None), datetime.utcnow())
+    passive_discovery.handle_announcement(Announcement(True, 'uuid:RINCON_123', 'sonos', '192.168.1.42'), datetime.utcnow())
+    assert get_device_description_mock.call_count == 2
@@ -0,0 +1,201 @@
+from copy import copy, deepcopy
+from os import listdir, remove, stat
+from tempfile import NamedTemporaryFile
+from threading import Thread
+from unittest.mock import patch
+
+from pytest import raises, yield_fixture
+
+import yaml
+
+from senic_hub.backend.nuimo_app_config import ConfigConflictError, get_config_store, load_config, update_config
+
+
+@yield_fixture
+def config_path(settings):
+    with NamedTemporaryFile('w+', delete=False) as f:
+        with open(settings['nuimo_app_config_path']) as config_file:
+            f.write(config_file.read())
+    yield f.name
+    remove(f.name)
+
+
+def test_snapshot_is_cached_until_file_changes(config_path):
+    store = get_config_store(config_path)
+    snapshot = store.snapshot()
+    assert store.snapshot() is snapshot
+    assert store.reload_count == 1
+
+    with open(config_path, 'w') as f:
+        yaml.dump({'nuimos': {}}, f)
+
+    assert store.snapshot() is not snapshot
+    assert store.snapshot().nuimos == {}
+    assert store.reload_count == 2
+
+
+def test_invalidate_forces_reload(config_path):
+    store = get_config_store(config_path)
+    snapshot = store.snapshot()
+    store.invalidate()
+    assert store.snapshot() is not snapshot
+
+
+def test_store_is_shared_per_file(config_path):
+    assert get_config_store(config_path) is get_config_store(config_path)
+
+
+def test_components_are_indexed_by_nuimo_and_id(config_path):
+    config = load_config(config_path)
+    assert config.component('00:00:00:00:00:00', 's1')['type'] == 'sonos'
+    assert config.nuimo('00:00:00:00:00:01') == {'name': 'My Nuimo 2'}
+    with raises(KeyError):
+        config.component('00:00:00:00:00:01', 's1')
+    with raises(KeyError):
+        config.nuimo('de:ad:be:ef:00:00')
+
+
+def test_snapshot_is_read_only(config_path):
+    component = load_config(config_path).component('00:00:00:00:00:00', 'ph2')
+    with raises(TypeError):
+        component['name'] = 'foo'
+    with raises(TypeError):
+        component.update(name='foo')
+    with raises(AttributeError):
+        component['device_ids'].append('ph2-light-9')
+
+
+def test_copy_of_snapshot_is_mutable(config_path):
+    copy(load_config(config_path).component('00:00:00:00:00:00', 'ph2'))['name'] = 'foo'
+    component = deepcopy(load_config(config_path).component('00:00:00:00:00:00', 'ph2'))
+    component['name'] = 'foo'
+    component['device_ids'].append('ph2-light-9')
+    assert load_config(config_path).component('00:00:00:00:00:00', 'ph2')['name'] == 'Philips Hue Bridge 2'
+
+
+def test_missing_file_raises():
+    with raises(FileNotFoundError):
+        load_config('/no/such/file')
+
+
+def rename_nuimo(name):
+    def change(config):
+        config['nuimos']['00:00:00:00:00:01']['name'] = name
+        return name
+    return change
+
+
+def test_update_replaces_file_atomically(config_path):
+    store = get_config_store(config_path)
+    generation = store.snapshot().generation
+    inode = stat(config_path).st_ino
+
+    assert store.update(rename_nuimo('Renamed')) == 'Renamed'
+
+    assert stat(config_path).st_ino != inode
+    with open(config_path) as f:
+        assert yaml.load(f)['nuimos']['00:00:00:00:00:01']['name'] == 'Renamed'
+    assert store.snapshot().nuimo('00:00:00:00:00:01')['name'] == 'Renamed'
+    assert store.snapshot().generation == generation + 1
+    assert store.write_count == 1
+    assert store.reload_count == 1
+
+
+def test_update_without_modifications_doesnt_write(config_path):
+    store = get_config_store(config_path)
+    store.update(lambda config: None)
+    assert store.write_count == 0
+
+
+def test_concurrent_updates_are_written_at_once(config_path):
+    store = get_config_store(config_path)
+    store.COMMIT_DELAY = 0.5
+
+    def add_component(n):
+        def change(config):
+            config['nuimos']['00:00:00:00:00:01'].setdefault('components', []).append({'id': str(n)})
+        return change
+
+    threads = [Thread(target=store.update, args=(add_component(n),)) for n in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    components = store.snapshot().nuimo('00:00:00:00:00:01')['components']
+    assert sorted(c['id'] for c in components) == ['0', '1', '2', '3', '4']
+    assert store.write_count == 1
+
+
+def test_failing_change_is_discarded(config_path):
+    store = get_config_store(config_path)
+
+    def failing_change(config):
+        config['nuimos'].clear()
+        raise KeyError('foo')
+
+    with raises(KeyError):
+        store.update(failing_change)
+
+    assert len(store.snapshot().nuimos) == 2
+    assert store.write_count == 0
+
+
+def test_change_is_reapplied_if_file_was_modified_by_another_process(config_path):
+    store = get_config_store(config_path)
+    calls = []
+
+    def change(config):
+        if not calls:
+            with open(config_path, 'w') as f:
+                yaml.dump({'nuimos': {'00:00:00:00:00:01': {'name': 'External'}}}, f)
+        calls.append(dict(config['nuimos']))
+        config['nuimos']['00:00:00:00:00:01']['components'] = []
+
+    store.update(change)
+
+    assert len(calls) == 2
+    assert store.snapshot().nuimos == {'00:00:00:00:00:01': {'name': 'External', 'components': ()}}
+
+
+def test_update_fails_if_file_keeps_being_modified(config_path):
+    store = get_config_store(config_path)
+
+    def change(config):
+        with open(config_path, 'a') as f:
+            f.write('\n')
+        config['nuimos'] = {}
+
+    with raises(ConfigConflictError):
+        store.update(change)
+
+
+def test_update_of_outdated_generation_fails(config_path):
+    store = get_config_store(config_path)
+    generation = store.snapshot().generation
+    store.update(rename_nuimo('Renamed'))
+
+    with raises(ConfigConflictError):
+        store.update(rename_nuimo('Outdated'), generation=generation)
+
+    store.update(rename_nuimo('Current'), generation=store.snapshot().generation)
+    assert store.snapshot().nuimo('00:00:00:00:00:01')['name'] == 'Current'
+
+
+def test_update_creates_missing_file(tmpdir):
+    config_path = str(tmpdir.join('nuimo_app.cfg'))
+    update_config(config_path, lambda config: config.update(nuimos={}))
+
+    assert stat(config_path).st_mode & 0o777 == 0o644
+    assert load_config(config_path).nuimos == {}
+
+
+@patch('senic_hub.backend.nuimo_app_config.os.rename')
+def test_failed_write_leaves_no_temporary_file(rename_mock, tmpdir):
+    rename_mock.side_effect = OSError()
+    config_path = str(tmpdir.join('nuimo_app.cfg'))
+
+    with raises(OSError):
+        update_config(config_path, lambda config: config.update(nuimos={}))
+
+    assert [f for f in listdir(str(tmpdir)) if not f.endswith('.lock')] == []
@@ -1,10 +1,12 @@
 from os import remove
 from pytest import fixture, yield_fixture
 from tempfile import NamedTemporaryFile
+from unittest.mock import patch
 
 import yaml
 import responses
 
+from senic_hub.backend.nuimo_app_config import update_config
 from senic_hub.backend.views.nuimo_components import create_component
 
 
@@ -227,6 +229,18 @@ def test_put_component_devices_returns_modified_component(component_url, browser
     assert set(response['device_ids']) == set(['ph2-light-5', 'ph2-light-6'])
 
 
+def test_put_component_removed_meanwhile_returns_404(component_url, browser, settings):
+    def remove_component_first(file_path, change):
+        def remove_component(config):
+            config['nuimos']['00:00:00:00:00:00']['components'] = []
+
+        update_config(file_path, remove_component)
+        return update_config(file_path, change)
+
+    with patch('senic_hub.backend.views.nuimo_components.update_config', remove_component_first):
+        browser.put_json(component_url, {'device_ids': ['ph2-light-5']}, status=404)
+
+
 def test_put_component_devices_of_unknown_nuimo_returns_404(route_url, browser):
     browser.put_json(
         route_url('nuimo_component', mac_address='de:ad:be:ef:00:00'.replace(':', '-'), component_id='ph2'),
@@ -1,6 +1,14 @@
 import pytest
 # import yaml
 
+from os import path
+from tempfile import TemporaryDirectory
+from threading import Timer
+from unittest.mock import patch
+
+from senic_hub.backend.views.nuimos import DEFAULT_MAX_UPDATE_WAITERS, get_update_waiters, is_device_responsive
+from senic_hub.nuimo_app.status import STATE_CONNECTED, StatusSegment
+
 
 @pytest.fixture
 def url(route_url):
@@ -34,3 +42,97 @@ def no_such_nuimo(settings):
 
 def test_returns_no_nuimo(no_such_nuimo, browser, url):
     assert browser.get_json(url).json == {'nuimos': []}
+
+
+@pytest.fixture
+def url_update(route_url):
+    return route_url('check_for_update_service')
+
+
+@pytest.fixture
+def settings(settings):
+    settings['update_timeout_seconds'] = '0.2'
+    return settings
+
+
+@pytest.yield_fixture
+def status_segment():
+    with TemporaryDirectory() as directory:
+        segment = StatusSegment(path.join(directory, 'status'), writable=True)
+        with patch('senic_hub.backend.views.nuimos.get_status_segment', return_value=segment):
+            yield segment
+
+
+@pytest.yield_fixture
+def controller_manager():
+    with patch('senic_hub.backend.views.nuimos.ControllerManager') as controller_manager:
+        yield controller_manager
+
+
+def test_update_times_out_without_changes(status_segment, browser, url_update):
+    assert browser.get_json(url_update).json == {'is_updated': False, 'changes': status_segment.changes}
+
+
+def test_update_returns_nuimo_status_on_change(status_segment, controller_manager, browser, url_update):
+    slot = status_segment.slot('00:00:00:00:00:01')
+    Timer(0.05, slot.update, kwargs={'connection_state': STATE_CONNECTED, 'battery_level': 80}).start()
+    response = browser.get_json(url_update, params={'since': status_segment.changes}).json
+
+    assert response['changes'] == status_segment.changes
+    other, nuimo = response['nuimos']
+    assert nuimo['mac_address'] == '00:00:00:00:00:01'
+    assert nuimo['name'] == 'My Nuimo 2'
+    assert (nuimo['is_connected'], nuimo['battery_level']) == (True, 80)
+    assert (other['is_connected'], other['battery_level']) == (False, None)
+    assert [c['id'] for c in other['components']] == ['ph2', 's1']
+    # answered from the status segment alone
+    controller_manager.assert_not_called()
+
+
+def test_update_returns_changes_since_previous_response(status_segment, browser, url_update):
+    status_segment.publish_change()
+    response = browser.get_json(url_update, params={'since': 0}).json
+
+    assert response['changes'] == 1
+    assert [(n['is_connected'], n['battery_level']) for n in response['nuimos']] == [(False, None)] * 2
+
+
+@patch('senic_hub.backend.views.nuimos.load_config', side_effect=FileNotFoundError)
+def test_update_without_nuimo_app_config(load_config, status_segment, browser, url_update):
+    status_segment.publish_change()
+    assert browser.get_json(url_update, params={'since': 0}).json == {'nuimos': [], 'changes': 1}
+
+
+def test_update_rejects_invalid_since(status_segment, browser, url_update):
+    browser.get_json(url_update, params={'since': 'foo'}, status=400)
+
+
+def test_update_is_refused_while_too_many_clients_wait(status_segment, browser, url_update):
+    waiters = get_update_waiters({})
+    for _ in range(DEFAULT_MAX_UPDATE_WAITERS):
+        waiters.acquire()
+    try:
+        response = browser.get_json(url_update, status=503)
+    finally:
+        for _ in range(DEFAULT_MAX_UPDATE_WAITERS):
+            waiters.release()
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_maximum_number_of_update_waiters_is_configurable():
+    waiters = get_update_waiters({'max_update_waiters': '1'})
+    assert waiters is not get_update_waiters({})
+    assert waiters.acquire(blocking=False)
+    assert not waiters.acquire(blocking=False)
+    waiters.release()
+
+
+def test_update_without_nuimo_app(browser, url_update):
+    with patch('senic_hub.backend.views.nuimos.get_status_segment', side_effect=FileNotFoundError()):
+        assert browser.get_json(url_update).json == {'is_updated': False}
+
+
+def test_sonos_reachability_is_read_from_monitor():
+    with patch('senic_hub.backend.views.nuimos.get_reachability_monitor') as get_reachability_monitor:
+        assert is_device_responsive('127.0.0.1') is get_reachability_monitor.return_value.is_reachable.return_value
+    get_reachability_monitor.return_value.is_reachable.assert_called_once_with('127.0.0.1', 'sonos')
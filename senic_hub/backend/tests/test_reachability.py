@@ -0,0 +1,168 @@
+import json
+import socket
+
+from unittest.mock import patch
+
+from pytest import fixture, yield_fixture
+
+from senic_hub.backend.reachability import ReachabilityMonitor, get_reachability_monitor, probe
+
+
+@yield_fixture
+def listening_port():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    yield server.getsockname()[1]
+    server.close()
+
+
+@fixture
+def closed_port():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    port = server.getsockname()[1]
+    server.close()
+    return port
+
+
+@yield_fixture
+def monitor():
+    monitor = ReachabilityMonitor()
+    yield monitor
+    monitor.stop()
+
+
+@yield_fixture
+def probe_mock():
+    with patch('senic_hub.backend.reachability.probe', return_value=True) as probe_mock:
+        yield probe_mock
+
+
+@yield_fixture
+def publish_change_mock():
+    with patch('senic_hub.backend.reachability.publish_change') as publish_change_mock:
+        yield publish_change_mock
+
+
+def test_probe_connects_to_port(listening_port, closed_port):
+    assert probe('127.0.0.1', listening_port, timeout=1)
+    assert not probe('127.0.0.1', closed_port, timeout=1)
+
+
+def test_device_is_probed_on_its_port(monitor, probe_mock):
+    assert monitor.is_reachable('127.0.0.1', 'philips_hue')
+    probe_mock.assert_called_once_with('127.0.0.1', 80, timeout=ReachabilityMonitor.CONNECT_TIMEOUT)
+
+
+def test_result_is_cached(monitor, probe_mock):
+    assert monitor.is_reachable('127.0.0.1')
+    probe_mock.return_value = False
+    assert monitor.is_reachable('127.0.0.1')
+    assert probe_mock.call_count == 1
+
+
+def test_expired_result_is_probed_again(monitor, probe_mock):
+    monitor.TTL = 0
+    assert monitor.is_reachable('127.0.0.1')
+    probe_mock.return_value = False
+    with patch('senic_hub.backend.reachability.publish_change'):
+        assert not monitor.is_reachable('127.0.0.1')
+
+
+def test_background_probe_publishes_changes(monitor, probe_mock, publish_change_mock):
+    monitor.is_reachable('127.0.0.1')
+    monitor.is_reachable('127.0.0.2')
+    probe_mock.reset_mock()
+
+    probe_mock.side_effect = lambda ip_address, port, timeout: ip_address == '127.0.0.1'
+    monitor.probe_all()
+
+    assert probe_mock.call_count == 2
+    assert not monitor.is_reachable('127.0.0.2')
+    publish_change_mock.assert_called_once_with()
+
+
+def test_failing_to_publish_change_is_ignored(monitor, probe_mock, publish_change_mock):
+    monitor.is_reachable('127.0.0.1')
+    probe_mock.return_value = False
+    publish_change_mock.side_effect = PermissionError()
+    monitor.probe_all()
+    assert not monitor.is_reachable('127.0.0.1')
+
+
+def test_devices_nobody_asked_for_are_forgotten(monitor, probe_mock):
+    monitor.is_reachable('127.0.0.1')
+    monitor.FORGET_AFTER = -1
+    monitor.probe_all()
+    assert monitor.results == {}
+
+
+def test_devices_are_probed_in_background(monitor, probe_mock):
+    monitor.PROBE_INTERVAL = 0.01
+    monitor.is_reachable('127.0.0.1')
+    monitor.stop_event.wait(0.1)
+    monitor.stop()
+    monitor.thread.join(1)
+    assert probe_mock.call_count > 1
+
+
+@fixture
+def devices_path(tmpdir):
+    devices_path = str(tmpdir.join('devices.json'))
+    write_devices(devices_path, [
+        {'id': 'ph1', 'type': 'philips_hue', 'ip': '127.0.0.1'},
+        {'id': 'sonos1', 'type': 'sonos', 'ip': '127.0.0.2'},
+        {'id': 'other', 'type': 'other', 'ip': '127.0.0.3'},
+    ])
+    return devices_path
+
+
+def write_devices(devices_path, devices):
+    with open(devices_path, 'w') as f:
+        json.dump(devices, f)
+
+
+def test_devices_of_devices_file_are_probed_right_away(monitor, probe_mock, devices_path):
+    monitor.watch_devices_file(devices_path)
+    monitor.thread.join(0.5)
+
+    assert monitor.known == {('127.0.0.1', 80), ('127.0.0.2', 1400)}
+    assert probe_mock.call_count == 2
+    assert monitor.is_reachable('127.0.0.2')
+    assert probe_mock.call_count == 2
+
+
+def test_devices_file_is_read_again_when_it_changed(monitor, probe_mock, devices_path):
+    monitor.devices_path = devices_path
+    assert monitor.read_devices_file()
+    assert not monitor.read_devices_file()
+    monitor.probe_all()
+    monitor.is_reachable('127.0.0.2')
+
+    write_devices(devices_path, [{'id': 'sonos2', 'type': 'sonos', 'ip': '127.0.0.4'}])
+    assert monitor.read_devices_file()
+    assert monitor.known == {('127.0.0.4', 1400)}
+    # still asked for
+    assert list(monitor.results) == [('127.0.0.2', 1400)]
+
+
+def test_devices_of_devices_file_arent_forgotten(monitor, probe_mock, devices_path):
+    monitor.devices_path = devices_path
+    monitor.read_devices_file()
+    monitor.is_reachable('127.0.0.1', 'philips_hue')
+    monitor.FORGET_AFTER = -1
+    monitor.probe_all()
+
+    assert monitor.requested == {}
+    assert set(monitor.results) == {('127.0.0.1', 80), ('127.0.0.2', 1400)}
+
+
+def test_missing_devices_file_has_no_devices(monitor, probe_mock, tmpdir):
+    monitor.devices_path = str(tmpdir.join('devices.json'))
+    assert monitor.read_devices_file()
+    assert monitor.known == set()
+
+
+def test_monitor_is_shared():
+    assert get_reachability_monitor() is get_reachability_monitor()
@@ -1,6 +1,7 @@
 import json
 import os
 import os.path
+import xmlrpc.client
 
 from tempfile import mktemp
 from unittest.mock import patch
@@ -40,6 +41,17 @@ def test_device_list_is_empty_if_devices_file_doesnt_exist(no_device_file, brows
     assert browser.get_json(url).json == []
 
 
+def test_device_list_contains_volatile_fields(tmp_device_file, browser, url):
+    devices_path = tmp_device_file['devices_path']
+    with open(devices_path, 'w') as f:
+        json.dump([{"id": "s1", "type": "sonos"}], f)
+    with open(devices_path + '.volatile', 'w') as f:
+        json.dump({"s1": {"discovered": "2017-10-02 10:00:00"}}, f)
+
+    assert browser.get_json(url).json == [{"id": "s1", "type": "sonos", "discovered": "2017-10-02 10:00:00"}]
+    os.remove(devices_path + '.volatile')
+
+
 def test_device_list_contains_devices(browser, url):
     assert browser.get_json(url).json == [
         {
@@ -89,6 +101,14 @@ def test_device_list_contains_devices(browser, url):
 
 def test_devices_discover_view(tmp_device_file, browser, discover_url):
     with patch('senic_hub.backend.views.setup_devices.supervisor') as supervisor_mock:
+        browser.post_json(discover_url, {})
+        supervisor_mock.signal_program.assert_called_once_with('device_discovery', 'USR1')
+        supervisor_mock.restart_program.assert_not_called()
+
+
+def test_devices_discover_view_restarts_daemon_that_cant_be_signaled(tmp_device_file, browser, discover_url):
+    with patch('senic_hub.backend.views.setup_devices.supervisor') as supervisor_mock:
+        supervisor_mock.signal_program.side_effect = xmlrpc.client.Fault(60, 'NOT_RUNNING')
         browser.post_json(discover_url, {})
         supervisor_mock.restart_program.assert_called_once_with('device_discovery')
 
@@ -160,7 +180,7 @@ def test_devices_authenticate_view_returns_already_authenticated(
         phue_config_file, browser, auth_url, philips_hue_bridge_description):
     # Mock all the HTTP API calls with dummy responses.
     responses.add(
-        responses.GET, 'http://127.0.0.1/api/23', json={"a": 1}, status=200
+        responses.GET, 'http://127.0.0.1/api/23/groups/0', json={"a": 1}, status=200
     )
     responses.add(
         responses.GET, 'http://127.0.0.1/api/23/lights',
@@ -219,8 +239,8 @@ def test_devices_authenticate_returns_authenticated_when_device_doesnt_need_auth
 @responses.activate
 def test_devices_authenticate_try_authenticate_when_username_has_expired(
         phue_config_file, browser, auth_url, philips_hue_bridge_description):
-    get_state_payload = [{"error": {"type": PhilipsHueBridgeError.unauthorized}}]
-    responses.add(responses.GET, 'http://127.0.0.1/api/23', json=get_state_payload, status=200)
+    get_group_payload = [{"error": {"type": PhilipsHueBridgeError.unauthorized}}]
+    responses.add(responses.GET, 'http://127.0.0.1/api/23/groups/0', json=get_group_payload, status=200)
     auth_payload = [{"error": {"type": PhilipsHueBridgeError.button_not_pressed}}]
     responses.add(responses.POST, 'http://127.0.0.1/api', json=auth_payload, status=200)
     responses.add(responses.GET, 'http://127.0.0.1/description.xml', body=philips_hue_bridge_description, status=200)
@@ -1,4 +1,5 @@
 from os import remove
+from unittest.mock import patch
 from pytest import fixture, yield_fixture
 from tempfile import NamedTemporaryFile
 
@@ -56,6 +57,28 @@ def test_get_nuimo_favorites_for_wrong_component_type_returns_404(route_url, bro
     browser.get(route_url('nuimo_sonos_favorites', mac_address='00:00:00:00:00:00'.replace(':', '-'), component_id='ph2'), status=404)
 
 
+def test_get_nuimo_favorites_of_component_removed_meanwhile_returns_404(
+        nuimo_sonos_favourl, browser, temporary_nuimo_app_config_file, settings):
+    config_path = settings['nuimo_app_config_path']
+    with open(config_path) as f:
+        config = yaml.load(f)
+    components = config['nuimos']['00:00:00:00:00:00']['components']
+    for station in ('station1', 'station2', 'station3'):
+        del components[1][station]
+    with open(config_path, 'w') as f:
+        yaml.dump(config, f)
+
+    def remove_component(max_items):
+        del components[1]
+        with open(config_path, 'w') as f:
+            yaml.dump(config, f)
+        return {'returned': 3, 'favorites': [{'title': str(i)} for i in range(3)]}
+
+    with patch('senic_hub.backend.views.sonos.SoCo') as soco_mock:
+        soco_mock.return_value.get_sonos_favorites.side_effect = remove_component
+        browser.get(nuimo_sonos_favourl, status=404)
+
+
 def test_put_nuimo_sonos_favorites(nuimo_sonos_favourl, browser, temporary_nuimo_app_config_file, settings):
     browser.put_json(nuimo_sonos_favourl, {
         "number": 1,
@@ -0,0 +1,77 @@
+import socket
+
+from pytest import yield_fixture
+
+from senic_hub.backend.ssdp_listener import Announcement, SSDPListener, parse_announcement
+
+
+SONOS_ALIVE = (
+    b'NOTIFY * HTTP/1.1\r\n'
+    b'HOST: 239.255.255.250:1900\r\n'
+    b'CACHE-CONTROL: max-age = 1800\r\n'
+    b'LOCATION: http://192.168.1.42:1400/xml/device_description.xml\r\n'
+    b'NT: urn:schemas-upnp-org:device:ZonePlayer:1\r\n'
+    b'NTS: ssdp:alive\r\n'
+    b'SERVER: Linux UPnP/1.0 Sonos/37.12-45270 (ZPS1)\r\n'
+    b'USN: uuid:RINCON_123::urn:schemas-upnp-org:device:ZonePlayer:1\r\n'
+    b'\r\n'
+)
+
+HUE_ALIVE = (
+    b'NOTIFY * HTTP/1.1\r\n'
+    b'HOST: 239.255.255.250:1900\r\n'
+    b'LOCATION: http://192.168.1.2:80/description.xml\r\n'
+    b'SERVER: Linux/3.14.0 UPnP/1.0 IpBridge/1.20.0\r\n'
+    b'NTS: ssdp:alive\r\n'
+    b'hue-bridgeid: 001788FFFE000000\r\n'
+    b'NT: upnp:rootdevice\r\n'
+    b'USN: uuid:2f402f80-da50-11e1-9b23-001788000000::upnp:rootdevice\r\n'
+    b'\r\n'
+)
+
+BYEBYE = (
+    b'NOTIFY * HTTP/1.1\r\n'
+    b'HOST: 239.255.255.250:1900\r\n'
+    b'NT: upnp:rootdevice\r\n'
+    b'NTS: ssdp:byebye\r\n'
+    b'USN: uuid:RINCON_123::upnp:rootdevice\r\n'
+    b'\r\n'
+)
+
+
+def test_sonos_announcement_is_parsed():
+    assert parse_announcement(SONOS_ALIVE) == Announcement(True, 'uuid:RINCON_123', 'sonos', '192.168.1.42')
+
+
+def test_hue_bridge_announcement_is_parsed():
+    assert parse_announcement(HUE_ALIVE) == Announcement(
+        True, 'uuid:2f402f80-da50-11e1-9b23-001788000000', 'philips_hue', ('', 'http://192.168.1.2:80/'))
+
+
+def test_byebye_is_parsed():
+    assert parse_announcement(BYEBYE) == Announcement(False, 'uuid:RINCON_123', None, None)
+
+
+def test_other_messages_are_ignored():
+    assert parse_announcement(b'M-SEARCH * HTTP/1.1\r\n\r\n') is None
+    assert parse_announcement(SONOS_ALIVE.replace(b'ZonePlayer:1\r\nNTS', b'ZoneGroupTopology:1\r\nNTS')) is None
+    assert parse_announcement(HUE_ALIVE.replace(b'NTS: ssdp:alive', b'NTS: ssdp:update')) is None
+    assert parse_announcement(BYEBYE.replace(b'NT: upnp:rootdevice', b'NT: urn:schemas-upnp-org:device:ZonePlayer:1')) is None
+
+
+@yield_fixture
+def listener():
+    listener = SSDPListener(address=('127.0.0.1', 0), group=None)
+    yield listener
+    listener.close()
+
+
+def test_listener_receives_announcements(listener):
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender.sendto(b'M-SEARCH * HTTP/1.1\r\n\r\n', listener.socket.getsockname())
+    sender.sendto(SONOS_ALIVE, listener.socket.getsockname())
+    sender.close()
+
+    assert listener.receive(timeout=1) is None
+    assert listener.receive(timeout=1).device_type == 'sonos'
+    assert listener.receive(timeout=0) is None
@@ -1,5 +1,4 @@
 from logging import getLogger
-from os import path
 from uuid import uuid4
 
 from colander import Length, MappingSchema, SchemaNode, SequenceSchema, String
@@ -9,11 +8,12 @@ from cornice.validators import colander_body_validator
 from pyramid.httpexceptions import HTTPBadRequest, HTTPNotFound
 
 from ..config import path as service_path
+from ..nuimo_app_config import load_config, thaw, update_config
 from .setup_devices import get_device
 from .api_descriptions import descriptions as desc
 from .nuimos import is_device_responsive
+from ...hue_transport import get_hue_transport
 
-import yaml
 import requests
 import json
 import time
@@ -54,7 +54,9 @@ def nuimo_components_view(request):
     nuimo_app_config_path = request.registry.settings['nuimo_app_config_path']
     mac_address = request.matchdict['mac_address'].replace('-', ':')
 
-    if not path.exists(nuimo_app_config_path):
+    try:
+        config = load_config(nuimo_app_config_path)
+    except FileNotFoundError:
         raise HTTPNotFound("App config file does not exist")
 
     def nuimo_app_config_component_to_response_component(component):
@@ -65,11 +67,8 @@ def nuimo_components_view(request):
             'name': component['name']
         }
 
-    with open(nuimo_app_config_path, 'r') as f:
-        config = yaml.load(f)
-
     try:
-        nuimo = config['nuimos'][mac_address]
+        nuimo = config.nuimo(mac_address)
     except (KeyError, TypeError):
         return HTTPNotFound("No Nuimo with such ID")
 
@@ -112,24 +111,22 @@ def add_nuimo_component_view(request):
     component = create_component(device)
     component['device_ids'] = device_ids
 
-    with open(request.registry.settings['nuimo_app_config_path'], 'r+') as f:
-        config = yaml.load(f)
-
+    def add_component(config):
         try:
             nuimo = config['nuimos'][mac_address]
         except (KeyError, TypeError):
-            return HTTPNotFound("No Nuimo with such ID")
+            raise HTTPNotFound("No Nuimo with such ID")
 
-        group_number = [comp['name'] for comp in nuimo['components'] if " Group " in comp['name'] and component['ip_address'] in comp['name']]
+        new_component = dict(component)
+        group_number = [comp['name'] for comp in nuimo['components'] if " Group " in comp['name'] and new_component['ip_address'] in comp['name']]
 
         for comp in nuimo['components']:
-            if component['name'] == comp['name'] and " Group " not in comp['name']:
-                component['name'] = component['name'] + " Group " + str(len(group_number) + 1)
-        nuimo['components'].append(component)
-        f.seek(0)  # We want to overwrite the config file with the new configuration
-        yaml.dump(config, f, default_flow_style=False)
+            if new_component['name'] == comp['name'] and " Group " not in comp['name']:
+                new_component['name'] = new_component['name'] + " Group " + str(len(group_number) + 1)
+        nuimo['components'].append(new_component)
+        return new_component
 
-    return component
+    return update_config(request.registry.settings['nuimo_app_config_path'], add_component)
 
 
 def create_component(device):
@@ -175,18 +172,16 @@ def create_component(device):
 def get_nuimo_component_view(request):
     component_id = request.matchdict['component_id']
     mac_address = request.matchdict['mac_address'].replace('-', ':')
-    with open(request.registry.settings['nuimo_app_config_path'], 'r') as f:
-        config = yaml.load(f)
+    config = load_config(request.registry.settings['nuimo_app_config_path'])
 
     try:
-        nuimo = config['nuimos'][mac_address]
+        config.nuimo(mac_address)
     except (KeyError, TypeError):
         return HTTPNotFound("No Nuimo with such ID")
 
-    components = nuimo['components']
     try:
-        return next(c for c in components if c['id'] == component_id)
-    except StopIteration:
+        return config.component(mac_address, component_id)
+    except KeyError:
         raise HTTPNotFound
 
 
@@ -194,13 +189,12 @@ def get_nuimo_component_view(request):
 def delete_nuimo_component_view(request):
     component_id = request.matchdict['component_id']
     mac_address = request.matchdict['mac_address'].replace('-', ':')
-    with open(request.registry.settings['nuimo_app_config_path'], 'r+') as f:
-        config = yaml.load(f)
 
+    def delete_component(config):
         try:
             nuimo = config['nuimos'][mac_address]
         except (KeyError, TypeError):
-            return HTTPNotFound("No Nuimo with such ID")
+            raise HTTPNotFound("No Nuimo with such ID")
 
         components = nuimo['components']
 
@@ -211,9 +205,7 @@ def delete_nuimo_component_view(request):
 
         components.remove(component)
 
-        f.seek(0)  # We want to overwrite the config file with the new configuration
-        f.truncate()
-        yaml.dump(config, f, default_flow_style=False)
+    update_config(request.registry.settings['nuimo_app_config_path'], delete_component)
 
 
 class ModifyComponentSchema(MappingSchema):
@@ -227,66 +219,85 @@ def modify_nuimo_component(request):
     # TODO: Validate `device_ids` if they map to the same device type as the component
     device_ids = request.validated['device_ids']
 
-    with open(request.registry.settings['nuimo_app_config_path'], 'r+') as f:
-        config = yaml.load(f)
+    config_path = request.registry.settings['nuimo_app_config_path']
 
-        try:
-            nuimo = config['nuimos'][mac_address]
-        except (KeyError, TypeError):
-            return HTTPNotFound("No Nuimo with such ID")
+    try:
+        components = thaw(load_config(config_path).nuimo(mac_address)['components'])
+    except (FileNotFoundError, KeyError, TypeError):
+        raise HTTPNotFound("No Nuimo with such ID")
 
-        components = nuimo['components']
+    try:
+        component = next(c for c in components if c['id'] == component_id)
+    except StopIteration:
+        raise HTTPNotFound
 
+    # speakers are (un)joined before the transaction as `update_config()`
+    # may call `modify_component()` more than once, the resulting `join`
+    # entries are recorded by component id
+    joined_components = set()
+
+    # JOIN two SONOS Speakers
+    if component['type'] == 'sonos' and (len(component['device_ids']) > 1 or len(device_ids) > 1):  # pragma: no cover,
+        for device in device_ids:
+            if device not in component['device_ids']:
+                try:
+                    join_component = next(c for c in components if device in c['device_ids'])
+                except StopIteration:
+                    raise HTTPNotFound
+                soco_instance = soco.SoCo(component['ip_address'])
+                soco_joining_instance = soco.SoCo(join_component['ip_address'])
+                if is_device_responsive(component['ip_address']) and is_device_responsive(join_component['ip_address']):
+                    try:
+                        soco_joining_instance.join(soco_instance)
+                    except (requests.exceptions.RequestException, soco.SoCoException):
+                        raise HTTPNotFound("No Sonos with such ip address")
+                    join_component['join'] = {'master': False, 'ip_address': component['ip_address']}
+                    if component.get('join', None):
+                        component['join'][join_component['ip_address']] = join_component['device_ids'][0]
+                    else:
+                        component['join'] = {'master': True, join_component['ip_address']: [join_component['device_ids'][0]]}
+                    joined_components.update((component['id'], join_component['id']))
+                else:
+                    raise HTTPNotFound("Sonos device not reachable")
+        for device in component['device_ids']:
+            if device not in device_ids:
+                try:
+                    unjoin_component = next(c for c in components if device in c['device_ids'] and c is not component)
+                except StopIteration:
+                    raise HTTPNotFound
+                soco_unjoining_instance = soco.SoCo(unjoin_component['ip_address'])
+                if is_device_responsive(component['ip_address']) and is_device_responsive(unjoin_component['ip_address']):
+                    try:
+                        if soco_unjoining_instance.player_name != soco_unjoining_instance.group.coordinator.player_name:
+                            soco_unjoining_instance.unjoin()
+                    except (requests.exceptions.RequestException, soco.SoCoException):
+                        raise HTTPNotFound("Speaker is not unjoinable or not reachable")
+                    del unjoin_component['join']
+                    del component['join'][unjoin_component['ip_address']]
+                    joined_components.update((component['id'], unjoin_component['id']))
+                else:
+                    raise HTTPNotFound("Sonos device not reachable")
+
+    joins = {c['id']: c.get('join') for c in components if c['id'] in joined_components}
+
+    def modify_component(config):
         try:
+            components = config['nuimos'][mac_address]['components']
             component = next(c for c in components if c['id'] == component_id)
-        except StopIteration:
+        except (KeyError, TypeError, StopIteration):
+            # removed after the snapshot was taken
             raise HTTPNotFound
 
-        # JOIN two SONOS Speakers
-        if component['type'] == 'sonos' and (len(component['device_ids']) > 1 or len(device_ids) > 1):  # pragma: no cover,
-            for device in device_ids:
-                if device not in component['device_ids']:
-                    try:
-                        join_component = next(c for c in components if device in c['device_ids'])
-                    except StopIteration:
-                        raise HTTPNotFound
-                    soco_instance = soco.SoCo(component['ip_address'])
-                    soco_joining_instance = soco.SoCo(join_component['ip_address'])
-                    if is_device_responsive(component['ip_address']) and is_device_responsive(join_component['ip_address']):
-                        try:
-                            soco_joining_instance.join(soco_instance)
-                        except (requests.exceptions.RequestException, soco.SoCoException):
-                            return HTTPNotFound("No Sonos with such ip address")
-                        join_component['join'] = {'master': False, 'ip_address': component['ip_address']}
-                        if component.get('join', None):
-                            component['join'][join_component['ip_address']] = join_component['device_ids'][0]
-                        else:
-                            component['join'] = {'master': True, join_component['ip_address']: [join_component['device_ids'][0]]}
-                    else:
-                        return HTTPNotFound("Sonos device not reachable")
-            for device in component['device_ids']:
-                if device not in device_ids:
-                    try:
-                        unjoin_component = next(c for c in components if device in c['device_ids'] and c is not component)
-                    except StopIteration:
-                        raise HTTPNotFound
-                    soco_unjoining_instance = soco.SoCo(unjoin_component['ip_address'])
-                    if is_device_responsive(component['ip_address']) and is_device_responsive(unjoin_component['ip_address']):
-                        try:
-                            if soco_unjoining_instance.player_name != soco_unjoining_instance.group.coordinator.player_name:
-                                soco_unjoining_instance.unjoin()
-                        except (requests.exceptions.RequestException, soco.SoCoException):
-                            return HTTPNotFound("Speaker is not unjoinable or not reachable")
-                        del unjoin_component['join']
-                        del component['join'][unjoin_component['ip_address']]
-                    else:
-                        return HTTPNotFound("Sonos device not reachable")
+        for c in components:
+            if c['id'] in joins:  # pragma: no cover, see joining above
+                if joins[c['id']] is None:
+                    c.pop('join', None)
+                else:
+                    c['join'] = joins[c['id']]
 
         component['device_ids'] = device_ids
 
-        f.seek(0)  # We want to overwrite the config file with the new configuration
-        f.truncate()
-        yaml.dump(config, f, default_flow_style=False)
+    update_config(config_path, modify_component)
 
     return get_nuimo_component_view(request)
 
@@ -300,22 +311,17 @@ def get_test_response(request):
     device_id = request.matchdict['device_id']
     hub_ip = get_current_ip()
 
-    nuimo_app_config_path = request.registry.settings['nuimo_app_config_path']
-
-    with open(nuimo_app_config_path, 'r') as f:
-        config = yaml.load(f)
-
-        try:
-            nuimo = config['nuimos'][mac_address]
-        except (KeyError, TypeError):
-            return HTTPNotFound("No Nuimo with such ID")
+    config = load_config(request.registry.settings['nuimo_app_config_path'])
 
-        components = nuimo['components']
+    try:
+        config.nuimo(mac_address)
+    except (KeyError, TypeError):
+        return HTTPNotFound("No Nuimo with such ID")
 
-        try:
-            component = next(c for c in components if c['id'] == component_id)
-        except StopIteration:
-            return HTTPNotFound("Component :" + component_id + "for Nuimo :" + mac_address + " ---> Not Found")
+    try:
+        component = config.component(mac_address, component_id)
+    except KeyError:
+        return HTTPNotFound("Component :" + component_id + "for Nuimo :" + mac_address + " ---> Not Found")
 
     component_type = component['type']
     component_ip = component['ip_address']
@@ -363,9 +369,10 @@ def get_test_response(request):
 
 def test_blink_phue(component_ip, component_username, id):
     device_id = id.split('-')[2]
-    request_url_get_default = "http://" + component_ip + "/api/" + str(component_username) + "/lights/" + str(device_id)
+    transport = get_hue_transport(component_ip)
+    request_path_get_default = "/api/" + str(component_username) + "/lights/" + str(device_id)
     try:
-        default_state = requests.get(request_url_get_default, timeout=1).json()
+        default_state = transport.request('GET', request_path_get_default, timeout=1).json()
         state_default = default_state['state']['on']
         bri_default = default_state['state']['bri']
 
@@ -385,13 +392,13 @@ def test_blink_phue(component_ip, component_username, id):
         "on": state_default,
         "bri": bri_default
     })
-    request_url_put = "http://" + component_ip + "/api/" + str(component_username) + "/lights/" + str(device_id) + "/state"
+    request_path_put = request_path_get_default + "/state"
     try:
-        requests.put(request_url_put, data=param_high, timeout=1)
+        transport.request('PUT', request_path_put, param_high, timeout=1)
         time.sleep(0.5)
-        requests.put(request_url_put, data=param_low, timeout=1)
+        transport.request('PUT', request_path_put, param_low, timeout=1)
         time.sleep(0.5)
-        requests.put(request_url_put, data=param_default, timeout=1)
+        transport.request('PUT', request_path_put, param_default, timeout=1)
         return True
 
     except Exception as e:
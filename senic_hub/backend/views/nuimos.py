@@ -1,22 +1,23 @@
 from cornice.service import Service
 from logging import getLogger
-from os import path, system
+from os import path
 from .. import nuimo_setup
 # TODO: We better rename `config.path` to something else. Conflicts with `os.path`
 from cornice.validators import colander_body_validator
 # import colander
 
 from ..config import path as service_path
-from pyramid.httpexceptions import HTTPNotFound
-import yaml
-from .. import supervisor
+from ..nuimo_app_config import get_config_store, load_config, thaw, update_config
+from ..reachability import get_reachability_monitor
+from pyramid.httpexceptions import HTTPBadRequest, HTTPNotFound, HTTPServiceUnavailable
+from ...nuimo_app.status import get_status_segment
 
 from .api_descriptions import descriptions as desc
 from colander import MappingSchema, String, SchemaNode, Length
 
-import mmap
 import os
-import struct
+
+from threading import BoundedSemaphore, Lock
 
 import soco
 import requests
@@ -99,30 +100,37 @@ def get_configured_nuimos(request):  # pragma: no cover,
     nuimos = []
 
     try:
-        with open(nuimo_app_config_path, 'r+') as f:
-            config = yaml.load(f)
-            adapter_name = request.registry.settings.get('bluetooth_adapter_name', 'hci0')
-            manager = ControllerManager(adapter_name=adapter_name)
-            for mac_address in config['nuimos']:
-                # check Nuimo connection Status
-                controller = Controller(mac_address=mac_address, manager=manager)
-                config['nuimos'][mac_address]['is_connected'] = controller.is_connected()
-
-                # check if New Sonos Groups have been created
-                components = config['nuimos'][mac_address].get('components', [])
-                check_sonos_update(components)
-
-            f.seek(0)  # We want to overwrite the config file with the new configuration
-            f.truncate()
-            yaml.dump(config, f, default_flow_style=False)
-
-        with open(nuimo_app_config_path, 'r') as f:
-            config = yaml.load(f)
-            for mac_address in config['nuimos']:
-                temp = config['nuimos'][mac_address]
-                temp['mac_address'] = mac_address
-                temp['battery_level'] = get_nuimo_battery_level(mac_address)
-                nuimos.append(temp)
+        config = load_config(nuimo_app_config_path)
+        adapter_name = request.registry.settings.get('bluetooth_adapter_name', 'hci0')
+        manager = ControllerManager(adapter_name=adapter_name)
+        updates = {}
+        for mac_address, nuimo in config.nuimos.items():
+            # check Nuimo connection Status
+            controller = Controller(mac_address=mac_address, manager=manager)
+
+            # check if New Sonos Groups have been created
+            components = thaw(nuimo.get('components', []))
+            check_sonos_update(components)
+
+            updates[mac_address] = (controller.is_connected(), {c['id']: c for c in components})
+
+        def apply_updates(config):
+            for mac_address, (is_connected, components) in updates.items():
+                nuimo = config['nuimos'].get(mac_address)
+                if nuimo is None:
+                    continue
+                nuimo['is_connected'] = is_connected
+                if 'components' in nuimo:
+                    nuimo['components'] = [components.get(c['id'], c) for c in nuimo['components']]
+
+        config_store = get_config_store(nuimo_app_config_path)
+        config_store.update(apply_updates)
+
+        for mac_address, nuimo in config_store.snapshot().nuimos.items():
+            temp = thaw(nuimo)
+            temp['mac_address'] = mac_address
+            temp['battery_level'] = get_nuimo_battery_level(mac_address)
+            nuimos.append(temp)
 
     except FileNotFoundError as e:
         logger.error(e)
@@ -135,38 +143,90 @@ def get_configured_nuimos(request):  # pragma: no cover,
 
     return {'nuimos': nuimos}
 
-prev_battery_level = {}
+# how long `get_update_service` waits for a change before responding
+DEFAULT_UPDATE_TIMEOUT_SECONDS = 25
+
+# how many requests may wait for a change at the same time by default, every
+# waiting request occupies one of the server's worker threads, hence the
+# server needs more threads than that
+DEFAULT_MAX_UPDATE_WAITERS = 8
+
+# maximum number of waiters -> semaphore
+_update_waiters = {}
+_update_waiters_lock = Lock()
+
+
+def get_update_waiters(settings):
+    limit = int(settings.get('max_update_waiters', DEFAULT_MAX_UPDATE_WAITERS))
+    with _update_waiters_lock:
+        return _update_waiters.setdefault(limit, BoundedSemaphore(limit))
 
 
 @check_for_update_service.get()
-def get_update_service(request):  # pragma: no cover,
-    nuimo_app_config_path = request.registry.settings['nuimo_app_config_path']
-    is_updated = False
-    with open(nuimo_app_config_path, 'r') as f:
-        config = yaml.load(f)
-    adapter_name = request.registry.settings.get('bluetooth_adapter_name', 'hci0')
-    manager = ControllerManager(adapter_name=adapter_name)
-    for mac_address in config['nuimos']:
-        # check Nuimo connection Status
-        controller = Controller(mac_address=mac_address, manager=manager)
-        is_updated = True if config['nuimos'][mac_address]['is_connected'] != controller.is_connected() else is_updated
-        if is_updated:
-            return get_configured_nuimos(request)
-        if controller.is_connected():
-            global prev_battery_level
-            prev_nuimo_battery_level = prev_battery_level.get(mac_address, None)
-            is_updated = True if prev_nuimo_battery_level and prev_nuimo_battery_level != get_nuimo_battery_level(mac_address) else is_updated
-            prev_battery_level[mac_address] = get_nuimo_battery_level(mac_address)
-            if is_updated:
-                return get_configured_nuimos(request)
-
-        # check if New Sonos Groups have been created
-        components = config['nuimos'][mac_address].get('components', [])
-        is_updated = check_if_sonos_is_updated(components)
-        if is_updated:
-            return get_configured_nuimos(request)
-
-    return {'is_updated': is_updated}
+def get_update_service(request):
+    """
+    Wait until nuimo_app or device discovery publish a change (e.g. a Nuimo
+    connected or reported another battery level) and respond with the
+    configured Nuimos, or respond with `is_updated: false` on timeout.
+
+    Clients pass the `changes` counter of the previous response as `since`
+    so that changes published between two requests aren't missed.
+
+    Responds with 503 if `max_update_waiters` requests are waiting already.
+    """
+    timeout = float(request.registry.settings.get('update_timeout_seconds', DEFAULT_UPDATE_TIMEOUT_SECONDS))
+    try:
+        segment = get_status_segment()
+    except (FileNotFoundError, ValueError) as e:
+        # nuimo_app isn't running (yet), nothing to wait for
+        logger.error("Can't read Nuimo status: %s", e)
+        return {'is_updated': False}
+
+    try:
+        since = int(request.params.get('since', segment.changes))
+    except ValueError:
+        raise HTTPBadRequest("since must be an integer")
+
+    waiters = get_update_waiters(request.registry.settings)
+    if not waiters.acquire(blocking=False):
+        raise HTTPServiceUnavailable("Too many clients waiting for updates", headers={'Retry-After': str(max(1, int(timeout)))})
+    try:
+        changes = segment.wait_for_change(since, timeout)
+    finally:
+        waiters.release()
+
+    if changes == since:
+        return {'is_updated': False, 'changes': changes}
+
+    response = get_nuimo_statuses(request, segment)
+    response['changes'] = changes
+    return response
+
+
+def get_nuimo_statuses(request, segment):
+    """
+    Return the configured Nuimos with their connection state and battery
+    level read from the status segment. Unlike `get_configured_nuimos()`
+    neither BlueZ nor any device is asked, so that every change can be sent
+    to all waiting clients.
+    """
+    try:
+        config = load_config(request.registry.settings['nuimo_app_config_path'])
+    except FileNotFoundError as e:
+        logger.error(e)
+        return {'nuimos': []}
+
+    statuses = segment.read_all()
+    nuimos = []
+    for mac_address, nuimo in config.nuimos.items():
+        status = statuses.get(mac_address) or {}
+        nuimo = thaw(nuimo)
+        nuimo['mac_address'] = mac_address
+        nuimo['is_connected'] = status.get('connection_state') == 'connected'
+        nuimo['battery_level'] = status.get('battery_level')
+        nuimos.append(nuimo)
+
+    return {'nuimos': nuimos}
 
 
 class ModifyNameSchema(MappingSchema):
@@ -180,19 +240,15 @@ def modify_nuimo_name(request):  # pragma: no cover
     mac_address = request.validated['mac_address'].replace('-', ':')
     mod_name = request.validated['modified_name']
 
-    with open(request.registry.settings['nuimo_app_config_path'], 'r+') as f:
-        config = yaml.load(f)
-
+    def rename_nuimo(config):
         try:
             target_nuimo = config['nuimos'][mac_address]
         except KeyError:
-            return HTTPNotFound("No Nuimo with such ID")
+            raise HTTPNotFound("No Nuimo with such ID")
 
         target_nuimo['name'] = mod_name
 
-        f.seek(0)
-        f.truncate()
-        yaml.dump(config, f, default_flow_style=False)
+    update_config(request.registry.settings['nuimo_app_config_path'], rename_nuimo)
 
     return {
         'mac_address': mac_address,
@@ -205,40 +261,27 @@ def modify_nuimo_name(request):  # pragma: no cover
 @nuimo_service.delete()
 def delete_nuimo(request):  # pragma: no cover,
     mac_address = request.matchdict['mac_address'].replace('-', ':')
-    with open(request.registry.settings['nuimo_app_config_path'], 'r+') as f:
-        config = yaml.load(f)
 
+    def remove_nuimo(config):
         try:
             config['nuimos'][mac_address]
         except (KeyError, TypeError):
-            return HTTPNotFound("No Nuimo with such ID")
+            raise HTTPNotFound("No Nuimo with such ID")
 
         del config['nuimos'][mac_address]
 
-        f.seek(0)  # We want to overwrite the config file with the new configuration
-        f.truncate()
-        yaml.dump(config, f, default_flow_style=False)
-
-        try:
-            if supervisor.program_status('nuimo_app') == 'RUNNING':
-                supervisor.restart_program('nuimo_app')
-        except Exception as e:
-            # SUpervior spits out errors when two nuimos are being removed before the supervisor
-            # restarts post first-nuimo-removal.
-            logger.error(str(e))
+    # nuimo_app disconnects from the removed Nuimo when it notices the change
+    update_config(request.registry.settings['nuimo_app_config_path'], remove_nuimo)
 
 
-# TODO: if required, due to performance issues, can be implemented in a separate endpoint
-# TODO: add a timeout in order to handle bluetooth unexpected behaviour
 def get_nuimo_battery_level(mac_address):  # pragma: no cover,
+    # the status file is mapped once per process, reading it doesn't need any system call
     try:
-        fd = os.open('/tmp/' + mac_address.replace(':', '-'), os.O_RDONLY)
-    except FileNotFoundError:
-        logger.error("No memory mapped file named %s, return None battery level", mac_address.replace(':', '-'))
+        status = get_status_segment().read(mac_address)
+    except (FileNotFoundError, ValueError) as e:
+        logger.error("Can't read Nuimo status, return None battery level: %s", e)
         return None
-    buf = mmap.mmap(fd, mmap.PAGESIZE, mmap.MAP_SHARED, mmap.PROT_READ)
-    result, = struct.unpack('i', buf[:4])
-    return result
+    return status and status['battery_level']
 
 
 def check_sonos_update(components):  # pragma: no cover,
@@ -283,25 +326,6 @@ def check_sonos_update(components):  # pragma: no cover,
             master_component['join'][slave_component['ip_address']] = slave_component['device_ids'][0]
 
 
-def check_if_sonos_is_updated(components):  # pragma: no cover,
-    for component in components:
-        if component['type'] == 'sonos':
-            try:
-                if is_device_responsive(component['ip_address']) != component['is_reachable']:
-                    return True
-                if is_device_responsive(component['ip_address']):
-                    sonos = soco.SoCo(component['ip_address'])
-                    if component['room_name'] != sonos.player_name:
-                        return True
-                    if len(component['device_ids']) != len(sonos.group.members):
-                        return True
-            except (requests.exceptions.RequestException, soco.SoCoException):
-                logger.info("Sonos device non reachable %s", component['ip_address'])
-                continue
-    return False
-
-
-def is_device_responsive(host_ip):  # pragma: no cover,
-    param = "-c 1 -w 1"
-    status = (system("ping " + param + " " + host_ip) == 0)
-    return status
+def is_device_responsive(host_ip):
+    # only used for Sonos speakers
+    return get_reachability_monitor().is_reachable(host_ip, 'sonos')
@@ -2,15 +2,15 @@ from cornice.service import Service
 from logging import getLogger
 # TODO: We better rename `config.path` to something else. Conflicts with `os.path`
 from ..config import path as service_path
+from ..nuimo_app_config import load_config, update_config
 from pyramid.httpexceptions import HTTPNotFound
-import yaml
-import phue
 from random import sample
 
 from colander import MappingSchema, SchemaNode, String, Int, Range, Length
 from cornice.validators import colander_body_validator
 from .api_descriptions import descriptions as desc
 from senic_hub.nuimo_app.components import custom_phue_scenes
+from senic_hub.hue_transport import Bridge
 import senic_hub.backend.hub_metadata as hub_metadata
 
 logger = getLogger(__name__)
@@ -39,68 +39,74 @@ def get_nuimo_philips_hue_favorites(request):
     component_id = request.matchdict['component_id']
     os_version = hub_metadata.HubMetaData.os_version()
 
-    with open(nuimo_app_config_path, 'r+') as f:
-        config = yaml.load(f)
+    config = load_config(nuimo_app_config_path)
 
-        try:
-            nuimo = config['nuimos'][mac_address]
-        except (KeyError, TypeError):
-            return HTTPNotFound("No Nuimo with such ID")
-
-        components = nuimo['components']
+    try:
+        config.nuimo(mac_address)
+    except (KeyError, TypeError):
+        return HTTPNotFound("No Nuimo with such ID")
 
-        try:
-            component = next(c for c in components if c['id'] == component_id)
-        except StopIteration:
-            raise HTTPNotFound("No Component with such ID")
+    try:
+        component = config.component(mac_address, component_id)
+    except KeyError:
+        raise HTTPNotFound("No Component with such ID")
 
-        if component['type'] != 'philips_hue':
-            return HTTPNotFound("No Philips Hue Component with such ID")
+    if component['type'] != 'philips_hue':
+        return HTTPNotFound("No Philips Hue Component with such ID")
 
-        station1 = component.get('station1', None)
-        station2 = component.get('station2', None)
-        station3 = component.get('station3', None)
+    station1 = component.get('station1', None)
+    station2 = component.get('station2', None)
+    station3 = component.get('station3', None)
+
+    if not any((station1, station2, station3)):  # pragma: no cover,
+        philips_hue_bridge = Bridge(component['ip_address'], component['username'])
+        phue_bridge_info = hub_metadata.HubMetaData.phue_bridge_info(
+            request.registry.settings['devices_path'],
+            component['ip_address']
+        )
+        versions = {
+            'os_version': os_version,
+            'phue_api_version': phue_bridge_info.get('apiverion'),
+            'phue_sw_version': phue_bridge_info.get('swversion')
+        }
 
-        if not any((station1, station2, station3)):  # pragma: no cover,
-            philips_hue_bridge = phue.Bridge(component['ip_address'], component['username'])
-            phue_bridge_info = hub_metadata.HubMetaData.phue_bridge_info(
-                request.registry.settings['devices_path'],
-                component['ip_address']
+        try:
+            scenes = philips_hue_bridge.get_scene()
+        except ConnectionResetError:
+            logger.error(
+                "Hue Bridge not reachable.", extra={'versions': versions}
             )
-            versions = {
-                'os_version': os_version,
-                'phue_api_version': phue_bridge_info.get('apiverion'),
-                'phue_sw_version': phue_bridge_info.get('swversion')
-            }
-
-            try:
-                scenes = philips_hue_bridge.get_scene()
-            except ConnectionResetError:
-                logger.error(
-                    "Hue Bridge not reachable.", extra={'versions': versions}
-                )
-
-            light_ids = {
-                device.split('-')[-1] for device in component['device_ids']
-            }
-            scenes = {
-                k: v for k, v in scenes.items()
-                if light_ids.intersection(set(v['lights']))
-            }
-
-            if len(list(scenes.keys())) >= 3:
-                for scene in scenes:
-                    component['station1'] = station1 = {'name': scenes[scene]['name']} if scenes[scene]['name'] == 'Nightlight' else station1
-                    component['station1'] = station2 = {'name': scenes[scene]['name']} if scenes[scene]['name'] == 'Relax' else station2
-                    component['station1'] = station3 = {'name': scenes[scene]['name']} if scenes[scene]['name'] == 'Concentrate' else station3
-
-                rands = sample(range(0, len(list(scenes.keys()))), 3)
-                component['station1'] = station1 = {'name': scenes[list(scenes.keys())[rands[0]]]['name']} if station1 is None else station1
-                component['station2'] = station2 = {'name': scenes[list(scenes.keys())[rands[0]]]['name']} if station2 is None else station2
-                component['station3'] = station3 = {'name': scenes[list(scenes.keys())[rands[0]]]['name']} if station3 is None else station3
-            f.seek(0)  # We want to overwrite the config file with the new configuration
-            f.truncate()
-            yaml.dump(config, f, default_flow_style=False)
+
+        light_ids = {
+            device.split('-')[-1] for device in component['device_ids']
+        }
+        scenes = {
+            k: v for k, v in scenes.items()
+            if light_ids.intersection(set(v['lights']))
+        }
+
+        if len(list(scenes.keys())) >= 3:
+            for scene in scenes:
+                station1 = {'name': scenes[scene]['name']} if scenes[scene]['name'] == 'Nightlight' else station1
+                station2 = {'name': scenes[scene]['name']} if scenes[scene]['name'] == 'Relax' else station2
+                station3 = {'name': scenes[scene]['name']} if scenes[scene]['name'] == 'Concentrate' else station3
+
+            rands = sample(range(0, len(list(scenes.keys()))), 3)
+            station1 = {'name': scenes[list(scenes.keys())[rands[0]]]['name']} if station1 is None else station1
+            station2 = {'name': scenes[list(scenes.keys())[rands[0]]]['name']} if station2 is None else station2
+            station3 = {'name': scenes[list(scenes.keys())[rands[0]]]['name']} if station3 is None else station3
+
+            def set_stations(config):
+                # the Nuimo or component might have been removed in the meantime
+                nuimo = config['nuimos'].get(mac_address) or {}
+                component = next((c for c in nuimo.get('components', []) if c['id'] == component_id), None)
+                if component is None:
+                    raise HTTPNotFound("No Component with such ID")
+                component['station1'] = station1
+                component['station2'] = station2
+                component['station3'] = station3
+
+            update_config(nuimo_app_config_path, set_stations)
 
     return {'station1': station1, 'station2': station2, 'station3': station3}
 
@@ -118,13 +124,11 @@ def put_nuimo_philips_hue_favorite(request):
     station_name = request.validated['name']
     station_number = request.validated['number']
 
-    with open(nuimo_app_config_path, 'r+') as f:
-        config = yaml.load(f)
-
+    def set_station(config):
         try:
             nuimo = config['nuimos'][mac_address]
         except KeyError:
-            return HTTPNotFound("No Nuimo with such ID")
+            raise HTTPNotFound("No Nuimo with such ID")
 
         components = nuimo['components']
 
@@ -134,14 +138,12 @@ def put_nuimo_philips_hue_favorite(request):
             raise HTTPNotFound("No Component with such ID")
 
         if component['type'] != 'philips_hue':
-            return HTTPNotFound("No Philips Hue Component with such ID")
+            raise HTTPNotFound("No Philips Hue Component with such ID")
 
         station = {'name': station_name}
         component['station' + str(station_number)] = station
 
-        f.seek(0)  # We want to overwrite the config file with the new configuration
-        f.truncate()
-        yaml.dump(config, f, default_flow_style=False)
+    update_config(nuimo_app_config_path, set_station)
 
 
 @philips_hue_favorites.get()
@@ -150,25 +152,22 @@ def get_philips_hue_favorites(request):  # pragma: no cover,
     mac_address = request.matchdict['mac_address'].replace('-', ':')
     component_id = request.matchdict['component_id']
 
-    with open(nuimo_app_config_path, 'r') as f:
-        config = yaml.load(f)
+    config = load_config(nuimo_app_config_path)
 
     try:
-        nuimo = config['nuimos'][mac_address]
+        config.nuimo(mac_address)
     except (KeyError, TypeError):
         return HTTPNotFound("No Nuimo with such ID")
 
-    components = nuimo['components']
-
     try:
-        component = next(c for c in components if c['id'] == component_id)
-    except StopIteration:
+        component = config.component(mac_address, component_id)
+    except KeyError:
         raise HTTPNotFound("No Component with such ID")
 
     if component['type'] != 'philips_hue':
         return HTTPNotFound("No Philips Hue Component with such ID")
 
-    philips_hue_bridge = phue.Bridge(component['ip_address'], component['username'])
+    philips_hue_bridge = Bridge(component['ip_address'], component['username'])
     try:
         scenes = philips_hue_bridge.get_scene()
     except ConnectionResetError:
@@ -2,6 +2,7 @@ import json
 import logging
 import os
 import os.path
+import xmlrpc.client
 
 from cornice.service import Service
 
@@ -11,7 +12,7 @@ from cornice.validators import colander_body_validator
 from .. import supervisor
 
 from ..config import path
-from ..device_discovery import PhilipsHueBridgeApiClient, UnauthenticatedDeviceError, UpstreamError
+from ..device_discovery import PhilipsHueBridgeApiClient, UnauthenticatedDeviceError, UpstreamError, read_volatile_fields
 from ..lockfile import open_locked
 from .api_descriptions import descriptions as desc
 
@@ -33,7 +34,12 @@ def devices_list_view(request):
     Returns list of discovered devices/bridges.
 
     """
-    return read_json(request.registry.settings['devices_path'], [])
+    devices_path = request.registry.settings['devices_path']
+    devices = read_json(devices_path, [])
+    volatile_fields = read_volatile_fields(devices_path)
+    for device in devices:
+        device.update(volatile_fields.get(device['id'], {}))
+    return devices
 
 
 discover_service = Service(
@@ -47,12 +53,16 @@ discover_service = Service(
 @discover_service.post(validators=(colander_body_validator,))
 def devices_discover_view(request):
     """
-    Trigger device discovery daemon restart to force a new device
-    scan.
+    Trigger a new device scan of the device discovery daemon. The daemon
+    is restarted if it can't be signaled, e.g. because it isn't running.
 
     """
-    logger.info("Restarting device discovery daemon...")
-    supervisor.restart_program('device_discovery')
+    logger.info("Triggering device discovery...")
+    try:
+        supervisor.signal_program('device_discovery', 'USR1')
+    except xmlrpc.client.Fault as e:
+        logger.info("Restarting device discovery daemon: %s", e)
+        supervisor.restart_program('device_discovery')
 
 
 authenticate_service = Service(
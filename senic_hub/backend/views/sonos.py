@@ -2,8 +2,8 @@ from cornice.service import Service
 from logging import getLogger
 # TODO: We better rename `config.path` to something else. Conflicts with `os.path`
 from ..config import path as service_path
+from ..nuimo_app_config import load_config, update_config
 from pyramid.httpexceptions import HTTPNotFound
-import yaml
 from soco import SoCo, SoCoException
 
 from colander import MappingSchema, SchemaNode, String, Int, Range
@@ -35,44 +35,48 @@ def get_nuimo_sonos_favorites(request):
     mac_address = request.matchdict['mac_address'].replace('-', ':')
     component_id = request.matchdict['component_id']
 
-    with open(nuimo_app_config_path, 'r+') as f:
-        config = yaml.load(f)
+    config = load_config(nuimo_app_config_path)
 
-        try:
-            nuimo = config['nuimos'][mac_address]
-        except (KeyError, TypeError):
-            return HTTPNotFound("No Nuimo with such ID")
+    try:
+        config.nuimo(mac_address)
+    except (KeyError, TypeError):
+        return HTTPNotFound("No Nuimo with such ID")
 
-        components = nuimo['components']
+    try:
+        component = config.component(mac_address, component_id)
+    except KeyError:
+        raise HTTPNotFound("No Component with such ID")
 
-        try:
-            component = next(c for c in components if c['id'] == component_id)
-        except StopIteration:
-            raise HTTPNotFound("No Component with such ID")
+    if component['type'] != 'sonos':
+        return HTTPNotFound("No Sonos Component with such ID")
 
-        if component['type'] != 'sonos':
-            return HTTPNotFound("No Sonos Component with such ID")
+    station1 = component.get('station1', None)
+    station2 = component.get('station2', None)
+    station3 = component.get('station3', None)
+
+    if not any((station1, station2, station3)):  # pragma: no cover,
+        sonos_controller = SoCo(component['ip_address'])
+        try:
+            favorites = sonos_controller.get_sonos_favorites(max_items=3)
+        except SoCoException:
+            return HTTPNotFound("Sonos Device not reachable")
 
-        station1 = component.get('station1', None)
-        station2 = component.get('station2', None)
-        station3 = component.get('station3', None)
+        if favorites['returned'] < 3:
+            return HTTPNotFound("less than Three Favorites on Sonos")
 
-        if not any((station1, station2, station3)):  # pragma: no cover,
-            sonos_controller = SoCo(component['ip_address'])
-            try:
-                favorites = sonos_controller.get_sonos_favorites(max_items=3)
-            except SoCoException:
-                return HTTPNotFound("Sonos Device not reachable")
+        station1, station2, station3 = favorites['favorites'][:3]
 
-            if favorites['returned'] < 3:
-                return HTTPNotFound("less than Three Favorites on Sonos")
+        def set_stations(config):
+            # the Nuimo or component might have been removed in the meantime
+            nuimo = config['nuimos'].get(mac_address) or {}
+            component = next((c for c in nuimo.get('components', []) if c['id'] == component_id), None)
+            if component is None:
+                raise HTTPNotFound("No Component with such ID")
+            component['station1'] = station1
+            component['station2'] = station2
+            component['station3'] = station3
 
-            station1 = component['station1'] = favorites['favorites'][0]
-            station2 = component['station2'] = favorites['favorites'][1]
-            station3 = component['station3'] = favorites['favorites'][2]
-            f.seek(0)  # We want to overwrite the config file with the new configuration
-            f.truncate()
-            yaml.dump(config, f, default_flow_style=False)
+        update_config(nuimo_app_config_path, set_stations)
 
     return {'station1': station1, 'station2': station2, 'station3': station3}
 
@@ -96,13 +100,11 @@ def put_nuimo_sonos_favorite(request):
     item = request.validated['item']
     number = request.validated['number']
 
-    with open(nuimo_app_config_path, 'r+') as f:
-        config = yaml.load(f)
-
+    def set_station(config):
         try:
             nuimo = config['nuimos'][mac_address]
         except (KeyError, TypeError):
-            return HTTPNotFound("No Nuimo with such ID")
+            raise HTTPNotFound("No Nuimo with such ID")
 
         components = nuimo['components']
 
@@ -112,13 +114,11 @@ def put_nuimo_sonos_favorite(request):
             raise HTTPNotFound("No Component with such ID")
 
         if component['type'] != 'sonos':
-            return HTTPNotFound("No Sonos Component with such ID")
+            raise HTTPNotFound("No Sonos Component with such ID")
 
         component['station' + str(number)] = item
 
-        f.seek(0)  # We want to overwrite the config file with the new configuration
-        f.truncate()
-        yaml.dump(config, f, default_flow_style=False)
+    update_config(nuimo_app_config_path, set_station)
 
 
 @sonos_favorites.get()
@@ -127,19 +127,16 @@ def get_sonos_favorites(request):  # pragma: no cover,
     mac_address = request.matchdict['mac_address'].replace('-', ':')
     component_id = request.matchdict['component_id']
 
-    with open(nuimo_app_config_path, 'r') as f:
-        config = yaml.load(f)
+    config = load_config(nuimo_app_config_path)
 
     try:
-        nuimo = config['nuimos'][mac_address]
+        config.nuimo(mac_address)
     except (KeyError, TypeError):
         return HTTPNotFound("No Nuimo with such ID")
 
-    components = nuimo['components']
-
     try:
-        component = next(c for c in components if c['id'] == component_id)
-    except StopIteration:
+        component = config.component(mac_address, component_id)
+    except KeyError:
         raise HTTPNotFound("No Component with such ID")
 
     if component['type'] != 'sonos':
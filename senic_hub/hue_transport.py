@@ -0,0 +1,129 @@
+"""
+HTTP transport shared by everything talking to Philips Hue bridges: the
+nuimo_app component, device discovery and setup and the backend views.
+
+Every bridge gets a single session with a pool of keep-alive connections,
+so that consecutive requests (e.g. while rotating a Nuimo) don't pay for
+setting up a new TCP connection each. All requests use the same timeout
+and retry failures to connect to the bridge.
+"""
+import json
+import logging
+
+from threading import Lock
+from time import monotonic, sleep
+
+import phue
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+
+logger = logging.getLogger(__name__)
+
+
+class HueTransport:
+
+    TIMEOUT = 5  # seconds
+
+    # enough for the concurrent requests of `philips_hue.LightSet`, bridges
+    # only handle a few connections at the same time
+    MAX_CONNECTIONS = 4
+
+    # only establishing connections is retried, requests that reached the
+    # bridge aren't sent again as e.g. increasing the brightness isn't
+    # idempotent
+    CONNECT_RETRIES = 2
+    RETRY_BACKOFF_FACTOR = 0.1  # seconds
+
+    # Philips recommends not to send more than ~10 requests per second to a
+    # bridge. Bursts, e.g. setting all lights of a component at once, are
+    # sent right away as long as the average rate isn't exceeded.
+    MAX_REQUESTS_PER_SECOND = 10
+    MAX_BURST = 10  # requests
+
+    def __init__(self, ip_address):
+        self.ip_address = ip_address
+        self.base_url = 'http://{}'.format(ip_address)
+        self.throttled_count = 0
+        self._rate_lock = Lock()
+        self._tokens = self.MAX_BURST
+        self._tokens_time = monotonic()
+        self.session = Session()
+        retry = Retry(total=self.CONNECT_RETRIES, connect=self.CONNECT_RETRIES, read=0, backoff_factor=self.RETRY_BACKOFF_FACTOR)
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.MAX_CONNECTIONS, max_retries=retry)
+        self.session.mount('http://', self.adapter)
+
+    def request(self, method, path, data=None, timeout=None):
+        """
+        Send a request to the bridge, `path` starts with `/api`. Returns
+        the `requests.Response`.
+        """
+        self._wait_for_rate_limit()
+        url = self.base_url + path
+        logger.debug("%s %s %s", method, url, data)
+        return self.session.request(method, url, data=data, timeout=timeout or self.TIMEOUT)
+
+    def _wait_for_rate_limit(self):
+        # token bucket, every request takes a token up front so that
+        # concurrent requests wait in turn without holding the lock
+        with self._rate_lock:
+            now = monotonic()
+            self._tokens = min(self.MAX_BURST, self._tokens + (now - self._tokens_time) * self.MAX_REQUESTS_PER_SECOND)
+            self._tokens_time = now
+            self._tokens -= 1
+            delay = -self._tokens / self.MAX_REQUESTS_PER_SECOND
+            if delay > 0:
+                self.throttled_count += 1
+
+        if delay > 0:
+            sleep(delay)
+
+    def metrics(self):
+        """
+        Return how many requests were sent, how many of them reused a
+        connection of the pool instead of opening a new one and how many
+        had to wait for the rate limit.
+        """
+        pools = self.adapter.poolmanager.pools
+        pools = [pools[key] for key in pools.keys()]
+        requests = sum(p.num_requests for p in pools)
+        connections = sum(p.num_connections for p in pools)
+        return {
+            'requests': requests,
+            'connections': connections,
+            'reused_connections': max(0, requests - connections),
+            'throttled': self.throttled_count,
+        }
+
+
+class Bridge(phue.Bridge):
+    """
+    `phue.Bridge` sending its requests through the bridge's `HueTransport`
+    instead of opening a new connection for every request.
+    """
+
+    def __init__(self, ip, username):
+        self.transport = get_hue_transport(ip)
+        super().__init__(ip, username)
+
+    def request(self, mode='GET', address=None, data=None):
+        if data is not None and not isinstance(data, str):
+            data = json.dumps(data)
+        return self.transport.request(mode, address, data).json()
+
+
+_transports = {}
+_transports_lock = Lock()
+
+
+def get_hue_transport(ip_address):
+    """
+    Return the transport of all requests sent to the given bridge.
+    """
+    with _transports_lock:
+        transport = _transports.get(ip_address)
+        if transport is None:
+            transport = _transports[ip_address] = HueTransport(ip_address)
+        return transport
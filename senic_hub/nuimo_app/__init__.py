@@ -1,28 +1,20 @@
 import logging
 
+from collections import OrderedDict
 from importlib import import_module
 from threading import Thread
 import time
 
-import ctypes
-import mmap
-import os
-import struct
-
 from nuimo import (Controller, ControllerListener, ControllerManager, Gesture, LedMatrix)
 
-from . import matrices
+from . import bluez, matrices
+from .discovery import SharedDiscovery
+from .dispatcher import GestureDispatcher
+from .reconnect import ReconnectSupervisor
+from .status import STATE_CONNECTED, STATE_CONNECTING, STATE_DISCONNECTED, get_status_segment
 
-import multiprocessing_logging
-multiprocessing_logging.install_mp_handler()
 logger = logging.getLogger(__name__)
 
-# The underlying callback that reacts on a disconnect doesn't
-# provide a good enough solution in the field.
-# (it just doesn't reconnect every time)
-# We're manually polling for the status of the nuimo.
-NUIMO_RECONNECT_POLL_PERIOD = 5
-
 
 class NuimoControllerListener(ControllerListener):
 
@@ -32,35 +24,29 @@ class NuimoControllerListener(ControllerListener):
     def started_connecting(self):
         mac = self.controller.mac_address
         logger.info("Connecting to Nuimo controller %s...", mac)
+        self.status.update(connection_state=STATE_CONNECTING)
 
     def connect_succeeded(self):
         mac = self.controller.mac_address
         self.connection_failed = False
         logger.info("Connected to Nuimo controller %s", mac)
+        self.status.update(connection_state=STATE_CONNECTED)
+        self.reconnector.connected()
 
     def connect_failed(self, error):
+        mac = self.controller.mac_address
         self.connection_failed = True
-        logger.info("Can't reconnect. Restarting nuimo_app")
-
-        # This is a dodgy hack :)
-        # Once the connection has failed field tests showed it
-        # won't reconnect again and a restart of the nuimo_app
-        # is needed.
-        # The supervisor is called for that from this child process.
-        # After noticing this resulting in rouge processes, the
-        # sys.exit(0) was added
-
-        import subprocess
-        restart_nuimo_app_cmd = "supervisorctl restart nuimo_app"
-        subprocess.Popen(restart_nuimo_app_cmd.split())
-        import sys
-        sys.exit()
+        logger.info("Failed to connect to Nuimo controller %s: %s", mac, error)
+        self.status.update(connection_state=STATE_DISCONNECTED)
+        if not self.is_app_disconnection:
+            self.reconnector.connect_failed()
 
     def disconnect_succeeded(self):
         mac = self.controller.mac_address
         logger.warn("Disconnected from %s, reconnecting...", mac)
+        self.status.update(connection_state=STATE_DISCONNECTED)
         if not self.is_app_disconnection:
-            self.controller.connect()
+            self.reconnector.connection_lost()
 
     def services_resolved(self):
         mac = self.controller.mac_address
@@ -88,42 +74,62 @@ class NuimoApp(NuimoControllerListener):
         Gesture.BUTTON_RELEASE,
     ]
 
+    # deactivated components are kept in standby so that switching back to
+    # them is instant, the least recently used ones are stopped first when
+    # exceeding either limit
+    MAX_STANDBY_COMPONENTS = 8
+    STANDBY_MEMORY_BUDGET = 256  # kB
+
     def __init__(self, ble_adapter_name, mac_address, components):
         super().__init__()
 
         logger.debug("Initialising NuimoApp for %s" % mac_address)
+        # status shared with the backend, see `status.StatusSegment`
+        self.status = get_status_segment(writable=True).slot(mac_address)
         self.components = []
         self.active_component = None
+        # component id -> deactivated component, least recently used first
+        self.standby_components = OrderedDict()
+        self.gesture_dispatchers = {}
         component_instances = get_component_instances(components, mac_address)
         self.set_components(component_instances)
         logger.info("Components associated with this Nuimo: %s" % components)
 
         self.manager = None
+        self.discovery = None
+        self.reconnector = None
         self.ble_adapter_name = ble_adapter_name
         self.controller = None
         self.mac_address = mac_address
         self.battery_level = None
 
-        # memory map using mmap to store nuimo battery level
-        fd = os.open('/tmp/' + self.mac_address.replace(':', '-'), os.O_CREAT | os.O_TRUNC | os.O_RDWR)
-        assert os.write(fd, b'\x00' * mmap.PAGESIZE) == mmap.PAGESIZE
-        buf = mmap.mmap(fd, mmap.PAGESIZE, mmap.MAP_SHARED, mmap.PROT_WRITE)
-        self.bl = ctypes.c_int.from_buffer(buf)
-        self.bl.value = 0
-        offset = struct.calcsize(self.bl._type_)
-        assert buf[offset] == 0
-
     def set_components(self, components):
         previously_active = self.active_component
-        if self.active_component:
-            self.active_component.stop()
-            self.active_component = None
 
         for component in components:
             component.nuimo = self
         self.components = components
 
+        component_ids = {c.component_id for c in components}
+        for component_id, dispatcher in list(self.gesture_dispatchers.items()):
+            if component_id not in component_ids:
+                del self.gesture_dispatchers[component_id]
+                dispatcher.clear()
+
+        for component_id, component in list(self.standby_components.items()):
+            if component not in components:
+                del self.standby_components[component_id]
+                component.stop()
+
+        if previously_active in components:
+            # active component was kept, no need to restart it
+            return
+
         if previously_active:
+            self.clear_gestures(previously_active)
+            previously_active.stop()
+            self.active_component = None
+
             for component in components:
                 if previously_active.component_id == component.component_id:
                     self.set_active_component(component)
@@ -131,8 +137,14 @@ class NuimoApp(NuimoControllerListener):
 
         if self.active_component is None:
             self.set_active_component()
+        if self.active_component is None:
+            self.status.update(active_component=-1)
 
     def start(self, ipc_queue):
+        """
+        Run this Nuimo app with its own controller manager and main loop, used
+        when every Nuimo is driven by a dedicated process.
+        """
 
         logger.debug("Started a dedicated nuimo control process for %s" %
                      self.mac_address)
@@ -148,11 +160,68 @@ class NuimoApp(NuimoControllerListener):
         output = subprocess.check_output("hciconfig")
         logger.debug("Adapter (from hciconfig): %s " % str(output.split()[0]))
 
-        self.manager = ControllerManager(self.ble_adapter_name)
-        self.manager.is_adapter_powered = True
+        manager = ControllerManager(self.ble_adapter_name)
+        manager.is_adapter_powered = True
         logger.debug("Powering on BT adapter")
 
-        devices_known_to_bt_module = [device.mac_address for device in self.manager.devices()]
+        self.connect(manager)
+        if self.is_app_disconnection:
+            # stopped while waiting for the Nuimo to be discovered
+            return
+
+        try:
+            self.manager.run()
+        except KeyboardInterrupt:
+            logger.info("Nuimo app received SIGINT %s", self.mac_address)
+            self.stop()
+
+    def connect(self, manager, discovery=None):
+        """
+        Connect to the Nuimo using the given controller manager. Its main
+        loop might be shared with other Nuimo apps, in which case they must
+        share its `discovery` too.
+        """
+        self.manager = manager
+        self.discovery = discovery or SharedDiscovery(manager)
+
+        if not self.wait_until_discovered():
+            # Nuimo was removed while waiting for it
+            return
+
+        self.controller = Controller(self.mac_address, self.manager)
+        self.controller.listener = self
+        self.reconnector = ReconnectSupervisor(self.mac_address, lambda: self.controller.connect(), self.reset_controller)
+        self.set_active_component()
+        logger.info("Connecting to Nuimo controller %s", self.controller.mac_address)
+        self.controller.connect()
+
+    def reset_controller(self):
+        """
+        Remove the Nuimo from BlueZ, wait until it's discovered again and
+        replace the controller, used when reconnecting keeps failing.
+        """
+        adapter_name = self.manager.adapter_name
+        try:
+            bluez.remove_device(adapter_name, self.mac_address)
+        except Exception as e:
+            logger.error("Failed to remove %s from BlueZ: %s", self.mac_address, e)
+
+        self.controller.listener = None
+        # the manager doesn't forget removed devices, ask BlueZ instead
+        if self.wait_until_discovered(lambda: bluez.get_device_mac_addresses(adapter_name)):
+            self.controller = Controller(self.mac_address, self.manager)
+            self.controller.listener = self
+
+    def wait_until_discovered(self, get_mac_addresses=None):
+        """
+        Return True once the Nuimo is known to BlueZ, or False if the app
+        was disconnected in the meantime.
+        """
+        if get_mac_addresses is None:
+            def get_mac_addresses():
+                return [device.mac_address for device in self.manager.devices()]
+
+        devices_known_to_bt_module = get_mac_addresses()
         if self.mac_address not in devices_known_to_bt_module:
             # The Nuimo needs to had been discovered by the bt module
             # at some point before we can do:
@@ -162,39 +231,53 @@ class NuimoApp(NuimoControllerListener):
             # discovery needs to be redone until the Nuimo reapears.
             logger.debug("%s not in discovered devices of the bt module. Starting discovery"
                          % self.mac_address)
-            self.manager.start_discovery()
-            while self.mac_address not in devices_known_to_bt_module:
-                time.sleep(3)
-                devices_known_to_bt_module = [device.mac_address
-                                              for device in self.manager.devices()]
-                logger.debug("Still haven't found %s" % self.mac_address)
-            logger.debug("Found it. Stopping discovery")
-            self.manager.stop_discovery()
-
-        self.controller = Controller(self.mac_address, self.manager)
-        self.controller.listener = self
-        self.set_active_component()
-        logger.info("Connecting to Nuimo controller %s", self.controller.mac_address)
-        self.controller.connect()
-
-        try:
-            self.manager.run()
-        except KeyboardInterrupt:
-            logger.info("Nuimo app received SIGINT %s", self.controller.mac_address)
-            self.stop()
+            # other Nuimos might still be waiting for discovery
+            self.discovery.start()
+            try:
+                while self.mac_address not in devices_known_to_bt_module:
+                    time.sleep(3)
+                    if self.is_app_disconnection:
+                        return False
+                    devices_known_to_bt_module = get_mac_addresses()
+                    logger.debug("Still haven't found %s" % self.mac_address)
+                logger.debug("Found %s" % self.mac_address)
+            finally:
+                self.discovery.stop()
+
+        return True
 
     def stop(self):
-        logger.info("Stopping nuimo app of %s ...", self.controller.mac_address)
+        # there is no controller yet while waiting for the Nuimo to be discovered
+        logger.info("Stopping nuimo app of %s ...", self.mac_address)
+        self.disconnect()
+        if self.manager:
+            self.manager.stop()
+        logger.debug("self manager stop %s", self.mac_address)
+
+    def disconnect(self):
+        """
+        Stop the active component and disconnect from the Nuimo without
+        stopping the controller manager.
+        """
+        for dispatcher in self.gesture_dispatchers.values():
+            dispatcher.clear()
         if self.active_component:
             self.active_component.stop()
+        while self.standby_components:
+            self.standby_components.popitem()[1].stop()
 
-        self.controller.disconnect()
         self.is_app_disconnection = True
-        logger.info("Disconnected from Nuimo controller %s", self.controller.mac_address)
-        self.manager.stop()
-        logger.debug("self manager stop %s", self.controller.mac_address)
+        if self.reconnector:
+            self.reconnector.stop()
+        if self.controller:
+            self.controller.disconnect()
+            logger.info("Disconnected from Nuimo controller %s", self.controller.mac_address)
+        self.status.release()
 
     def process_gesture_event(self, event):
+        received_time = time.time()
+        self.status.update(last_gesture_time=received_time)
+
         if event.gesture in self.GESTURES_TO_IGNORE:
             logger.debug("Ignoring gesture event: %s", event)
             return
@@ -222,7 +305,7 @@ class NuimoApp(NuimoControllerListener):
             return
 
         if self.active_component.ip_address is not None:
-            self.process_gesture(event.gesture, event.value)
+            self.process_gesture(event.gesture, event.value, received_time)
             return
 
         # Process gestures for devices having no IP address in nuimo_app.cfg
@@ -245,27 +328,39 @@ class NuimoApp(NuimoControllerListener):
 
         self.show_active_component()
 
-    def process_gesture(self, gesture, delta):
+    def process_gesture(self, gesture, delta, received_time=None):
+        """
+        Hand the gesture to the active component's dispatcher which calls the
+        component's handler from its own thread.
+        """
+        component = self.active_component
+        component.notify_activity()
+        dispatcher = self.gesture_dispatchers.get(component.component_id)
+        if dispatcher is None:
+            dispatcher = GestureDispatcher(component.component_id)
+            self.gesture_dispatchers[component.component_id] = dispatcher
+
         if gesture == Gesture.ROTATION:
-            self.active_component.on_rotation(delta / 1800)  # 1800 is the amount of all ticks for a full ring rotation
+            # 1800 is the amount of all ticks for a full ring rotation
+            dispatcher.dispatch(component.on_rotation, delta / 1800, merge=True, received_time=received_time)
 
-        if gesture == Gesture.BUTTON_PRESS:
-            self.active_component.on_button_press()
+        elif gesture == Gesture.BUTTON_PRESS:
+            dispatcher.dispatch(component.on_button_press, received_time=received_time)
 
         elif gesture == Gesture.SWIPE_LEFT:
-            self.active_component.on_swipe_left()
+            dispatcher.dispatch(component.on_swipe_left, received_time=received_time)
 
         elif gesture == Gesture.SWIPE_RIGHT:
-            self.active_component.on_swipe_right()
+            dispatcher.dispatch(component.on_swipe_right, received_time=received_time)
 
         elif gesture == Gesture.LONGTOUCH_LEFT:
-            self.active_component.on_longtouch_left()
+            dispatcher.dispatch(component.on_longtouch_left, received_time=received_time)
 
         elif gesture == Gesture.LONGTOUCH_BOTTOM:
-            self.active_component.on_longtouch_bottom()
+            dispatcher.dispatch(component.on_longtouch_bottom, received_time=received_time)
 
         elif gesture == Gesture.LONGTOUCH_RIGHT:
-            self.active_component.on_longtouch_right()
+            dispatcher.dispatch(component.on_longtouch_right, received_time=received_time)
 
         else:
             # TODO handle all remaining gestures...
@@ -302,14 +397,48 @@ class NuimoApp(NuimoControllerListener):
         elif self.components:
             active_component = self.components[0]
 
+        if active_component is self.active_component:
+            # e.g. swiping with a single component, keep it running
+            return
+
         if active_component:
+            # not to be stopped when making room for the deactivated component
+            self.standby_components.pop(active_component.component_id, None)
             if self.active_component:
-                logger.debug("Stopping component: %s", self.active_component.component_id)
-                self.active_component.stop()
+                self.deactivate_component(self.active_component)
 
             logger.debug("Activating component: %s", active_component.component_id)
             self.active_component = active_component
             self.active_component.start()
+            self.status.update(active_component=self.components.index(active_component))
+
+    def deactivate_component(self, component):
+        """
+        Put the component in standby if it supports it, stopping the least
+        recently used components in standby beyond the limits.
+        """
+        logger.debug("Deactivating component: %s", component.component_id)
+        self.clear_gestures(component)
+        component.standby()
+        if component.STANDBY_MEMORY is None:
+            return
+
+        self.standby_components.pop(component.component_id, None)
+        self.standby_components[component.component_id] = component
+        while (len(self.standby_components) > self.MAX_STANDBY_COMPONENTS or
+               sum(c.STANDBY_MEMORY for c in self.standby_components.values()) > self.STANDBY_MEMORY_BUDGET):
+            component_id, evicted = self.standby_components.popitem(last=False)
+            logger.debug("Stopping component in standby: %s", component_id)
+            evicted.stop()
+
+    def clear_gestures(self, component):
+        """
+        Drop the gestures still queued for the component, they must not be
+        handled once it's no longer active.
+        """
+        dispatcher = self.gesture_dispatchers.get(component.component_id)
+        if dispatcher:
+            dispatcher.clear()
 
     def show_active_component(self):
         if self.active_component:
@@ -342,36 +471,69 @@ class NuimoApp(NuimoControllerListener):
             msg = ipc_queue.get()
             if msg['method'] == 'set_components':
                 components = msg['components']
-                logger.info("IPC set_components() received: %s mac = %s", components, self.controller.mac_address)
-                component_instances = get_component_instances(components, self.controller.mac_address)
-                self.set_components(component_instances)
+                logger.info("IPC set_components() received: %s mac = %s", components, self.mac_address)
+                self.update_components(components)
             elif msg['method'] == 'stop':
-                logger.info("IPC stop() received %s", self.controller.mac_address)
+                logger.info("IPC stop() received %s", self.mac_address)
                 self.stop()
                 return
 
+    def update_components(self, components):
+        """
+        Apply changed component configurations, see `get_component_instances()`.
+        """
+        component_instances = get_component_instances(components, self.mac_address, self.components)
+        self.set_components(component_instances)
+
     def update_battery_level(self):
-        self.bl.value = self.battery_level
+        self.status.update(battery_level=self.battery_level)
 
 
-def get_component_instances(components, mac_address):
+def get_component_instances(components, mac_address, instances=()):
     """
     Import component modules configured in the Nuimo app configuration
     and return instances of the contained component classes.
+
+    Instances passed in `instances` are reused if their configuration
+    didn't change or if they can apply the changes in place. Only
+    components that were added or changed otherwise are created.
     """
     module_name_format = __name__ + '.components.{}'
 
+    existing_instances = {i.component_id: i for i in instances}
+    reused_instances = {}
+    for component in components:
+        instance = existing_instances.get(component['id'])
+        if instance is None:
+            continue
+
+        changed_keys = {k for k in set(instance.config) | set(component) if instance.config.get(k) != component.get(k)}
+        if not changed_keys:
+            reused_instances[component['id']] = instance
+        elif instance.reconfigure(component, changed_keys):
+            logger.info("Reconfigured component %s in place: %s", component['id'], changed_keys)
+            instance.config = dict(component)
+            reused_instances[component['id']] = instance
+
+    # The first Philips Hue component deletes groups left behind by previous
+    # instances, which must not happen while a Hue component is kept alive
+    first = not any(i.config['type'] == 'philips_hue' for i in reused_instances.values())
+
     instances = []
-    first = True
     for component in components:
+        if component['id'] in reused_instances:
+            instances.append(reused_instances[component['id']])
+            continue
+
         module_name = module_name_format.format(component['type'])
+        component_config = dict(component)
         # TODO: philips hue related fix for delete groups - would be better to keep separation of concerns
-        component['nuimo_mac_address'] = mac_address
+        component_config['nuimo_mac_address'] = mac_address
         if component['type'] == 'philips_hue' and first is True:
-            component['first'] = True
+            component_config['first'] = True
             first = False
         else:
-            component['first'] = False
+            component_config['first'] = False
 
         # join Sonos speakers
         join = component.get('join', None)
@@ -381,7 +543,9 @@ def get_component_instances(components, mac_address):
         # FIXME: don't ignore errors, this is just a workaround!
         try:
             component_module = import_module(module_name)
-            instances.append(component_module.Component(component))
+            instance = component_module.Component(component_config)
+            instance.config = dict(component)
+            instances.append(instance)
         except Exception as e:
             logger.error("Error during import: %s", e)
 
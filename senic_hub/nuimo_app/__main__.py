@@ -6,7 +6,6 @@ import yaml
 import configparser
 
 from threading import Thread
-from multiprocessing import Process, Queue
 
 import click
 import platform
@@ -15,7 +14,8 @@ if platform.system() == 'Linux':
     import pyinotify
 
 
-from . import NuimoApp
+from .components.philips_hue_mirror import enable_event_streams
+from .engine import NuimoEngine, ProcessEngine
 
 import multiprocessing_logging
 multiprocessing_logging.install_mp_handler()
@@ -62,10 +62,13 @@ def main(config, verbose):
     # Here config_path references nuimo_app.cfg
     config_path = config_parser['app:senic_hub']['nuimo_app_config_path']
     ble_adapter_name = config_parser['app:senic_hub']['bluetooth_adapter_name']
-
-    nuimo_apps = {}
-    queues = {}
-    processes = {}
+    # running every Nuimo app in a dedicated process is only a fallback
+    # in case a single main loop can't handle all Nuimos
+    process_per_nuimo = config_parser['app:senic_hub'].getboolean('nuimo_app_process_per_nuimo', False)
+    # changes of Philips Hue lights made by other apps are received from the
+    # bridges' event streams instead of only polling the lights
+    if config_parser['app:senic_hub'].getboolean('nuimo_app_hue_event_stream', False):
+        enable_event_streams()
 
     # nuimo_app can't progress unless /data/senic-hub/nuimo_app.cfg present.
     # A poor man's waiting loop
@@ -96,97 +99,94 @@ def main(config, verbose):
 
     logger.info("Detected %s for %s..." % (ip, adapter_name))
 
-    update_from_config_file(config_path, queues, nuimo_apps, processes, ble_adapter_name)
-
-    logger.info("Watching %s for changes" % config_path)
-    watch_config_thread = Thread(
-        target=watch_config_changes,
-        name="watch_config_thread",
-        args=(config_path, queues, nuimo_apps, processes, ble_adapter_name),
-        daemon=True)
-    logger.debug("Started thread %s" % watch_config_thread.name)
-    watch_config_thread.start()
+    start_time = time.time()
+    engine = ProcessEngine(ble_adapter_name) if process_per_nuimo else NuimoEngine(ble_adapter_name)
 
     try:
         with open(config_path, 'r') as f:
             config = yaml.load(f)
         for mac_addr in config['nuimos']:
             components = config['nuimos'][mac_addr].get('components', [])
-            app = NuimoApp(ble_adapter_name, mac_addr, components)
-            ipc_queue = Queue()
-            queues[mac_addr] = ipc_queue
-            nuimo_apps[mac_addr] = components
-            # [Alan] For each nuimo a separate process is spawned
-            # This is required because this NuimoApp instance is executed
-            # in its own process (because gatt-python doesn't handle multiple
-            # devices in a single thread correctly) and it needs to be notified
-            # of changes and when to quit
-
-            processes[mac_addr] = Process(name="nuimo-%s" % mac_addr,
-                                          target=app.start,
-                                          args=(ipc_queue,),
-                                          daemon=True)
-            logger.debug("Starting nuimo BT control process %s"
-                         % processes[mac_addr].name)
-            processes[mac_addr].start()
+            engine.add(mac_addr, components)
 
     except FileNotFoundError as e:
         logger.error(e)
 
-    while True:
-        try:
-            time.sleep(1)
-        except KeyboardInterrupt:
-            logger.info("Received SIGINT, stopping all nuimo apps...")
-            break
+    logger.info("Started %s for %d Nuimos in %.2f seconds using %d kB of memory",
+                type(engine).__name__, len(engine.components), time.time() - start_time, engine.get_rss())
 
-    for mac_addr in queues.keys():
-        queues[mac_addr].put({'method': 'stop'})
-        processes[mac_addr].join()
+    logger.info("Watching %s for changes" % config_path)
+    watch_config_thread = Thread(
+        target=watch_config_changes,
+        name="watch_config_thread",
+        args=(config_path, engine),
+        daemon=True)
+    logger.debug("Started thread %s" % watch_config_thread.name)
+    watch_config_thread.start()
+
+    try:
+        engine.run()
+    except KeyboardInterrupt:
+        logger.info("Received SIGINT, stopping all nuimo apps...")
+
+    engine.stop()
 
     os.system('systemctl restart bluetooth')
 
     logger.info("Stopped all nuimo apps")
 
 
-def update_from_config_file(config_path, queues, nuimo_apps, processes, ble_adapter_name):
+def update_from_config_file(config_path, engine):
     try:
         with open(config_path, 'r') as f:
             config = yaml.load(f)
 
         logger.debug("Loading config file %s = %s" % (config_path, config))
-        updated_nuimos = config['nuimos']
+        updated_nuimos = config.get('nuimos') or {}
 
-        # TODO: remove nuimos without restart nuimo_app code
+        # Only Nuimos that were added, removed or whose components changed
+        # are touched, all others keep their connection and components
+        for mac_addr in list(engine.components):
+            if mac_addr not in updated_nuimos:
+                logger.info("Removing app for Nuimo with address: %s", mac_addr)
+                engine.remove(mac_addr)
 
         for mac_addr in updated_nuimos.keys():
             components = updated_nuimos[mac_addr].get('components', [])
-            if mac_addr in nuimo_apps and components != nuimo_apps[mac_addr]:
-                logger.debug("nuimo_apps= %s", nuimo_apps[mac_addr])
+            if mac_addr not in engine.components:
+                logger.info("Adding app for Nuimo with address: %s", mac_addr)
+                engine.add(mac_addr, components)
+            elif components != engine.components[mac_addr]:
+                logger.debug("nuimo_apps= %s", engine.components[mac_addr])
                 logger.info("Updating app for Nuimo with address: %s", mac_addr)
-                queues[mac_addr].put({'method': 'set_components', 'components': components})
-                nuimo_apps[mac_addr] = components
-            # TODO: add nuimos without restart nuimo_app code
+                engine.set_components(mac_addr, components)
 
     except FileNotFoundError as e:
         logger.error(e)
 
 
-def watch_config_changes(config_path, queues, nuimo_apps, processes, ble_adapter_name):
+def watch_config_changes(config_path, engine):
+
+    config_path = os.path.abspath(config_path)
 
     class ModificationHandler(pyinotify.ProcessEvent):
 
         def process_IN_CLOSE_WRITE(self, event):
             if hasattr(event, 'pathname') and event.pathname == config_path:
                 logger.info("Config file was changed, reloading it...")
-                update_from_config_file(config_path, queues, nuimo_apps, processes, ble_adapter_name)
+                update_from_config_file(config_path, engine)
+
+        def process_IN_MOVED_TO(self, event):
+            # the backend writes a temporary file and atomically renames it
+            self.process_IN_CLOSE_WRITE(event)
 
     handler = ModificationHandler()
     watch_manager = pyinotify.WatchManager()
     notifier = pyinotify.Notifier(watch_manager, handler)
     # IN_CLOSE_WRITE is fired when the file was closed after modification
-    # in opposite to IN_MODIFY which is called for each partial write
-    watch_manager.add_watch(config_path, pyinotify.IN_CLOSE_WRITE)
+    # in opposite to IN_MODIFY which is called for each partial write.
+    # The directory is watched because the file is replaced on every change.
+    watch_manager.add_watch(os.path.dirname(config_path), pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO)
     logger.info("Listening to changes of: %s", config_path)
     notifier.loop()
     logger.info("Stopped listening to changes of: %s", config_path)
@@ -0,0 +1,43 @@
+"""
+BlueZ calls made over D-Bus directly as `gatt.DeviceManager` doesn't offer
+them, e.g. removing a device.
+"""
+import dbus
+
+
+BLUEZ_SERVICE_NAME = 'org.bluez'
+ADAPTER_INTERFACE = 'org.bluez.Adapter1'
+DEVICE_INTERFACE = 'org.bluez.Device1'
+OBJECT_MANAGER_INTERFACE = 'org.freedesktop.DBus.ObjectManager'
+
+
+def get_adapter_path(adapter_name):
+    return '/org/bluez/' + adapter_name
+
+
+def get_device_path(adapter_name, mac_address):
+    return '%s/dev_%s' % (get_adapter_path(adapter_name), mac_address.replace(':', '_').upper())
+
+
+def remove_device(adapter_name, mac_address):
+    """
+    Remove the device from BlueZ, it has to be discovered again to be used.
+    """
+    bus = dbus.SystemBus()
+    adapter = dbus.Interface(bus.get_object(BLUEZ_SERVICE_NAME, get_adapter_path(adapter_name)), ADAPTER_INTERFACE)
+    adapter.RemoveDevice(get_device_path(adapter_name, mac_address))
+
+
+def get_device_mac_addresses(adapter_name):
+    """
+    Return the MAC addresses of all devices currently known to BlueZ.
+    Unlike `gatt.DeviceManager.devices()` removed devices aren't included.
+    """
+    bus = dbus.SystemBus()
+    object_manager = dbus.Interface(bus.get_object(BLUEZ_SERVICE_NAME, '/'), OBJECT_MANAGER_INTERFACE)
+    adapter_path = get_adapter_path(adapter_name) + '/'
+    return [
+        str(interfaces[DEVICE_INTERFACE]['Address'])
+        for path, interfaces in object_manager.GetManagedObjects().items()
+        if path.startswith(adapter_path) and DEVICE_INTERFACE in interfaces
+    ]
@@ -1,6 +1,6 @@
 import logging
 
-from threading import Thread
+from threading import Event, Thread, current_thread
 from .. import matrices
 
 
@@ -11,20 +11,51 @@ def clamp_value(value, range_):
     return min(max(value, range_.start), range_.stop)
 
 
+STATION_KEYS = frozenset(['station1', 'station2', 'station3'])
+
+
 class BaseComponent:
     MATRIX = matrices.ERROR
 
+    # configuration keys that can be changed without creating a new instance
+    RECONFIGURABLE_KEYS = frozenset()
+
+    # rough estimate in kB of the memory a component keeps using in
+    # standby, None if it's stopped instead, see `standby()`
+    STANDBY_MEMORY = None
+
     def __init__(self, component_config):
         self.component_id = component_config['id']
         self.ip_address = component_config.get('ip_address', None)
         self.stopped = True
 
+    def reconfigure(self, component_config, changed_keys):
+        """
+        Apply the changed configuration keys to the running instance.
+        Returns False if the changes require creating a new instance.
+        """
+        return changed_keys <= self.RECONFIGURABLE_KEYS
+
     def start(self):
         self.stopped = False
 
     def stop(self):
         self.stopped = True
 
+    def standby(self):
+        """
+        Deactivate the component but keep it ready to be started again
+        instantly, e.g. keep receiving device events. Components that don't
+        support standby are stopped.
+        """
+        self.stop()
+
+    def notify_activity(self):
+        """
+        Called whenever a gesture is handed to the component.
+        """
+        pass
+
     def on_longtouch_left(self):
         pass
 
@@ -36,18 +67,80 @@ class BaseComponent:
 
 
 class ThreadComponent(BaseComponent):
+    RECONFIGURABLE_KEYS = frozenset(['name'])
+
+    # how often to sync with the device right after a gesture, the interval
+    # doubles with every sync while the Nuimo isn't touched, see `wait_for_sync()`
+    ACTIVE_SYNC_INTERVAL = 1  # second
+    MAX_BACKOFF_STEPS = 16
+
     def __init__(self, component_config):
         super().__init__(component_config)
         self.thread = None
         self.component_name = component_config['name']
+        # set when the component is stopped, allows `run()` to wait without polling
+        self.stop_event = Event()
+        # set when the component is stopped or touched, interrupts `wait_for_sync()`
+        self.wakeup_event = Event()
+        self.idle_syncs = 0
+        self.current_sync_interval = self.ACTIVE_SYNC_INTERVAL
+
+    def reconfigure(self, component_config, changed_keys):
+        if not super().reconfigure(component_config, changed_keys):
+            return False
+
+        self.component_name = component_config['name']
+        if self.thread:
+            self.thread.name = self.component_name
+        return True
 
     def start(self):
+        if self.thread is not None and self.thread.is_alive() and not self.stop_event.is_set():
+            return
+
         super().start()
+        # every run gets its own events, a previous run that didn't notice
+        # being stopped yet must not be resumed by this one
+        self.stop_event = Event()
+        self.wakeup_event = Event()
+        # being activated counts as activity
+        self.idle_syncs = 0
+        self.current_sync_interval = self.ACTIVE_SYNC_INTERVAL
         self.thread = Thread(target=self._run,
                              name=self.component_name,
                              daemon=True)
         self.thread.start()
 
+    def stop(self):
+        super().stop()
+        self.stop_event.set()
+        self.wakeup_event.set()
+
+    def notify_activity(self):
+        self.idle_syncs = 0
+        self.wakeup_event.set()
+
+    def wait_for_sync(self, max_interval):
+        """
+        Wait until the component should sync with its device again: after
+        `ACTIVE_SYNC_INTERVAL` following a gesture, backing off exponentially
+        up to `max_interval` while idle. Returns False once the component was
+        stopped, which suspends syncing until it's active again.
+        """
+        while True:
+            # a previous run ends even if the component was started again
+            if self.thread is not None and current_thread() is not self.thread:
+                return False
+
+            self.wakeup_event.clear()
+            if self.stop_event.is_set():
+                return False
+
+            interval = self.current_sync_interval = min(max_interval, self.ACTIVE_SYNC_INTERVAL * 2 ** self.idle_syncs)
+            if not self.wakeup_event.wait(interval):
+                self.idle_syncs = min(self.idle_syncs + 1, self.MAX_BACKOFF_STEPS)
+                return not self.stop_event.is_set()
+
     def _run(self):
         try:
             self.run()
@@ -55,7 +148,8 @@ class ThreadComponent(BaseComponent):
             logger.error("Failure while running component '%s'")
             logger.exception(e)
         finally:
-            self.stopped = True
+            if current_thread() is self.thread:
+                self.stopped = True
 
     def run(self):
         """
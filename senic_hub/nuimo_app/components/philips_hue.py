@@ -1,13 +1,17 @@
+import json
 import logging
 
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pformat
-from time import sleep, time
+from threading import Lock
+from time import time
 from random import random
 from . import custom_phue_scenes as cps
 
-from phue import Bridge
-
-from . import ThreadComponent, clamp_value
+from . import STATION_KEYS, ThreadComponent, clamp_value
+from .philips_hue_mirror import MAX_AGE, get_light_state_mirror
+from .philips_hue_scheduler import PRIORITY_BACKGROUND, get_command_scheduler
+from ...hue_transport import Bridge, HueTransport
 
 from .. import matrices
 
@@ -43,12 +47,15 @@ class HueBase:
         groups = self.bridge.get_group()
 
         if self.first:
+            deleted = False
             for v in groups.items():
                 if "Senic hub " in v[1]['name']:
                     if self.instance_id <= int(v[1]['name'].split()[-1]) < self.instance_id + 10:
                         self.delete_group(int(v[0]))
+                        deleted = True
 
-        groups = self.bridge.get_group()
+            if deleted:
+                groups = self.bridge.get_group()
 
         group_id = next((k for k, v in groups.items() if v['name'] == self.group_name), None)
         if not group_id:
@@ -154,7 +161,7 @@ class EmptyLightSet(HueBase):
     def update_interval(self):
         return 1
 
-    def update_state(self):
+    def update_state(self, max_age=MAX_AGE):
         pass
 
     def set_attributes(self, attributes):
@@ -176,16 +183,45 @@ class LightSet(HueBase):
 
     TRANSITION_TIME = 2  # * 100 milliseconds
 
+    # how many lights are updated concurrently when there's no group to use
+    MAX_CONCURRENT_REQUESTS = HueTransport.MAX_CONNECTIONS
+
+    def __init__(self, bridge, light_ids, instance_id, first):
+        super().__init__(bridge, light_ids, instance_id, first)
+        self._executor = None
+        # set when lights were changed by us, the mirror wouldn't report
+        # them as changed if they're changed back by someone else
+        self._modified = False
+        self.mirror = get_light_state_mirror(bridge)
+        self.mirror.subscribe(light_ids, self.update_state_from_lights)
+
     @property
     def update_interval(self):
         return 0.1
 
-    def update_state(self):
+    @property
+    def sync_interval(self):
         """
-        Get current state of all the lights from the bridge
+        How often to sync with the bridge to detect changes made by
+        external apps, rarely if they're received from its event stream.
         """
-        response = self.bridge.get_light()
-        self._state = {k: v['state'] for k, v in response.items() if k in self.light_ids}
+        return self.mirror.sync_interval
+
+    def update_state(self, max_age=MAX_AGE):
+        """
+        Get current state of all the lights from the bridge, shared with
+        all other light sets of the bridge
+        """
+        lights = self.mirror.poll(max_age)
+        if self._modified:
+            self.update_state_from_lights({k: v['state'] for k, v in lights.items() if k in self.light_ids})
+
+    def update_state_from_lights(self, states):
+        self._modified = False
+        if not states:
+            return
+
+        self._state = states
 
         logger.debug("state: %s", pformat(self._state))
 
@@ -196,51 +232,52 @@ class LightSet(HueBase):
 
         logger.debug("on: %s brightness: %s", self._on, self._brightness)
 
+    def update_state_from_response(self, response):
+        super().update_state_from_response(response)
+        self._modified = True
+
     def set_attributes(self, attributes):
-        # Send ON/OFF  to a group instead lights separately for a nicer UX
-        if self.group_id is not None and 'on' in attributes and len(attributes) == 1:
+        # Send changes of multiple lights with a single request to their group
+        # which also changes them simultaneously for a nicer UX
+        if self.group_id is not None:
             responses = self.bridge.set_group(self.group_id, attributes, transitiontime=self.TRANSITION_TIME)
             return self.parse_responses(responses, attributes)
 
-        for light_id in self.light_ids:
-            responses = self.bridge.set_light(int(light_id), attributes, transitiontime=self.TRANSITION_TIME)
-            response = self.parse_responses(responses, attributes)
-            if 'errors' in response:
-                # exit early if a call fails
-                return response
+        if len(self.light_ids) == 1:
+            responses = self.bridge.set_light(int(self.light_ids[0]), attributes, transitiontime=self.TRANSITION_TIME)
+            return self.parse_responses(responses, attributes)
 
-        return response
+        return self.parse_responses(self.set_lights_concurrently(attributes), attributes)
+
+    def set_lights_concurrently(self, attributes):
+        """
+        Send attributes to every light with concurrent requests over the
+        bridge's pool of keep-alive connections. Returns the responses of all
+        lights merged into the format returned by `Bridge.set_light()`.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT_REQUESTS)
+
+        data = json.dumps(dict(attributes, transitiontime=self.TRANSITION_TIME))
+        path_format = '/api/{}/lights/{{}}/state'.format(self.bridge.username)
+
+        def set_light(light_id):
+            return self.bridge.transport.request('PUT', path_format.format(light_id), data).json()
 
+        responses = self._executor.map(set_light, self.light_ids)
+        return [[r for response in responses for r in response]]
 
-class Group(HueBase):
+
+class Group(LightSet):
     """
-    Wraps a Philips Hue group
+    Wraps a Philips Hue group of many lights, all changes are sent to the
+    group
     """
 
-    TRANSITION_TIME = 2  # * 100 ms
-
     @property
     def update_interval(self):
         return 1  # second
 
-    def update_state(self):
-        """
-        Get current state of the group from the bridge
-        """
-        state = self.bridge.get_group(self.group_id)
-
-        logger.debug("group state: %s", pformat(state))
-
-        self._on = state['state']['all_on']
-        if self._on or state['action']['bri'] != 1 or self._brightness is None:
-            self._brightness = state['action']['bri']
-
-        self._state = state
-
-    def set_attributes(self, attributes):
-        responses = self.bridge.set_group(self.group_id, attributes, transitiontime=self.TRANSITION_TIME)
-        return self.parse_responses(responses, attributes)
-
 
 hue_instances = {}
 mac_idx = 0
@@ -250,10 +287,13 @@ class Component(ThreadComponent):
     MATRIX = matrices.LIGHT_BULB
     TRANSITION_TIME = 2  # * 100 milliseconds
 
+    RECONFIGURABLE_KEYS = ThreadComponent.RECONFIGURABLE_KEYS | STATION_KEYS
+
     def __init__(self, component_config):
         super().__init__(component_config)
 
         self.bridge = Bridge(component_config['ip_address'], component_config['username'])
+        self.scheduler = get_command_scheduler(self.bridge)
         self.id = component_config['id']
         self.group_num = None
         self.scenes = {}
@@ -281,11 +321,15 @@ class Component(ThreadComponent):
         self.group_num = hue_instances[self.nuimo_mac_address][self.id]
         self.delta_range = range(-254, 254)
         self.delta = 0
+        # rotations are added on the gesture thread and sent on the scheduler's
+        self.delta_lock = Lock()
+        self.last_update_time = 0
 
         # Extract light IDs, they are stored with format `<bridgeID>-light-<lightID>`
         self.light_ids = component_config['device_ids']
         self.light_ids = [i.split('-light-')[1].strip() for i in self.light_ids]
 
+        self.mirror = get_light_state_mirror(self.bridge)
         self.lights = self.create_lights(self.light_ids)
         self.lights.update_state()
 
@@ -309,6 +353,19 @@ class Component(ThreadComponent):
                     self.station_id_2 = {'name': self.scenes[scene]['name']} if self.scenes[scene]['name'] == 'Relax' else self.station_id_2
                     self.station_id_3 = {'name': self.scenes[scene]['name']} if self.scenes[scene]['name'] == 'Concentrate' else self.station_id_3
 
+    def reconfigure(self, component_config, changed_keys):
+        stations = [component_config.get(k, None) for k in ('station1', 'station2', 'station3')]
+        if changed_keys & STATION_KEYS and not any(stations):
+            # default stations are only looked up when creating the component
+            return False
+
+        if not super().reconfigure(component_config, changed_keys):
+            return False
+
+        if changed_keys & STATION_KEYS:
+            self.station_id_1, self.station_id_2, self.station_id_3 = stations
+        return True
+
     def create_lights(self, light_ids):
         reachable_lights = None
         try:
@@ -328,31 +385,36 @@ class Component(ThreadComponent):
         return lights
 
     def filter_reachable(self, light_ids):
-        lights = self.bridge.get_light()
+        lights = self.mirror.poll()
         reachable = [i for i in light_ids if i in lights and lights[i]['state']['reachable']]
         logger.debug("lights: %s reachable: %s", list(lights.keys()), reachable)
         return reachable
 
     def on_button_press(self):
-        self.set_light_attributes(on=not self.lights.on, bri=self.lights.brightness)
+        # toggling isn't superseded by a subsequent toggle
+        self.scheduler.submit(None, lambda: self.set_light_attributes(on=not self.lights.on, bri=self.lights.brightness))
 
     def on_longtouch_left(self):
         logger.debug("on_longtouch_left()")
         if self.station_id_1 is not None:
-            self.set_station(1, self.station_id_1['name'])
-            self.nuimo.display_matrix(matrices.STATION1)
+            self.submit_station(1, self.station_id_1['name'], matrices.STATION1)
 
     def on_longtouch_bottom(self):
         logger.debug("on_longtouch_bottom()")
         if self.station_id_2 is not None:
-            self.set_station(2, self.station_id_2['name'])
-            self.nuimo.display_matrix(matrices.STATION2)
+            self.submit_station(2, self.station_id_2['name'], matrices.STATION2)
 
     def on_longtouch_right(self):
         logger.debug("on_longtouch_right()")
         if self.station_id_3 is not None:
-            self.set_station(3, self.station_id_3['name'])
-            self.nuimo.display_matrix(matrices.STATION3)
+            self.submit_station(3, self.station_id_3['name'], matrices.STATION3)
+
+    def submit_station(self, station_number, station_name, matrix):
+        def set_station():
+            self.set_station(station_number, station_name)
+            self.nuimo.display_matrix(matrix)
+
+        self.scheduler.submit(('station', self.id), set_station)
 
     def set_light_attributes(self, **attributes):
         response = self.lights.set_attributes(attributes)
@@ -385,39 +447,37 @@ class Component(ThreadComponent):
                 self.set_light_attributes(on=False)
 
     def on_swipe_left(self):
-        self.set_light_attributes(on=True, bri=self.lights.brightness, xy=COLOR_WHITE_XY)
+        self.scheduler.submit(('color', self.id), lambda: self.set_light_attributes(on=True, bri=self.lights.brightness, xy=COLOR_WHITE_XY))
 
     def on_swipe_right(self):
-        self.set_light_attributes(on=True, xy=(random(), random()))
+        self.scheduler.submit(('color', self.id), lambda: self.set_light_attributes(on=True, xy=(random(), random())))
 
     def on_rotation(self, value):
-        self.delta += value
+        with self.delta_lock:
+            self.delta += value
+        # rotation updates are coalesced until they're sent, `send_updates()` sends the accumulated delta
+        delay = max(0, self.last_update_time + self.lights.update_interval - time())
+        self.scheduler.submit(('rotation', self.id), self.send_updates, delay=delay)
 
     def run(self):
-        prev_sync_time = time()
-        prev_update_time = time()
-
-        while not self.stopped:
-            now = time()
-
-            if self.delta and now - prev_update_time >= self.lights.update_interval:
-                self.send_updates()
-                self.delta = 0
-
-                prev_update_time = now
+        # lights may have been changed while the component wasn't active
+        self.scheduler.submit(('sync', self.id), self.update_state, PRIORITY_BACKGROUND)
+        while self.wait_for_sync(self.lights.sync_interval):
+            # the state is up to date while commands are sent
+            if time() - self.last_update_time >= self.ACTIVE_SYNC_INTERVAL:
+                self.scheduler.submit(('sync', self.id), self.update_state, PRIORITY_BACKGROUND)
+                logger.debug("Philips Hue commands: %s", self.scheduler.metrics())
+                logger.debug("Philips Hue connections: %s", self.bridge.transport.metrics())
 
-            if now - max([prev_sync_time, prev_update_time]) >= self.lights.sync_interval:
-                try:
-                    self.lights.update_state()
-                except ConnectionResetError:
-                    # TODO: add a library wrapper to handle the issue properly, this is a workaround
-                    logger.error("connection with Hue Bridge reset by peer, handle exception")
-                except socket.error as socketerror:
-                    logger.error("Socket Error: ", socketerror)
-
-                prev_sync_time = now
-
-            sleep(0.05)
+    def update_state(self):
+        try:
+            # lights synced by other components within the interval are reused
+            self.lights.update_state(max_age=self.current_sync_interval)
+        except ConnectionResetError:
+            # TODO: add a library wrapper to handle the issue properly, this is a workaround
+            logger.error("connection with Hue Bridge reset by peer, handle exception")
+        except socket.error as socketerror:
+            logger.error("Socket Error: ", socketerror)
 
     def set_station(self, station_number, station_name):
         light_attr = cps.CUSTOM_SCENES['scenes'][station_name]['lightstates']
@@ -427,7 +487,13 @@ class Component(ThreadComponent):
             self.bridge.set_light(int(l), light_attr, transitiontime=self.TRANSITION_TIME)
 
     def send_updates(self):
-        delta = round(clamp_value(self.delta_range.stop * self.delta, self.delta_range))
+        self.last_update_time = time()
+        with self.delta_lock:
+            delta, self.delta = self.delta, 0
+        if not delta:
+            return
+
+        delta = round(clamp_value(self.delta_range.stop * delta, self.delta_range))
 
         if self.lights.on:
             self.set_light_attributes(bri_inc=delta)
@@ -0,0 +1,127 @@
+"""
+Ingests the event stream of Philips Hue bridges supporting it (API v2), so
+that changes made by other apps are applied to the mirrored lights right
+away instead of with the next poll.
+
+Bridges with older firmware don't have an event stream, the lights are
+polled as before then, see `LightStateMirror.sync_interval`.
+"""
+import json
+import logging
+
+from threading import Event, Thread
+
+from requests import Session
+from requests.exceptions import RequestException
+
+
+logger = logging.getLogger(__name__)
+
+
+EVENT_STREAM_PATH = '/eventstream/clip/v2'
+
+
+class EventStream:
+
+    CONNECT_TIMEOUT = 5  # seconds
+
+    # the bridge sends no keep-alive messages, a connection that died
+    # silently is noticed by the mirror's polling in the meantime
+    READ_TIMEOUT = 10 * 60  # seconds
+
+    RECONNECT_DELAY = 5  # seconds
+
+    # how long to wait before asking a bridge without event stream again,
+    # e.g. in case its firmware was updated
+    UNSUPPORTED_RETRY_DELAY = 60 * 60  # seconds
+
+    def __init__(self, mirror, url=None):
+        self.mirror = mirror
+        self.url = url or 'https://{}{}'.format(mirror.bridge.ip, EVENT_STREAM_PATH)
+        self.connected = False
+        self.supported = None
+        self.stop_event = Event()
+        self.thread = None
+        # the stream isn't sent through the bridge's `HueTransport` as it
+        # would occupy one of its pooled connections all the time
+        self._session = Session()
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = Thread(target=self.run, name='Philips Hue events ' + self.mirror.bridge.ip, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # takes effect with the next event or when the read times out
+        self.stop_event.set()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.consume()
+            except (RequestException, ValueError) as e:
+                if not self.stop_event.is_set():
+                    logger.warning("Philips Hue event stream of %s failed: %s", self.mirror.bridge.ip, e)
+            finally:
+                self.connected = False
+
+            self.stop_event.wait(self.RECONNECT_DELAY if self.supported is not False else self.UNSUPPORTED_RETRY_DELAY)
+
+    def consume(self):
+        """
+        Connect to the event stream and apply its events until it's closed.
+        """
+        # the bridge uses a certificate signed by Philips' own authority
+        response = self._session.get(
+            self.url,
+            headers={'hue-application-key': self.mirror.bridge.username, 'Accept': 'text/event-stream'},
+            stream=True,
+            verify=False,
+            timeout=(self.CONNECT_TIMEOUT, self.READ_TIMEOUT))
+
+        with response:
+            if response.status_code != 200:
+                self.supported = False
+                logger.info("%s has no event stream (%d), polling its lights", self.mirror.bridge.ip, response.status_code)
+                return
+
+            self.supported = self.connected = True
+            logger.info("Receiving events of %s", self.mirror.bridge.ip)
+            # read byte by byte, larger chunks would delay events until
+            # following events filled them
+            for line in response.iter_lines(chunk_size=1):
+                if self.stop_event.is_set():
+                    return
+                if line.startswith(b'data:'):
+                    self.mirror.update_states(parse_light_states(json.loads(line[5:].decode('utf-8'))))
+
+
+def parse_light_states(events):
+    """
+    Return the changed light states contained in a message of the event
+    stream by light id, in the format of API v1 used by `phue`.
+    """
+    states = {}
+    for event in events:
+        if event.get('type') != 'update':
+            continue
+
+        for resource in event.get('data', []):
+            owner, _, light_id = resource.get('id_v1', '').rpartition('/')
+            if owner != '/lights':
+                continue
+
+            state = {}
+            if resource['type'] == 'light':
+                if 'on' in resource:
+                    state['on'] = resource['on']['on']
+                if 'dimming' in resource:
+                    # percentage of API v2 to the range of API v1
+                    state['bri'] = max(1, round(resource['dimming']['brightness'] * 254 / 100))
+            elif resource['type'] == 'zigbee_connectivity':
+                state['reachable'] = resource['status'] == 'connected'
+
+            if state:
+                states.setdefault(light_id, {}).update(state)
+
+    return states
@@ -0,0 +1,143 @@
+"""
+Mirror of the lights of a Philips Hue bridge shared by all components
+controlling lights of the bridge.
+
+Instead of every component fetching all lights of the bridge to read the
+state of a few of them, the lights are fetched once per `MAX_AGE` and
+the new snapshot is compared with the previous one. Components subscribe
+to the lights they control and are only called back when one of them
+changed.
+
+Optionally the event stream of the bridge is ingested too, see
+`enable_event_streams()`. While it's connected changes are applied as
+soon as they happen and the lights are polled much less often.
+"""
+import logging
+
+from threading import Lock
+from time import time
+from weakref import WeakMethod
+
+from .philips_hue_events import EventStream
+
+
+logger = logging.getLogger(__name__)
+
+
+# how old a snapshot of the lights may be to be used instead of fetching
+# them again, matches how often components sync with the bridge
+MAX_AGE = 5  # seconds
+
+# how often components sync while the event stream is connected, only to
+# recover from events that were missed
+STREAMING_SYNC_INTERVAL = 60  # seconds
+
+
+class LightStateMirror:
+
+    def __init__(self, bridge):
+        self.bridge = bridge
+        # light id -> light as returned by `Bridge.get_light()`
+        self.lights = {}
+        self.poll_time = None
+        self.event_stream = None
+        self._subscribers = []
+        self._lock = Lock()
+        self._poll_lock = Lock()
+
+    @property
+    def sync_interval(self):
+        """
+        How often components should sync with the bridge.
+        """
+        if self.event_stream is not None and self.event_stream.connected:
+            return STREAMING_SYNC_INTERVAL
+        return MAX_AGE
+
+    def subscribe(self, light_ids, callback):
+        """
+        Call `callback` with the states of the given lights by light id
+        whenever any of them changed, and right away if the lights were
+        already fetched. `callback` must be a bound method, it's dropped
+        together with its instance.
+        """
+        with self._lock:
+            self._subscribers.append((frozenset(light_ids), WeakMethod(callback)))
+            lights = self.lights
+
+        if lights:
+            callback(self._states(lights, light_ids))
+
+    def poll(self, max_age=MAX_AGE):
+        """
+        Fetch the lights unless they were fetched within `max_age` seconds
+        and notify the subscribers of changed lights. Returns all lights.
+        """
+        with self._poll_lock:
+            if self.poll_time is not None and time() - self.poll_time < max_age:
+                return self.lights
+
+            lights = self.bridge.get_light()
+            self.poll_time = time()
+            self._replace(lights)
+
+        return lights
+
+    def update_states(self, states):
+        """
+        Apply the changed states of lights by light id, e.g. received from
+        the event stream, and notify the subscribers of changed lights.
+        """
+        with self._poll_lock:
+            lights = dict(self.lights)
+            for light_id, state in states.items():
+                if light_id in lights:
+                    lights[light_id] = dict(lights[light_id], state=dict(lights[light_id]['state'], **state))
+            self._replace(lights)
+
+    def _replace(self, lights):
+        with self._lock:
+            changed = {i for i in lights.keys() | self.lights.keys() if lights.get(i) != self.lights.get(i)}
+            self.lights = lights
+            self._subscribers = [(ids, ref) for ids, ref in self._subscribers if ref() is not None]
+            subscribers = list(self._subscribers)
+
+        if changed:
+            logger.debug("Lights changed on %s: %s", self.bridge.ip, sorted(changed))
+
+        for light_ids, ref in subscribers:
+            callback = ref()
+            if callback is not None and light_ids & changed:
+                callback(self._states(lights, light_ids))
+
+    @staticmethod
+    def _states(lights, light_ids):
+        return {i: lights[i]['state'] for i in light_ids if i in lights}
+
+
+_mirrors = {}
+_mirrors_lock = Lock()
+_event_streams_enabled = False
+
+
+def enable_event_streams(enabled=True):
+    """
+    Ingest the event streams of bridges whose mirror is created from now on.
+    """
+    global _event_streams_enabled
+    _event_streams_enabled = enabled
+
+
+def get_light_state_mirror(bridge):
+    """
+    Return the mirror of the lights of the given bridge.
+    """
+    with _mirrors_lock:
+        key = (bridge.ip, bridge.username)
+        mirror = _mirrors.get(key)
+        if mirror is None:
+            mirror = _mirrors[key] = LightStateMirror(bridge)
+            if _event_streams_enabled:
+                mirror.event_stream = EventStream(mirror)
+                mirror.event_stream.start()
+        return mirror
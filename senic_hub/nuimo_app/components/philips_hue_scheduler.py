@@ -0,0 +1,147 @@
+import logging
+
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from threading import Condition, Lock, Thread
+from time import time
+
+
+logger = logging.getLogger(__name__)
+
+
+PRIORITY_USER = 0
+PRIORITY_BACKGROUND = 1
+
+
+class CommandScheduler:
+    """
+    Sends commands to a Philips Hue bridge one after another from a single
+    thread, at most `MAX_COMMANDS_PER_SECOND` of them. A command may send
+    several requests (e.g. one per light), the rate of requests the bridge
+    receives is limited by `hue_transport.HueTransport`.
+
+    Commands are callables doing the actual requests. A pending command is
+    superseded by a command submitted with the same key, e.g. only the
+    latest brightness of a light matters. Commands with a higher priority
+    (user gestures) are sent before commands with a lower priority
+    (background state sync).
+    """
+
+    # keeps commands submitted in quick succession from queueing up in the
+    # transport where they can't be coalesced anymore
+    MAX_COMMANDS_PER_SECOND = 10
+
+    # how many command latencies are kept for the metrics
+    LATENCY_SAMPLES = 100
+
+    def __init__(self, name):
+        self.name = name
+        self.sent_count = 0
+        self.coalesced_count = 0
+        self._condition = Condition()
+        self._pending = OrderedDict()
+        self._latencies = deque(maxlen=self.LATENCY_SAMPLES)
+        self._last_command_time = 0
+        self._thread = None
+
+    def submit(self, key, function, priority=PRIORITY_USER, delay=0):
+        """
+        Queue `function` to be called by the scheduler thread not before
+        `delay` seconds from now. Returns a `Future` of its return value.
+
+        If a command with the same `key` is still pending, its function is
+        replaced and its future is returned instead. Commands with a `key`
+        of `None` are never superseded.
+        """
+        with self._condition:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+            command = self._pending.get(key) if key is not None else None
+            if command is not None:
+                command.function = function
+                command.priority = min(command.priority, priority)
+                self.coalesced_count += 1
+            else:
+                command = _Command(function, priority, time() + delay)
+                self._pending[key if key is not None else command] = command
+                self._condition.notify()
+
+            return command.future
+
+    def metrics(self):
+        """
+        Return the number of pending commands and latencies in seconds
+        between submitting and finishing the recent commands.
+        """
+        with self._condition:
+            latencies = list(self._latencies)
+            return {
+                'queue_depth': len(self._pending),
+                'sent': self.sent_count,
+                'coalesced': self.coalesced_count,
+                'latency_avg': sum(latencies) / len(latencies) if latencies else None,
+                'latency_max': max(latencies) if latencies else None,
+            }
+
+    def _run(self):
+        while True:
+            with self._condition:
+                command = self._next_command()
+
+            command.execute()
+
+            with self._condition:
+                self.sent_count += 1
+                self._latencies.append(time() - command.submit_time)
+
+    def _next_command(self):
+        while True:
+            now = time()
+            ready = [(k, c) for k, c in self._pending.items() if c.ready_time <= now]
+            if ready:
+                timeout = self._last_command_time + 1 / self.MAX_COMMANDS_PER_SECOND - now
+                if timeout <= 0:
+                    # min() returns the oldest of the commands with the highest priority
+                    key, command = min(ready, key=lambda item: item[1].priority)
+                    del self._pending[key]
+                    self._last_command_time = now
+                    return command
+            elif self._pending:
+                timeout = min(c.ready_time for c in self._pending.values()) - now
+            else:
+                timeout = None
+
+            self._condition.wait(timeout)
+
+
+class _Command:
+    def __init__(self, function, priority, ready_time):
+        self.function = function
+        self.priority = priority
+        self.ready_time = ready_time
+        self.submit_time = time()
+        self.future = Future()
+
+    def execute(self):
+        try:
+            self.future.set_result(self.function())
+        except Exception as e:
+            logger.exception("Philips Hue command failed")
+            self.future.set_exception(e)
+
+
+_schedulers = {}
+_schedulers_lock = Lock()
+
+
+def get_command_scheduler(bridge):
+    """
+    Return the scheduler of all commands sent to the given bridge.
+    """
+    with _schedulers_lock:
+        scheduler = _schedulers.get(bridge.ip)
+        if scheduler is None:
+            scheduler = _schedulers[bridge.ip] = CommandScheduler('Philips Hue ' + bridge.ip)
+        return scheduler
@@ -1,15 +1,19 @@
 import logging
 
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pformat
-from queue import Empty
+from queue import Queue
+from threading import Lock
 from time import time
 
+from requests.exceptions import RequestException
 from soco import SoCo, SoCoException
 from soco.events import event_listener
 
-from . import ThreadComponent, clamp_value
+from . import STATION_KEYS, ThreadComponent, clamp_value
 
 from .. import matrices
+from ..status import get_status_segment
 
 
 logger = logging.getLogger(__name__)
@@ -26,6 +30,11 @@ class Component(ThreadComponent):
     # receiving device state change events
     EVENT_IDLE_INTERVAL = 2  # seconds
 
+    RECONFIGURABLE_KEYS = ThreadComponent.RECONFIGURABLE_KEYS | STATION_KEYS | {'room_name', 'is_reachable'}
+
+    # the thread receiving events and the event subscriptions are kept alive
+    STANDBY_MEMORY = 64  # kB
+
     def __init__(self, component_config):
         super().__init__(component_config)
 
@@ -36,8 +45,18 @@ class Component(ThreadComponent):
         self.volume = None
         self.nuimo = None
         self.last_request_time = time()
+        self.events = Queue()
+        self.in_standby = False
 
         self.sonos_joined_controllers = []
+        # UIDs of the group members, known after the first topology event
+        self.group_members = None
+
+        # volumes waiting to be sent to the speakers, see `send_volume()`
+        self.volume_executor = None
+        self.volume_lock = Lock()
+        self.pending_volumes = {}
+        self.sending_volume = set()
 
         self.station_id_1 = component_config.get('station1', None)
         self.station_id_2 = component_config.get('station2', None)
@@ -58,44 +77,103 @@ class Component(ThreadComponent):
                 if sonos_controller.ip_address != component_config['ip_address'] and sonos_controller.player_name != self.sonos_controller.group.coordinator.player_name:
                     self.sonos_joined_controllers.append(SoCo(sonos_controller.ip_address))
 
-    def run(self):
-        self.subscribe_to_events()
-        self.update_state()
-        try:
-            self.run_loop()
-        finally:
-            self.unsubscribe_from_events()
+    def reconfigure(self, component_config, changed_keys):
+        stations = [component_config.get(k, None) for k in ('station1', 'station2', 'station3')]
+        if changed_keys & STATION_KEYS and not any(stations):
+            # default stations are only looked up when creating the component
+            return False
 
-    def run_loop(self):
-        while not self.stopped:
-            try:
-                event = self.av_transport_subscription.events.get(timeout=0.1)
+        if not super().reconfigure(component_config, changed_keys):
+            return False
 
-                if time() - self.last_request_time > self.EVENT_IDLE_INTERVAL:
-                    logger.debug("avTransport event: %s", pformat(event.variables))
-                    self.state = event.variables['transport_state']
-            except Empty:
-                pass
+        if changed_keys & STATION_KEYS:
+            self.station_id_1, self.station_id_2, self.station_id_3 = stations
+        return True
 
-            try:
-                event = self.rendering_control_subscription.events.get(timeout=0.1)
+    def start(self):
+        if self.in_standby and self.thread.is_alive():
+            # events were received in standby, the state is up to date
+            self.in_standby = False
+            self.stopped = False
+            return
+
+        self.in_standby = False
+        self.events = Queue()
+        super().start()
 
-                if time() - self.last_request_time > self.EVENT_IDLE_INTERVAL:
-                    logger.debug("renderingControl event: %s", pformat(event.variables))
-                    try:
-                        self.volume = int(event.variables['volume']['Master'])
-                    except:
-                        pass
-            except Empty:
-                pass
+    def standby(self):
+        self.in_standby = True
+        self.stopped = True
 
-    def subscribe_to_events(self):
-        self.av_transport_subscription = self.sonos_controller.avTransport.subscribe()
-        self.rendering_control_subscription = self.sonos_controller.renderingControl.subscribe()
+    def run(self):
+        # the queue and subscriptions of this run, the component may be
+        # started again before this run ended
+        events = self.events
+        subscriptions = self.subscribe_to_events(events)
+        self.update_state()
+        try:
+            self.run_loop(events)
+        finally:
+            self.unsubscribe_from_events(subscriptions)
+
+    def stop(self):
+        self.in_standby = False
+        super().stop()
+        # wake up `run_loop()`
+        self.events.put(None)
+
+    def run_loop(self, events):
+        while True:
+            event = events.get()
+            if event is None:
+                break
+
+            if time() - self.last_request_time <= self.EVENT_IDLE_INTERVAL:
+                continue
+
+            if event.sid == self.av_transport_subscription.sid:
+                logger.debug("avTransport event: %s", pformat(event.variables))
+                self.state = event.variables['transport_state']
+
+            elif event.sid == self.rendering_control_subscription.sid:
+                logger.debug("renderingControl event: %s", pformat(event.variables))
+                try:
+                    self.volume = int(event.variables['volume']['Master'])
+                except:
+                    pass
+
+            elif event.sid == self.zone_group_topology_subscription.sid:
+                logger.debug("zoneGroupTopology event")
+                self.update_group_members()
+
+    def subscribe_to_events(self, events):
+        # events of all subscriptions are put on the same queue so that
+        # `run_loop()` only wakes up when there is an event or it's stopped,
+        # subscriptions are renewed as they're kept while in standby
+        self.av_transport_subscription = self.sonos_controller.avTransport.subscribe(auto_renew=True, event_queue=events)
+        self.rendering_control_subscription = self.sonos_controller.renderingControl.subscribe(auto_renew=True, event_queue=events)
+        self.zone_group_topology_subscription = self.sonos_controller.zoneGroupTopology.subscribe(auto_renew=True, event_queue=events)
+        return (self.av_transport_subscription, self.rendering_control_subscription, self.zone_group_topology_subscription)
+
+    def unsubscribe_from_events(self, subscriptions):
+        for subscription in reversed(subscriptions):
+            subscription.unsubscribe()
+
+    def update_group_members(self):
+        """
+        Let the backend know when speakers joined or left the group of this
+        speaker, see `status.StatusSegment.wait_for_change()`.
+        """
+        try:
+            members = {m.uid for m in self.sonos_controller.group.members}
+        except (RequestException, SoCoException) as e:
+            logger.warning("Failed to get group of Sonos %s: %s", self.component_id, e)
+            return
 
-    def unsubscribe_from_events(self):
-        self.rendering_control_subscription.unsubscribe()
-        self.av_transport_subscription.unsubscribe()
+        if self.group_members is not None and members != self.group_members:
+            logger.info("Group of Sonos %s changed", self.component_id)
+            get_status_segment(writable=True).publish_change()
+        self.group_members = members
 
     def update_state(self):
         self.state = self.sonos_controller.get_current_transport_info()['current_transport_state']
@@ -104,26 +182,53 @@ class Component(ThreadComponent):
 
     def on_rotation(self, delta):
         if self.state is not None:
-            try:
-                delta = round(self.volume_range.stop * delta)
-                self.volume = clamp_value(self.volume + delta, self.volume_range)
-                self.sonos_controller.volume = self.volume
-                if self.sonos_joined_controllers != []:
-                    for sonos_joined_controller in self.sonos_joined_controllers:
-                        sonos_joined_controller.volume = self.volume
+            delta = round(self.volume_range.stop * delta)
+            self.volume = clamp_value(self.volume + delta, self.volume_range)
+            self.send_volume(self.volume)
 
-                logger.debug("volume update delta: %s volume: %s", delta, self.volume)
+            logger.debug("volume update delta: %s volume: %s", delta, self.volume)
 
-                matrix = matrices.progress_bar(self.volume / self.volume_range.stop)
-                self.nuimo.display_matrix(matrix, fading=True, ignore_duplicates=True)
-            except SoCoException:
-                self.nuimo.display_matrix(matrices.ERROR)
+            matrix = matrices.progress_bar(self.volume / self.volume_range.stop)
+            self.nuimo.display_matrix(matrix, fading=True, ignore_duplicates=True)
 
             self.last_request_time = time()
         else:
             self.nuimo.display_matrix(matrices.ERROR)
             logger.debug("No Active connection with Host")
 
+    def send_volume(self, volume):
+        """
+        Set the volume of the speaker and all joined speakers concurrently
+        without blocking. A speaker that is still busy with a previous
+        volume change only receives the latest volume afterwards.
+        """
+        controllers = [self.sonos_controller] + self.sonos_joined_controllers
+
+        with self.volume_lock:
+            if self.volume_executor is None:
+                self.volume_executor = ThreadPoolExecutor(max_workers=len(controllers))
+
+            for controller in controllers:
+                self.pending_volumes[controller] = volume
+                if controller not in self.sending_volume:
+                    self.sending_volume.add(controller)
+                    self.volume_executor.submit(self._send_pending_volumes, controller)
+
+    def _send_pending_volumes(self, controller):
+        while True:
+            with self.volume_lock:
+                if controller not in self.pending_volumes:
+                    self.sending_volume.remove(controller)
+                    return
+                volume = self.pending_volumes.pop(controller)
+
+            try:
+                controller.volume = volume
+            except Exception as e:
+                # a failure must not stop sending subsequent volumes
+                logger.error("Failed to set volume of %s: %s", controller.ip_address, e)
+                self.nuimo.display_matrix(matrices.ERROR)
+
     def on_button_press(self):
         if self.state == self.STATE_PLAYING:
             self.pause()
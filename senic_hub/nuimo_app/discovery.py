@@ -0,0 +1,33 @@
+import logging
+
+from threading import Lock
+
+
+logger = logging.getLogger(__name__)
+
+
+class SharedDiscovery:
+    """
+    Device discovery of a controller manager shared by several Nuimo apps
+    waiting for their Nuimo. Discovery is started by the first waiting app
+    and only stopped once the last one is done waiting.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.waiters = 0
+        self._lock = Lock()
+
+    def start(self):
+        with self._lock:
+            self.waiters += 1
+            if self.waiters == 1:
+                logger.debug("Starting discovery")
+                self.manager.start_discovery()
+
+    def stop(self):
+        with self._lock:
+            self.waiters -= 1
+            if self.waiters == 0:
+                logger.debug("Stopping discovery")
+                self.manager.stop_discovery()
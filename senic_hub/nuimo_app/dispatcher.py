@@ -0,0 +1,135 @@
+import logging
+
+from collections import deque
+from threading import Lock, Thread
+from time import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class GestureDispatcher:
+    """
+    Calls gesture handlers of a component one after another from a worker
+    thread, so that network requests made by components don't block the
+    Bluetooth main loop receiving further gestures.
+
+    The number of queued gestures is bounded: rotations are merged with a
+    rotation queued right before and other gestures are dropped while the
+    queue is full.
+
+    The metrics are logged every `METRICS_LOG_INTERVAL` handled gestures.
+    """
+
+    MAX_QUEUED_GESTURES = 8
+
+    # how many gesture latencies are kept for the metrics
+    LATENCY_SAMPLES = 100
+
+    METRICS_LOG_INTERVAL = 100  # gestures
+
+    def __init__(self, name):
+        self.name = name
+        self.merged_count = 0
+        self.dropped_count = 0
+        self.handled_count = 0
+        self._lock = Lock()
+        self._queue = deque()
+        self._latencies = deque(maxlen=self.LATENCY_SAMPLES)
+        self._worker = None
+
+    def dispatch(self, handler, *args, merge=False, received_time=None):
+        """
+        Queue a call of `handler` with `args`. If `merge` is set and a call of
+        the same handler is still queued, `args` are added to its arguments
+        instead, e.g. rotation deltas. Returns False if the call was dropped.
+
+        `received_time` is the time the gesture was received, used to
+        measure the latency until the handler returned.
+        """
+        received_time = received_time or time()
+
+        with self._lock:
+            # only merged with the last queued call, merging with an earlier
+            # one would reorder it with the gestures queued in between
+            if merge and self._queue:
+                call = self._queue[-1]
+                if call.merge and call.handler == handler:
+                    call.args = tuple(a + b for a, b in zip(call.args, args))
+                    self.merged_count += 1
+                    return True
+
+            if len(self._queue) >= self.MAX_QUEUED_GESTURES:
+                self.dropped_count += 1
+                logger.warning("%s is busy, dropping gesture %s", self.name, handler.__name__)
+                return False
+
+            self._queue.append(_Call(handler, args, merge, received_time))
+            if self._worker is None:
+                self._worker = Thread(target=self._run, name=self.name + " gestures", daemon=True)
+                self._worker.start()
+
+        return True
+
+    def clear(self):
+        """
+        Drop all queued gestures, e.g. when the component was deactivated. A
+        handler that is running already isn't interrupted.
+        """
+        with self._lock:
+            if self._queue:
+                logger.debug("Dropping %d queued gestures of %s", len(self._queue), self.name)
+            self.dropped_count += len(self._queue)
+            self._queue.clear()
+
+    def metrics(self):
+        """
+        Return the number of queued, merged and dropped gestures and
+        latencies in seconds between receiving the recent gestures and
+        their handlers returning.
+        """
+        with self._lock:
+            latencies = list(self._latencies)
+            return {
+                'queue_depth': len(self._queue),
+                'merged': self.merged_count,
+                'dropped': self.dropped_count,
+                'latency_avg': sum(latencies) / len(latencies) if latencies else None,
+                'latency_max': max(latencies) if latencies else None,
+            }
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    # a new worker is started for the next gesture
+                    self._worker = None
+                    return
+                call = self._queue.popleft()
+
+            try:
+                call.handler(*call.args)
+            except Exception:
+                logger.exception("Failure while handling gesture %s of %s", call.handler.__name__, self.name)
+
+            latency = time() - call.received_time
+            with self._lock:
+                self._latencies.append(latency)
+                self.handled_count += 1
+                log_metrics = self.handled_count % self.METRICS_LOG_INTERVAL == 0
+            logger.debug("%s handled %s after %.3f seconds", self.name, call.handler.__name__, latency)
+
+            if log_metrics:
+                metrics = self.metrics()
+                logger.info(
+                    "%s gestures: %d handled, %d merged, %d dropped, latency avg %.3f max %.3f seconds",
+                    self.name, self.handled_count, metrics['merged'], metrics['dropped'],
+                    metrics['latency_avg'], metrics['latency_max'])
+
+
+class _Call:
+    def __init__(self, handler, args, merge, received_time):
+        self.handler = handler
+        self.args = args
+        self.merge = merge
+        self.received_time = received_time
@@ -0,0 +1,126 @@
+"""
+Engines driving the Nuimo apps of all configured Nuimos.
+
+`NuimoEngine` drives all Nuimos from the current process with a single
+controller manager and main loop. `ProcessEngine` is the fallback, it runs
+every Nuimo app in a dedicated process with its own controller manager and
+notifies it of changes through an inter-process queue.
+"""
+import logging
+
+from multiprocessing import Process, Queue
+from threading import Thread
+from time import sleep
+
+from nuimo import ControllerManager
+
+from . import NuimoApp
+from .discovery import SharedDiscovery
+
+
+logger = logging.getLogger(__name__)
+
+
+class NuimoEngine:
+
+    def __init__(self, ble_adapter_name):
+        self.ble_adapter_name = ble_adapter_name
+        self.components = {}
+        self.apps = {}
+        self.manager = ControllerManager(ble_adapter_name)
+        self.manager.is_adapter_powered = True
+        self.discovery = SharedDiscovery(self.manager)
+
+    def add(self, mac_address, components):
+        app = NuimoApp(self.ble_adapter_name, mac_address, components)
+        self.apps[mac_address] = app
+        self.components[mac_address] = components
+
+        # connecting waits until the Nuimo was discovered which must
+        # neither block the main loop nor other Nuimos
+        Thread(target=app.connect,
+               args=(self.manager, self.discovery),
+               name="connect-%s" % mac_address,
+               daemon=True).start()
+
+    def set_components(self, mac_address, components):
+        self.apps[mac_address].update_components(components)
+        self.components[mac_address] = components
+
+    def remove(self, mac_address):
+        self.apps.pop(mac_address).disconnect()
+        del self.components[mac_address]
+
+    def run(self):
+        self.manager.run()
+
+    def stop(self):
+        for mac_address in list(self.apps):
+            self.remove(mac_address)
+        self.manager.stop()
+
+    def get_rss(self):
+        return get_rss()
+
+
+class ProcessEngine:
+
+    # how long a removed Nuimo app may take to stop before it's terminated
+    STOP_TIMEOUT = 10  # seconds
+
+    def __init__(self, ble_adapter_name):
+        self.ble_adapter_name = ble_adapter_name
+        self.components = {}
+        self.queues = {}
+        self.processes = {}
+
+    def add(self, mac_address, components):
+        app = NuimoApp(self.ble_adapter_name, mac_address, components)
+        self.queues[mac_address] = Queue()
+        self.components[mac_address] = components
+        # [Alan] For each nuimo a separate process is spawned
+        # This is required because this NuimoApp instance is executed
+        # in its own process (because gatt-python doesn't handle multiple
+        # devices in a single thread correctly) and it needs to be notified
+        # of changes and when to quit
+        self.processes[mac_address] = Process(name="nuimo-%s" % mac_address,
+                                              target=app.start,
+                                              args=(self.queues[mac_address],),
+                                              daemon=True)
+        logger.debug("Starting nuimo BT control process %s" % self.processes[mac_address].name)
+        self.processes[mac_address].start()
+
+    def set_components(self, mac_address, components):
+        self.queues[mac_address].put({'method': 'set_components', 'components': components})
+        self.components[mac_address] = components
+
+    def remove(self, mac_address):
+        self.queues.pop(mac_address).put({'method': 'stop'})
+        process = self.processes.pop(mac_address)
+        process.join(self.STOP_TIMEOUT)
+        if process.is_alive():
+            logger.warning("%s didn't stop within %d seconds, terminating it", process.name, self.STOP_TIMEOUT)
+            process.terminate()
+            process.join()
+        del self.components[mac_address]
+
+    def run(self):
+        while True:
+            sleep(1)
+
+    def stop(self):
+        for mac_address in list(self.processes):
+            self.remove(mac_address)
+
+    def get_rss(self):
+        return get_rss() + sum(get_rss(p.pid) for p in self.processes.values())
+
+
+def get_rss(pid='self'):
+    """
+    Return the resident set size of a process in kB.
+    """
+    with open('/proc/{}/status'.format(pid)) as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
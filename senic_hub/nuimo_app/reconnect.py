@@ -0,0 +1,176 @@
+import logging
+
+from bisect import bisect_left
+from random import uniform
+from threading import Lock, Timer
+from time import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReconnectSupervisor:
+    """
+    Reconnects a single Nuimo after a failed connection attempt or an
+    unexpected disconnect, waiting exponentially longer (with jitter)
+    between attempts. After `ATTEMPTS_BEFORE_RESET` failed attempts the
+    device is reset, e.g. removed from BlueZ and discovered again, before
+    trying again.
+
+    The time from losing the connection until it's established again is
+    recorded in a histogram which is logged after every recovery, see
+    `metrics()`.
+    """
+
+    STATE_CONNECTED = 'connected'
+    STATE_WAITING = 'waiting'
+    STATE_CONNECTING = 'connecting'
+    STATE_RESETTING = 'resetting'
+    STATE_STOPPED = 'stopped'
+
+    INITIAL_DELAY = 1  # seconds
+    MAX_DELAY = 60  # seconds
+
+    # how long to wait for a connection attempt to succeed or fail
+    CONNECT_TIMEOUT = 30  # seconds
+
+    ATTEMPTS_BEFORE_RESET = 5
+
+    # upper bounds in seconds of the recovery time histogram buckets
+    RECOVERY_TIME_BUCKETS = (1, 5, 10, 30, 60, 300, float('inf'))
+
+    def __init__(self, name, connect, reset):
+        self.name = name
+        self.state = self.STATE_CONNECTING
+        self.attempts = 0
+        self.reset_count = 0
+        self.recovery_times = [0] * len(self.RECOVERY_TIME_BUCKETS)
+        self._connect = connect
+        self._reset = reset
+        self._lock = Lock()
+        self._timer = None
+        self._attempt_id = 0
+        self._disconnected_time = None
+
+    def connected(self):
+        with self._lock:
+            if self.state == self.STATE_STOPPED:
+                return
+
+            self._cancel_timer()
+            if self._disconnected_time is not None:
+                recovery_time = time() - self._disconnected_time
+                self.recovery_times[bisect_left(self.RECOVERY_TIME_BUCKETS, recovery_time)] += 1
+                logger.info("%s connected after %.1f seconds and %d attempts", self.name, recovery_time, self.attempts + 1)
+                logger.info("%s recovery times: %s", self.name, self._format_recovery_times())
+
+            self.state = self.STATE_CONNECTED
+            self.attempts = 0
+            self._disconnected_time = None
+
+    def connection_lost(self):
+        with self._lock:
+            if self.state == self.STATE_STOPPED:
+                return
+
+            if self._disconnected_time is None:
+                self._disconnected_time = time()
+            self._schedule_attempt()
+
+    def connect_failed(self):
+        with self._lock:
+            if self.state == self.STATE_STOPPED:
+                return
+
+            if self._disconnected_time is None:
+                self._disconnected_time = time()
+            self.attempts += 1
+            self._schedule_attempt()
+
+    def stop(self):
+        with self._lock:
+            self._cancel_timer()
+            self.state = self.STATE_STOPPED
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'attempts': self.attempts,
+                'resets': self.reset_count,
+                'recovery_times': dict(zip(self.RECOVERY_TIME_BUCKETS, self.recovery_times)),
+            }
+
+    def _format_recovery_times(self):
+        return ', '.join(
+            '<=%gs: %d' % (bucket, count) if bucket != float('inf') else '>%gs: %d' % (self.RECOVERY_TIME_BUCKETS[-2], count)
+            for bucket, count in zip(self.RECOVERY_TIME_BUCKETS, self.recovery_times))
+
+    def get_delay(self):
+        """
+        Return how long to wait before the next attempt. The first attempt
+        after losing the connection is made immediately.
+        """
+        if self.attempts == 0:
+            return 0
+        delay = min(self.MAX_DELAY, self.INITIAL_DELAY * 2 ** (self.attempts - 1))
+        # jitter avoids all Nuimos reconnecting at the same time after the adapter failed
+        return uniform(delay / 2, delay)
+
+    def _schedule_attempt(self):
+        self._cancel_timer()
+        self.state = self.STATE_WAITING
+
+        delay = self.get_delay()
+        logger.info("%s reconnecting in %.1f seconds (attempt %d)", self.name, delay, self.attempts + 1)
+        self._start_timer(delay, self._attempt)
+
+    def _attempt(self):
+        with self._lock:
+            if self.state != self.STATE_WAITING:
+                return
+
+            reset = self.attempts >= self.ATTEMPTS_BEFORE_RESET
+            self.state = self.STATE_RESETTING if reset else self.STATE_CONNECTING
+
+        if reset:
+            logger.warning("%s failed to connect %d times, resetting it", self.name, self.attempts)
+            try:
+                self._reset()
+            except Exception:
+                logger.exception("Failed to reset %s", self.name)
+
+            with self._lock:
+                if self.state != self.STATE_RESETTING:
+                    return
+                self.reset_count += 1
+                self.attempts = 0
+                self.state = self.STATE_CONNECTING
+
+        with self._lock:
+            self._attempt_id += 1
+            self._start_timer(self.CONNECT_TIMEOUT, self._attempt_timed_out, self._attempt_id)
+
+        try:
+            self._connect()
+        except Exception:
+            logger.exception("Failed to connect %s", self.name)
+            self.connect_failed()
+
+    def _attempt_timed_out(self, attempt_id):
+        with self._lock:
+            if self.state != self.STATE_CONNECTING or attempt_id != self._attempt_id:
+                return
+
+        logger.warning("%s didn't connect within %d seconds", self.name, self.CONNECT_TIMEOUT)
+        self.connect_failed()
+
+    def _start_timer(self, delay, function, *args):
+        self._timer = Timer(delay, function, args)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
@@ -0,0 +1,327 @@
+"""
+Status of all Nuimos shared by nuimo_app with the backend through a
+memory mapped file.
+
+The file starts with a header followed by a fixed number of slots, one per
+Nuimo. Every slot is guarded by a sequence counter (seqlock): the writer
+increments it before and after modifying the slot, so that it's odd while
+the slot is being written. Readers retry until they read the same even
+counter before and after copying the slot, hence they never block the
+writer and don't need any system call once the file is mapped.
+
+The header also holds a change counter. It's incremented whenever a Nuimo
+connects, disconnects or reports another battery level and whenever other
+processes publish a change (e.g. of Sonos groups or device reachability),
+so that the backend can wait for changes instead of polling every device.
+"""
+import fcntl
+import mmap
+import os
+import struct
+
+from contextlib import contextmanager
+from threading import Condition, Lock, Thread
+from time import sleep, time
+
+
+DEFAULT_PATH = '/dev/shm/senic_hub_nuimo_status'
+
+MAGIC = b'NUIS'
+VERSION = 2
+MAX_SLOTS = 16
+
+# magic, version, number of slots, size of a slot, change counter
+HEADER = struct.Struct('<4sHHH2xI')
+CHANGES_OFFSET = 12
+
+# how often the change counter is checked while anyone is waiting for a
+# change published by another process, see `StatusSegment.wait_for_change()`
+CHANGE_POLL_INTERVAL = 0.1  # seconds
+
+# sequence counter, MAC address, battery level, connection state,
+# index of the active component, timestamp of the last gesture
+SLOT = struct.Struct('<I6shBxh2xd6x')
+
+SIZE = HEADER.size + MAX_SLOTS * SLOT.size
+
+# how often a slot is read again while it's being written before giving up
+MAX_READ_RETRIES = 1000
+
+STATE_DISCONNECTED = 0
+STATE_CONNECTING = 1
+STATE_CONNECTED = 2
+
+CONNECTION_STATES = {
+    STATE_DISCONNECTED: 'disconnected',
+    STATE_CONNECTING: 'connecting',
+    STATE_CONNECTED: 'connected',
+}
+
+_EMPTY_MAC = bytes(6)
+
+
+def pack_mac_address(mac_address):
+    return bytes(int(b, 16) for b in mac_address.split(':'))
+
+
+def unpack_mac_address(packed):
+    return ':'.join('%02x' % b for b in packed)
+
+
+class StatusSegment:
+    """
+    Memory mapped status file, created and initialized if it doesn't exist
+    or has an unknown layout.
+    """
+
+    def __init__(self, file_path=DEFAULT_PATH, writable=False):
+        self.file_path = file_path
+        self.writable = writable
+        self._thread_lock = Lock()
+        self._changed = Condition()
+        self._waiters = 0
+        self._watcher = None
+
+        fd = os.open(file_path, (os.O_RDWR | os.O_CREAT) if writable else os.O_RDONLY, 0o644)
+        try:
+            if writable:
+                # serializes initialization with other processes, the lock
+                # is released explicitly as the mapping keeps the file open
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if os.fstat(fd).st_size < SIZE:
+                    os.ftruncate(fd, SIZE)
+                self.buffer = mmap.mmap(fd, SIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+                if HEADER.unpack_from(self.buffer)[:4] != (MAGIC, VERSION, MAX_SLOTS, SLOT.size):
+                    self.buffer[:SIZE] = bytes(SIZE)
+                    HEADER.pack_into(self.buffer, 0, MAGIC, VERSION, MAX_SLOTS, SLOT.size, 0)
+            else:
+                self.buffer = mmap.mmap(fd, SIZE, mmap.MAP_SHARED, mmap.PROT_READ)
+        finally:
+            if writable:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+        magic, version, self.slot_count, slot_size, _ = HEADER.unpack_from(self.buffer)
+        if (magic, version, slot_size) != (MAGIC, VERSION, SLOT.size):
+            raise ValueError("%s has an unknown layout" % file_path)
+
+    def slot(self, mac_address):
+        """
+        Return the writer of the Nuimo's slot, allocating a free slot if the
+        Nuimo has none yet. The status left over by a previous writer is reset.
+        """
+        packed_mac = pack_mac_address(mac_address)
+        with self._file_lock():
+            index = None
+            for i in range(self.slot_count):
+                # slots are only freed and allocated while holding the file
+                # lock, an odd counter was left by a writer that crashed
+                # while writing its slot
+                offset = HEADER.size + i * SLOT.size
+                seq, mac = SLOT.unpack_from(self.buffer, offset)[:2]
+                if seq % 2:
+                    struct.pack_into('<I', self.buffer, offset, _next_seq(seq))
+                if mac == packed_mac:
+                    index = i
+                    break
+                if mac == _EMPTY_MAC and index is None:
+                    index = i
+
+            if index is None:
+                raise RuntimeError("No free status slot left for %s" % mac_address)
+
+            slot = StatusSlot(self, index, packed_mac)
+            changed = slot._write(battery_level=-1, connection_state=STATE_DISCONNECTED, active_component=-1, last_gesture_time=0)
+
+        if changed:
+            self.publish_change()
+        return slot
+
+    @property
+    def changes(self):
+        return struct.unpack_from('<I', self.buffer, CHANGES_OFFSET)[0]
+
+    def publish_change(self):
+        """
+        Wake up everyone waiting for a change, see `wait_for_change()`.
+        """
+        with self._file_lock():
+            struct.pack_into('<I', self.buffer, CHANGES_OFFSET, _next_seq(self.changes))
+
+        with self._changed:
+            self._changed.notify_all()
+
+    def wait_for_change(self, since, timeout):
+        """
+        Return the change counter as soon as it differs from `since` or
+        after `timeout` seconds.
+
+        Waiters are woken up right away by changes published within this
+        process. Changes of other processes are noticed by a single thread
+        checking the counter while anyone is waiting.
+        """
+        deadline = time() + timeout
+        with self._changed:
+            self._waiters += 1
+            if self._watcher is None:
+                # the counter is read while holding the lock so that no
+                # change after checking it below can be missed
+                self._watcher = Thread(target=self._watch_changes, args=(self.changes,), name='Nuimo status changes', daemon=True)
+                self._watcher.start()
+            try:
+                while True:
+                    changes = self.changes
+                    remaining = deadline - time()
+                    if changes != since or remaining <= 0:
+                        return changes
+                    self._changed.wait(remaining)
+            finally:
+                self._waiters -= 1
+
+    def _watch_changes(self, changes):
+        while True:
+            sleep(CHANGE_POLL_INTERVAL)
+            with self._changed:
+                if not self._waiters:
+                    self._watcher = None
+                    return
+                if self.changes != changes:
+                    changes = self.changes
+                    self._changed.notify_all()
+
+    def read(self, mac_address):
+        """
+        Return the status of the Nuimo or None if it has no slot.
+        """
+        return self.read_all().get(mac_address)
+
+    def read_all(self):
+        """
+        Return the status of all Nuimos by MAC address.
+        """
+        statuses = {}
+        for index in range(self.slot_count):
+            _, mac, battery_level, connection_state, active_component, last_gesture_time = self._read_slot(index)
+            if mac == _EMPTY_MAC:
+                continue
+
+            statuses[unpack_mac_address(mac)] = {
+                'battery_level': battery_level if battery_level >= 0 else None,
+                'connection_state': CONNECTION_STATES.get(connection_state),
+                'active_component': active_component if active_component >= 0 else None,
+                'last_gesture_time': last_gesture_time or None,
+            }
+
+        return statuses
+
+    def _read_slot(self, index):
+        # a slot is written within microseconds, if it's still being written
+        # after all retries its writer crashed and the last copy is returned
+        offset = HEADER.size + index * SLOT.size
+        for _ in range(MAX_READ_RETRIES):
+            values = SLOT.unpack_from(self.buffer, offset)
+            if values[0] % 2 == 0 and struct.unpack_from('<I', self.buffer, offset)[0] == values[0]:
+                return values
+            sleep(0)
+        return values
+
+    @contextmanager
+    def _file_lock(self):
+        # serializes slot allocation and publishing changes with other
+        # threads and processes
+        with self._thread_lock:
+            fd = os.open(self.file_path, os.O_RDWR)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)
+
+
+class StatusSlot:
+    """
+    Writes the status of a single Nuimo. Updates from multiple threads are
+    serialized, there must be only one writer per Nuimo.
+    """
+
+    def __init__(self, segment, index, packed_mac):
+        self.segment = segment
+        self.offset = HEADER.size + index * SLOT.size
+        self.packed_mac = packed_mac
+        self.released = False
+        self._lock = Lock()
+
+    def update(self, **fields):
+        """
+        Update the given fields: `battery_level`, `connection_state`,
+        `active_component` and `last_gesture_time`.
+        """
+        if self._write(**fields):
+            self.segment.publish_change()
+
+    def _write(self, **fields):
+        # returns whether a change must be published
+        buffer = self.segment.buffer
+        with self._lock:
+            if self.released:
+                # e.g. the disconnect of a removed Nuimo is reported after
+                # its slot was released, it must not be taken back
+                return False
+            seq, _, battery_level, connection_state, active_component, last_gesture_time = SLOT.unpack_from(buffer, self.offset)
+            values = {
+                'battery_level': battery_level,
+                'connection_state': connection_state,
+                'active_component': active_component,
+                'last_gesture_time': last_gesture_time,
+            }
+            values.update(fields)
+            changed = (values['battery_level'], values['connection_state']) != (battery_level, connection_state)
+
+            struct.pack_into('<I', buffer, self.offset, _next_seq(seq))
+            SLOT.pack_into(buffer, self.offset, _next_seq(seq), self.packed_mac, values['battery_level'], values['connection_state'],
+                           values['active_component'], values['last_gesture_time'])
+            struct.pack_into('<I', buffer, self.offset, _next_seq(seq, 2))
+        return changed
+
+    def release(self):
+        """
+        Free the slot, e.g. when the Nuimo was removed. Later updates are
+        ignored.
+        """
+        with self.segment._file_lock(), self._lock:
+            self.released = True
+            seq = struct.unpack_from('<I', self.segment.buffer, self.offset)[0]
+            struct.pack_into('<I', self.segment.buffer, self.offset, _next_seq(seq))
+            SLOT.pack_into(self.segment.buffer, self.offset, _next_seq(seq), _EMPTY_MAC, -1, STATE_DISCONNECTED, -1, 0)
+            struct.pack_into('<I', self.segment.buffer, self.offset, _next_seq(seq, 2))
+
+        self.segment.publish_change()
+
+
+def _next_seq(seq, increment=1):
+    # wraps around without changing whether the counter is odd
+    return (seq + increment) % 2 ** 32
+
+
+_segments = {}
+_segments_lock = Lock()
+
+
+def get_status_segment(file_path=DEFAULT_PATH, writable=False):
+    """
+    Return the process-wide mapping of the status file. Raises
+    `FileNotFoundError` if a read-only segment doesn't exist yet.
+    """
+    with _segments_lock:
+        segment = _segments.get((file_path, writable))
+        if segment is None:
+            segment = _segments[(file_path, writable)] = StatusSegment(file_path, writable)
+        return segment
+
+
+def publish_change(file_path=DEFAULT_PATH):
+    """
+    Publish a change from a process that doesn't write any Nuimo's status,
+    see `StatusSegment.publish_change()`.
+    """
+    get_status_segment(file_path, writable=True).publish_change()
@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+
+from senic_hub.nuimo_app import get_component_instances
+from senic_hub.nuimo_app.components import STATION_KEYS, ThreadComponent
+
+
+class FakeComponent(ThreadComponent):
+    RECONFIGURABLE_KEYS = ThreadComponent.RECONFIGURABLE_KEYS | STATION_KEYS
+
+    def __init__(self, component_config):
+        super().__init__(component_config)
+        self.first = component_config['first']
+
+    def reconfigure(self, component_config, changed_keys):
+        if not super().reconfigure(component_config, changed_keys):
+            return False
+        self.station_id_1 = component_config.get('station1', None)
+        return True
+
+
+class TestGetComponentInstances(TestCase):
+
+    def setUp(self):
+        patcher = patch('senic_hub.nuimo_app.import_module', lambda name: SimpleNamespace(Component=FakeComponent))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.components = [
+            {'id': 'a', 'type': 'philips_hue', 'name': 'A', 'device_ids': ['a-light-1']},
+            {'id': 'b', 'type': 'sonos', 'name': 'B'},
+        ]
+        self.instances = get_component_instances(self.components, '00:00:00:00:00:00')
+
+    def test_unchanged_components_are_reused(self):
+        instances = get_component_instances([dict(c) for c in self.components], '00:00:00:00:00:00', self.instances)
+        self.assertIs(instances[0], self.instances[0])
+        self.assertIs(instances[1], self.instances[1])
+
+    def test_reconfigurable_changes_are_applied_in_place(self):
+        self.components[1] = dict(self.components[1], name='Renamed', station1='foo')
+        instances = get_component_instances(self.components, '00:00:00:00:00:00', self.instances)
+        self.assertIs(instances[1], self.instances[1])
+        self.assertEqual(instances[1].component_name, 'Renamed')
+        self.assertEqual(instances[1].station_id_1, 'foo')
+        self.assertEqual(instances[1].config['name'], 'Renamed')
+
+    def test_changed_components_are_recreated(self):
+        self.components[0] = dict(self.components[0], device_ids=['a-light-2'])
+        instances = get_component_instances(self.components, '00:00:00:00:00:00', self.instances)
+        self.assertIsNot(instances[0], self.instances[0])
+        self.assertIs(instances[1], self.instances[1])
+        self.assertTrue(instances[0].first)
+
+    def test_added_philips_hue_component_isnt_first_if_other_is_kept(self):
+        self.components.append({'id': 'c', 'type': 'philips_hue', 'name': 'C', 'device_ids': ['c-light-1']})
+        instances = get_component_instances(self.components, '00:00:00:00:00:00', self.instances)
+        self.assertIs(instances[0], self.instances[0])
+        self.assertFalse(instances[2].first)
+
+    def test_removed_components_are_dropped(self):
+        instances = get_component_instances(self.components[1:], '00:00:00:00:00:00', self.instances)
+        self.assertEqual(instances, [self.instances[1]])
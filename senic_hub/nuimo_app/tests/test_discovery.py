@@ -0,0 +1,63 @@
+from threading import Thread
+from time import sleep
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from senic_hub.nuimo_app import NuimoApp
+from senic_hub.nuimo_app.discovery import SharedDiscovery
+
+
+class TestSharedDiscovery(TestCase):
+
+    def setUp(self):
+        patchers = [
+            patch('senic_hub.nuimo_app.get_status_segment'),
+            # don't wait 3 seconds between looking for the Nuimos
+            patch('senic_hub.nuimo_app.time.sleep', side_effect=lambda seconds: sleep(0.01)),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.discovered = []
+        self.manager = MagicMock()
+        self.manager.devices.side_effect = lambda: [MagicMock(mac_address=m) for m in list(self.discovered)]
+        self.discovery = SharedDiscovery(self.manager)
+
+    def wait_until_discovered(self, mac_address):
+        app = NuimoApp('hci0', mac_address, [])
+        app.manager, app.discovery = self.manager, self.discovery
+        thread = Thread(target=app.wait_until_discovered, daemon=True)
+        thread.start()
+        self.addCleanup(setattr, app, 'is_app_disconnection', True)
+        return thread
+
+    def test_discovery_is_stopped_when_last_nuimo_was_discovered(self):
+        first = self.wait_until_discovered('00:00:00:00:00:01')
+        second = self.wait_until_discovered('00:00:00:00:00:02')
+        sleep(0.05)
+
+        self.discovered.append('00:00:00:00:00:01')
+        first.join(1)
+        self.assertFalse(first.is_alive())
+        self.manager.stop_discovery.assert_not_called()
+
+        self.discovered.append('00:00:00:00:00:02')
+        second.join(1)
+        self.assertFalse(second.is_alive())
+        self.manager.start_discovery.assert_called_once_with()
+        self.manager.stop_discovery.assert_called_once_with()
+
+    def test_app_waiting_for_discovery_can_be_stopped(self):
+        app = NuimoApp('hci0', '00:00:00:00:00:01', [])
+        app.manager, app.discovery = self.manager, self.discovery
+        thread = Thread(target=app.wait_until_discovered, daemon=True)
+        thread.start()
+        sleep(0.05)
+
+        # there is no controller yet
+        app.stop()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.manager.stop.assert_called_once_with()
+        self.manager.stop_discovery.assert_called_once_with()
@@ -0,0 +1,88 @@
+from threading import Event, current_thread
+from unittest import TestCase
+
+from senic_hub.nuimo_app.dispatcher import GestureDispatcher
+
+
+class TestGestureDispatcher(TestCase):
+
+    def setUp(self):
+        self.dispatcher = GestureDispatcher('test')
+        self.calls = []
+        self.done = Event()
+
+        # keep the worker busy until `self.release` is set
+        self.release = Event()
+        started = Event()
+        self.dispatcher.dispatch(lambda: started.set() or self.release.wait(1))
+        started.wait(1)
+
+    def on_rotation(self, delta):
+        self.calls.append(('rotation', delta))
+
+    def on_button_press(self):
+        self.calls.append(('button', current_thread()))
+
+    def finish(self):
+        self.dispatcher.dispatch(self.done.set)
+        self.release.set()
+        self.assertTrue(self.done.wait(1))
+
+    def test_handlers_are_called_from_worker_thread(self):
+        self.dispatcher.dispatch(self.on_button_press)
+        self.finish()
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertIsNot(self.calls[0][1], current_thread())
+
+    def test_queued_rotations_are_merged(self):
+        self.dispatcher.dispatch(self.on_rotation, 0.1, merge=True)
+        self.dispatcher.dispatch(self.on_rotation, 0.25, merge=True)
+        self.finish()
+
+        self.assertEqual(self.calls, [('rotation', 0.35)])
+        self.assertEqual(self.dispatcher.metrics()['merged'], 1)
+
+    def test_rotations_arent_merged_across_other_gestures(self):
+        self.dispatcher.dispatch(self.on_rotation, 0.1, merge=True)
+        self.dispatcher.dispatch(self.on_button_press)
+        self.dispatcher.dispatch(self.on_rotation, 0.25, merge=True)
+        self.finish()
+
+        self.assertEqual([c[0] for c in self.calls], ['rotation', 'button', 'rotation'])
+        self.assertEqual(self.calls[2], ('rotation', 0.25))
+        self.assertEqual(self.dispatcher.metrics()['merged'], 0)
+
+    def test_gestures_are_dropped_when_queue_is_full(self):
+        for _ in range(GestureDispatcher.MAX_QUEUED_GESTURES):
+            self.assertTrue(self.dispatcher.dispatch(self.on_button_press))
+        self.assertFalse(self.dispatcher.dispatch(self.on_button_press))
+        self.assertEqual(self.dispatcher.metrics()['dropped'], 1)
+
+    def test_cleared_gestures_arent_handled(self):
+        self.dispatcher.dispatch(self.on_button_press)
+        self.dispatcher.dispatch(self.on_rotation, 0.1, merge=True)
+        self.dispatcher.clear()
+        self.finish()
+
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.dispatcher.metrics()['dropped'], 2)
+
+    def test_failing_handler_doesnt_stop_worker(self):
+        self.dispatcher.dispatch(lambda: 1 / 0)
+        self.dispatcher.dispatch(self.on_button_press)
+        self.finish()
+
+        self.assertEqual(len(self.calls), 1)
+        metrics = self.dispatcher.metrics()
+        self.assertGreater(metrics['latency_max'], 0)
+        self.assertIsNotNone(metrics['latency_avg'])
+
+    def test_metrics_are_logged_periodically(self):
+        self.dispatcher.METRICS_LOG_INTERVAL = 2
+        self.dispatcher.dispatch(self.on_button_press)
+        with self.assertLogs('senic_hub.nuimo_app.dispatcher') as logs:
+            self.finish()
+
+        # logged before the worker gets to `done.set`
+        self.assertIn('test gestures: 2 handled, 0 merged, 0 dropped, latency avg', logs.output[-1])
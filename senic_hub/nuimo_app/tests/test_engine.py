@@ -0,0 +1,82 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from senic_hub.nuimo_app.engine import NuimoEngine, ProcessEngine
+
+
+class TestNuimoEngine(TestCase):
+
+    def setUp(self):
+        for name in ('ControllerManager', 'NuimoApp', 'Thread'):
+            patcher = patch('senic_hub.nuimo_app.engine.' + name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+
+        self.NuimoApp.side_effect = lambda *args: MagicMock()
+        self.engine = NuimoEngine('hci0')
+
+    def test_all_nuimos_share_one_controller_manager(self):
+        self.engine.add('00:00:00:00:00:00', [])
+        self.engine.add('00:00:00:00:00:01', [])
+
+        self.ControllerManager.assert_called_once_with('hci0')
+        self.assertEqual(len(self.engine.apps), 2)
+        for mac_address, app in self.engine.apps.items():
+            self.Thread.assert_any_call(target=app.connect, args=(self.engine.manager, self.engine.discovery), name="connect-%s" % mac_address, daemon=True)
+
+    def test_components_are_updated_in_place(self):
+        self.engine.add('00:00:00:00:00:00', [])
+        components = [{'id': 'ph1', 'type': 'philips_hue'}]
+        self.engine.set_components('00:00:00:00:00:00', components)
+
+        self.engine.apps['00:00:00:00:00:00'].update_components.assert_called_once_with(components)
+        self.assertEqual(self.engine.components, {'00:00:00:00:00:00': components})
+
+    def test_removed_nuimo_is_disconnected_without_stopping_manager(self):
+        self.engine.add('00:00:00:00:00:00', [])
+        app = self.engine.apps['00:00:00:00:00:00']
+        self.engine.remove('00:00:00:00:00:00')
+
+        app.disconnect.assert_called_once_with()
+        self.engine.manager.stop.assert_not_called()
+        self.assertEqual(self.engine.components, {})
+
+    def test_stop_disconnects_all_nuimos(self):
+        self.engine.add('00:00:00:00:00:00', [])
+        app = self.engine.apps['00:00:00:00:00:00']
+        self.engine.stop()
+
+        app.disconnect.assert_called_once_with()
+        self.engine.manager.stop.assert_called_once_with()
+
+    def test_rss_of_current_process(self):
+        self.assertGreater(self.engine.get_rss(), 0)
+
+
+class TestProcessEngine(TestCase):
+
+    def setUp(self):
+        for name in ('NuimoApp', 'Process', 'Queue'):
+            patcher = patch('senic_hub.nuimo_app.engine.' + name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+
+        self.engine = ProcessEngine('hci0')
+        self.engine.add('00:00:00:00:00:00', [])
+        self.process = self.Process.return_value
+
+    def test_removed_nuimo_app_is_stopped(self):
+        self.process.is_alive.return_value = False
+        self.engine.remove('00:00:00:00:00:00')
+
+        self.Queue.return_value.put.assert_called_once_with({'method': 'stop'})
+        self.process.join.assert_called_once_with(ProcessEngine.STOP_TIMEOUT)
+        self.process.terminate.assert_not_called()
+        self.assertEqual(self.engine.components, {})
+
+    def test_nuimo_app_not_stopping_is_terminated(self):
+        self.process.is_alive.return_value = True
+        self.engine.remove('00:00:00:00:00:00')
+
+        self.process.terminate.assert_called_once_with()
+        self.assertEqual(self.engine.processes, {})
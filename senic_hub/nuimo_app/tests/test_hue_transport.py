@@ -0,0 +1,73 @@
+import json
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from senic_hub.hue_transport import Bridge, HueTransport, get_hue_transport
+
+
+class FakeBridgeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = json.dumps({'path': self.path}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHueTransport(TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), FakeBridgeHandler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_connections_are_reused(self):
+        transport = HueTransport('127.0.0.1:%d' % self.server.server_port)
+
+        for i in range(3):
+            self.assertEqual(transport.request('GET', '/api/user/lights/%d' % i).json(), {'path': '/api/user/lights/%d' % i})
+
+        self.assertEqual(transport.metrics(), {'requests': 3, 'connections': 1, 'reused_connections': 2, 'throttled': 0})
+
+    @patch('senic_hub.hue_transport.sleep')
+    @patch('senic_hub.hue_transport.monotonic', return_value=100)
+    def test_requests_are_rate_limited(self, monotonic_mock, sleep_mock):
+        transport = HueTransport('127.0.0.1:%d' % self.server.server_port)
+        transport.MAX_BURST = 2
+
+        for i in range(5):
+            transport.request('GET', '/api/user/lights/1')
+
+        # requests beyond the burst are spread over the following time
+        self.assertEqual([round(c[0][0], 3) for c in sleep_mock.call_args_list], [0.1, 0.2, 0.3])
+        self.assertEqual(transport.metrics()['throttled'], 3)
+
+        # the bucket is refilled at the maximum rate
+        sleep_mock.reset_mock()
+        monotonic_mock.return_value = 101
+        transport.request('GET', '/api/user/lights/1')
+        sleep_mock.assert_not_called()
+
+    def test_transport_is_shared_per_bridge(self):
+        self.assertIs(get_hue_transport('127.0.0.2'), get_hue_transport('127.0.0.2'))
+        self.assertIsNot(get_hue_transport('127.0.0.2'), get_hue_transport('127.0.0.3'))
+
+
+class TestBridge(TestCase):
+
+    def test_requests_are_sent_through_transport(self):
+        bridge = Bridge('127.0.0.2', 'user')
+        bridge.transport = MagicMock(**{'request.return_value.json.return_value': [{'success': {}}]})
+
+        self.assertEqual(bridge.request('PUT', '/api/user/lights/1/state', {'on': True}), [{'success': {}}])
+        bridge.transport.request.assert_called_once_with('PUT', '/api/user/lights/1/state', '{"on": true}')
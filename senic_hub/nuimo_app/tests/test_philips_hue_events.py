@@ -0,0 +1,107 @@
+import json
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Event, Thread
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from senic_hub.nuimo_app.components.philips_hue_events import EVENT_STREAM_PATH, EventStream, parse_light_states
+from senic_hub.nuimo_app.components.philips_hue_mirror import MAX_AGE, STREAMING_SYNC_INTERVAL, LightStateMirror
+
+
+EVENTS = [
+    {'type': 'update', 'data': [
+        {'id_v1': '/lights/1', 'type': 'light', 'on': {'on': False}},
+        {'id_v1': '/lights/2', 'type': 'light', 'dimming': {'brightness': 50.0}},
+        {'id_v1': '/lights/2', 'type': 'zigbee_connectivity', 'status': 'connectivity_issue'},
+        {'id_v1': '/groups/1', 'type': 'grouped_light', 'on': {'on': False}},
+    ]},
+    {'type': 'add', 'data': [{'id_v1': '/lights/3', 'type': 'light', 'on': {'on': True}}]},
+]
+
+
+class FakeBridgeHandler(BaseHTTPRequestHandler):
+    # set by the tests: whether the bridge has an event stream and when
+    # to close it
+    supported = True
+    received = None
+
+    def do_GET(self):
+        if not self.supported or self.path != EVENT_STREAM_PATH or self.headers['hue-application-key'] != 'user':
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        self.wfile.write(b': hi\n\n')
+        self.wfile.write(b'id: 1:0\ndata: ' + json.dumps(EVENTS).encode() + b'\n\n')
+        self.wfile.flush()
+        # keep the stream open until the test is done
+        self.received.wait(5)
+
+    def log_message(self, *args):
+        pass
+
+
+class Subscriber:
+
+    def __init__(self):
+        self.states = None
+        self.called = Event()
+
+    def lights_changed(self, states):
+        self.states = states
+        self.called.set()
+
+
+class TestEventStream(TestCase):
+
+    def setUp(self):
+        FakeBridgeHandler.received = Event()
+        self.server = HTTPServer(('127.0.0.1', 0), FakeBridgeHandler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        bridge = MagicMock(ip='127.0.0.1', username='user')
+        bridge.get_light.return_value = {
+            '1': {'state': {'on': True, 'bri': 254, 'reachable': True}},
+            '2': {'state': {'on': True, 'bri': 254, 'reachable': True}},
+        }
+        self.mirror = LightStateMirror(bridge)
+        self.mirror.poll()
+        self.mirror.event_stream = EventStream(self.mirror, 'http://127.0.0.1:%d%s' % (self.server.server_port, EVENT_STREAM_PATH))
+        self.addCleanup(self.mirror.event_stream.stop)
+        self.addCleanup(FakeBridgeHandler.received.set)
+
+    def test_events_are_applied_to_subscribed_lights(self):
+        subscriber = Subscriber()
+        self.mirror.subscribe(['2'], subscriber.lights_changed)
+        subscriber.called.clear()
+        self.mirror.event_stream.start()
+
+        self.assertTrue(subscriber.called.wait(5))
+        self.assertEqual(subscriber.states, {'2': {'on': True, 'bri': 127, 'reachable': False}})
+        self.assertEqual(self.mirror.lights['1']['state']['on'], False)
+        self.assertTrue(self.mirror.event_stream.connected)
+        self.assertEqual(self.mirror.sync_interval, STREAMING_SYNC_INTERVAL)
+
+    def test_lights_are_polled_if_bridge_has_no_event_stream(self):
+        FakeBridgeHandler.supported = False
+        self.addCleanup(setattr, FakeBridgeHandler, 'supported', True)
+
+        self.mirror.event_stream.consume()
+
+        self.assertIs(self.mirror.event_stream.supported, False)
+        self.assertEqual(self.mirror.sync_interval, MAX_AGE)
+
+
+class TestParseLightStates(TestCase):
+
+    def test_light_updates_are_converted_to_api_v1_states(self):
+        self.assertEqual(parse_light_states(EVENTS), {
+            '1': {'on': False},
+            '2': {'bri': 127, 'reachable': False},
+        })
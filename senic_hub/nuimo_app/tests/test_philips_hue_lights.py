@@ -0,0 +1,77 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from senic_hub.nuimo_app.components.philips_hue import LightSet
+from senic_hub.nuimo_app.components.philips_hue_mirror import LightStateMirror
+
+
+def create_bridge(groups):
+    bridge = MagicMock(ip='127.0.0.1', username='user')
+    bridge.get_group.return_value = groups
+    return bridge
+
+
+class TestLightSet(TestCase):
+
+    def test_attributes_of_multiple_lights_are_sent_to_group(self):
+        bridge = create_bridge({'1': {'name': 'Senic hub 0', 'lights': ['1', '2']}})
+        bridge.set_group.return_value = [[{'success': {'/groups/1/action/bri': 100}}]]
+        lights = LightSet(bridge, ['1', '2'], 0, False)
+
+        response = lights.set_attributes({'bri': 100})
+
+        bridge.set_group.assert_called_once_with(1, {'bri': 100}, transitiontime=LightSet.TRANSITION_TIME)
+        bridge.set_light.assert_not_called()
+        self.assertEqual(response, {'bri': 100})
+        self.assertEqual(lights.brightness, 100)
+
+    def test_single_light_is_set_directly(self):
+        bridge = create_bridge({})
+        bridge.set_light.return_value = [[{'success': {'/lights/3/state/on': True}}]]
+        lights = LightSet(bridge, ['3'], 0, False)
+
+        self.assertEqual(lights.set_attributes({'on': True}), {'on': True})
+        bridge.set_light.assert_called_once_with(3, {'on': True}, transitiontime=LightSet.TRANSITION_TIME)
+
+    def test_lights_are_set_concurrently_without_group(self):
+        bridge = create_bridge({})
+        bridge.create_group.return_value = [{'error': {'description': 'group table full'}}]
+        bridge.transport.request.side_effect = lambda method, path, data: MagicMock(**{
+            'json.return_value': [{'success': {path.split('/api/user')[1].replace('state', 'state/bri'): 50}}],
+        })
+        lights = LightSet(bridge, ['1', '2', '3'], 0, False)
+
+        response = lights.set_attributes({'bri': 50})
+
+        calls = sorted(c[0][:2] for c in bridge.transport.request.call_args_list)
+        self.assertEqual(calls, [('PUT', '/api/user/lights/{}/state'.format(i)) for i in '123'])
+        self.assertEqual(response, {'bri': 50})
+
+    def test_errors_of_concurrent_requests_are_returned(self):
+        bridge = create_bridge({})
+        bridge.create_group.return_value = [{'error': {'description': 'group table full'}}]
+        responses = iter([
+            [{'success': {'/lights/1/state/on': True}}],
+            [{'error': {'description': 'light 2 unreachable'}}],
+        ])
+        bridge.transport.request.side_effect = lambda method, path, data: MagicMock(**{'json.return_value': next(responses)})
+        lights = LightSet(bridge, ['1', '2'], 0, False)
+
+        self.assertEqual(lights.set_attributes({'on': True}), {'errors': [{'description': 'light 2 unreachable'}]})
+
+    def test_state_is_synced_after_own_changes(self):
+        bridge = create_bridge({})
+        bridge.get_light.return_value = {'3': {'state': {'on': True, 'bri': 100}}}
+        bridge.set_light.return_value = [[{'success': {'/lights/3/state/bri': 200}}]]
+        with patch('senic_hub.nuimo_app.components.philips_hue.get_light_state_mirror', lambda bridge: LightStateMirror(bridge)):
+            lights = LightSet(bridge, ['3'], 0, False)
+        lights.mirror.poll(max_age=0)
+        self.assertEqual(lights.brightness, 100)
+
+        lights.set_attributes({'bri': 200})
+        self.assertEqual(lights.brightness, 200)
+
+        # changed back by another app, the mirrored light looks unchanged
+        lights.mirror.poll_time = None
+        lights.update_state()
+        self.assertEqual(lights.brightness, 100)
@@ -0,0 +1,57 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from senic_hub.nuimo_app.components.philips_hue_mirror import LightStateMirror
+
+
+def light(on=True, bri=100):
+    return {'name': 'Light', 'state': {'on': on, 'bri': bri, 'reachable': True}}
+
+
+class Subscriber:
+
+    def __init__(self):
+        self.calls = []
+
+    def lights_changed(self, states):
+        self.calls.append(states)
+
+
+class TestLightStateMirror(TestCase):
+
+    def setUp(self):
+        self.bridge = MagicMock(ip='127.0.0.1', username='user')
+        self.bridge.get_light.return_value = {'1': light(), '2': light()}
+        self.mirror = LightStateMirror(self.bridge)
+
+    def test_lights_are_fetched_once_within_max_age(self):
+        self.assertEqual(self.mirror.poll(max_age=5), {'1': light(), '2': light()})
+        self.mirror.poll(max_age=5)
+        self.assertEqual(self.bridge.get_light.call_count, 1)
+
+        self.mirror.poll(max_age=0)
+        self.assertEqual(self.bridge.get_light.call_count, 2)
+
+    def test_subscribers_are_only_called_for_their_changed_lights(self):
+        subscriber_1, subscriber_2 = Subscriber(), Subscriber()
+        self.mirror.subscribe(['1'], subscriber_1.lights_changed)
+        self.mirror.subscribe(['2'], subscriber_2.lights_changed)
+        self.mirror.poll(max_age=0)
+
+        self.bridge.get_light.return_value = {'1': light(), '2': light(bri=50)}
+        self.mirror.poll(max_age=0)
+        self.mirror.poll(max_age=0)
+
+        self.assertEqual(subscriber_1.calls, [{'1': light()['state']}])
+        self.assertEqual(subscriber_2.calls, [{'2': light()['state']}, {'2': light(bri=50)['state']}])
+
+    def test_subscribers_are_called_right_away_with_fetched_lights(self):
+        self.mirror.poll(max_age=0)
+        subscriber = Subscriber()
+        self.mirror.subscribe(['2', '3'], subscriber.lights_changed)
+        self.assertEqual(subscriber.calls, [{'2': light()['state']}])
+
+    def test_subscribers_are_dropped_with_their_instance(self):
+        self.mirror.subscribe(['1'], Subscriber().lights_changed)
+        self.mirror.poll(max_age=0)
+        self.assertEqual(self.mirror._subscribers, [])
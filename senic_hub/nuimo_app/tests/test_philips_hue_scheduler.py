@@ -0,0 +1,81 @@
+from threading import Event
+from time import time
+from unittest import TestCase
+
+from senic_hub.nuimo_app.components.philips_hue_scheduler import PRIORITY_BACKGROUND, CommandScheduler
+
+
+class TestCommandScheduler(TestCase):
+
+    def setUp(self):
+        self.scheduler = CommandScheduler('test')
+        self.scheduler.MAX_COMMANDS_PER_SECOND = 1000
+        self.calls = []
+
+        # keep the scheduler thread busy until `self.release` is set
+        self.release = Event()
+        self.scheduler.submit(None, self.release.wait)
+
+    def command(self, name):
+        def function():
+            self.calls.append(name)
+            return name
+        return function
+
+    def test_pending_command_is_superseded_by_command_with_same_key(self):
+        first = self.scheduler.submit('bri', self.command('bri 1'))
+        second = self.scheduler.submit('bri', self.command('bri 2'))
+        self.release.set()
+
+        self.assertIs(first, second)
+        self.assertEqual(second.result(timeout=1), 'bri 2')
+        self.assertEqual(self.calls, ['bri 2'])
+        self.assertEqual(self.scheduler.metrics()['coalesced'], 1)
+
+    def test_commands_without_key_are_not_superseded(self):
+        first = self.scheduler.submit(None, self.command('toggle'))
+        second = self.scheduler.submit(None, self.command('toggle'))
+        self.release.set()
+
+        first.result(timeout=1)
+        second.result(timeout=1)
+        self.assertEqual(self.calls, ['toggle', 'toggle'])
+
+    def test_user_commands_are_sent_before_background_commands(self):
+        sync = self.scheduler.submit('sync', self.command('sync'), PRIORITY_BACKGROUND)
+        self.scheduler.submit('a', self.command('a'))
+        self.scheduler.submit('b', self.command('b'))
+        self.release.set()
+
+        sync.result(timeout=1)
+        self.assertEqual(self.calls, ['a', 'b', 'sync'])
+
+    def test_command_rate_is_limited(self):
+        self.scheduler.MAX_COMMANDS_PER_SECOND = 20
+        self.release.set()
+
+        start = time()
+        futures = [self.scheduler.submit(None, self.command(n)) for n in range(5)]
+        for future in futures:
+            future.result(timeout=1)
+        self.assertGreaterEqual(time() - start, 4 / 20)
+
+    def test_delayed_command_isnt_sent_before_its_time(self):
+        self.release.set()
+
+        start = time()
+        self.scheduler.submit('rotation', lambda: time()).result(timeout=1)
+        sent_time = self.scheduler.submit('rotation', lambda: time(), delay=0.2).result(timeout=1)
+        self.assertGreaterEqual(sent_time - start, 0.2)
+
+    def test_failing_command_sets_exception(self):
+        self.release.set()
+
+        future = self.scheduler.submit(None, lambda: 1 / 0)
+        with self.assertRaises(ZeroDivisionError):
+            future.result(timeout=1)
+
+        metrics = self.scheduler.metrics()
+        self.assertEqual(metrics['queue_depth'], 0)
+        self.assertEqual(metrics['sent'], 2)
+        self.assertGreater(metrics['latency_max'], 0)
@@ -0,0 +1,103 @@
+from threading import Event
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from senic_hub.nuimo_app import NuimoApp
+from senic_hub.nuimo_app.discovery import SharedDiscovery
+from senic_hub.nuimo_app.reconnect import ReconnectSupervisor
+
+
+class TestReconnectSupervisor(TestCase):
+
+    def setUp(self):
+        self.connect = MagicMock()
+        self.reset = MagicMock()
+        self.supervisor = ReconnectSupervisor('test', self.connect, self.reset)
+        self.supervisor.INITIAL_DELAY = 0.01
+        self.addCleanup(self.supervisor.stop)
+
+    def expect_connect(self, calls=1):
+        attempted = Event()
+        self.connect.side_effect = lambda: self.connect.call_count >= calls and attempted.set()
+        return attempted
+
+    def test_delay_grows_exponentially_with_jitter(self):
+        self.assertEqual(self.supervisor.get_delay(), 0)
+        for attempts, delay in ((1, 1), (2, 2), (3, 4), (10, 60)):
+            self.supervisor.attempts = attempts
+            self.supervisor.INITIAL_DELAY = 1
+            self.assertTrue(delay / 2 <= self.supervisor.get_delay() <= delay)
+
+    def test_lost_connection_is_reconnected_immediately(self):
+        attempted = self.expect_connect()
+        self.supervisor.connection_lost()
+        self.assertTrue(attempted.wait(1))
+        self.assertEqual(self.supervisor.state, ReconnectSupervisor.STATE_CONNECTING)
+
+    def test_recovery_time_is_recorded(self):
+        attempted = self.expect_connect()
+        self.supervisor.connection_lost()
+        self.assertTrue(attempted.wait(1))
+        with self.assertLogs('senic_hub.nuimo_app.reconnect') as logs:
+            self.supervisor.connected()
+
+        self.assertIn('test recovery times: <=1s: 1, <=5s: 0', logs.output[-1])
+        self.assertTrue(logs.output[-1].endswith('>300s: 0'))
+        metrics = self.supervisor.metrics()
+        self.assertEqual(metrics['state'], ReconnectSupervisor.STATE_CONNECTED)
+        self.assertEqual(metrics['recovery_times'][1], 1)
+        self.assertEqual(sum(metrics['recovery_times'].values()), 1)
+
+    def test_device_is_reset_after_failed_attempts(self):
+        self.supervisor.attempts = ReconnectSupervisor.ATTEMPTS_BEFORE_RESET - 1
+        attempted = self.expect_connect()
+        self.supervisor.connect_failed()
+        self.assertTrue(attempted.wait(1))
+
+        self.reset.assert_called_once_with()
+        self.assertEqual(self.supervisor.metrics()['resets'], 1)
+        self.assertEqual(self.supervisor.attempts, 0)
+
+    @patch.object(ReconnectSupervisor, 'CONNECT_TIMEOUT', 0.01)
+    def test_attempt_without_response_fails(self):
+        attempted = self.expect_connect(calls=2)
+        self.supervisor.connection_lost()
+        self.assertTrue(attempted.wait(1))
+        self.assertGreaterEqual(self.supervisor.attempts, 1)
+
+    def test_stopped_supervisor_doesnt_reconnect(self):
+        self.supervisor.stop()
+        self.supervisor.connection_lost()
+        self.supervisor.connect_failed()
+        self.assertEqual(self.supervisor.state, ReconnectSupervisor.STATE_STOPPED)
+        self.connect.assert_not_called()
+
+
+class TestResetController(TestCase):
+
+    def setUp(self):
+        patcher = patch('senic_hub.nuimo_app.get_status_segment')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.app = NuimoApp('hci0', '00:00:00:00:00:01', [])
+        self.app.manager = MagicMock(adapter_name='hci0')
+        # the manager still knows the removed device
+        self.app.manager.devices.return_value = [MagicMock(mac_address='00:00:00:00:00:01')]
+        self.app.discovery = SharedDiscovery(self.app.manager)
+        self.app.controller = MagicMock()
+
+    @patch('senic_hub.nuimo_app.time.sleep')
+    @patch('senic_hub.nuimo_app.Controller')
+    @patch('senic_hub.nuimo_app.bluez')
+    def test_controller_is_replaced_once_device_is_discovered_again(self, bluez_mock, controller_mock, sleep_mock):
+        bluez_mock.get_device_mac_addresses.side_effect = [[], ['00:00:00:00:00:01']]
+        old_controller = self.app.controller
+        self.app.reset_controller()
+
+        bluez_mock.remove_device.assert_called_once_with('hci0', '00:00:00:00:00:01')
+        self.assertIsNone(old_controller.listener)
+        self.assertEqual(bluez_mock.get_device_mac_addresses.call_count, 2)
+        self.assertIs(self.app.controller, controller_mock.return_value)
+        self.assertIs(self.app.controller.listener, self.app)
+        self.app.manager.stop_discovery.assert_called_once_with()
@@ -0,0 +1,115 @@
+from threading import Event
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from senic_hub.nuimo_app.components.sonos import Component
+
+
+class TestSonosComponent(TestCase):
+
+    def setUp(self):
+        patcher = patch('senic_hub.nuimo_app.components.sonos.SoCo')
+        self.soco_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        controller = self.soco_mock.return_value
+        controller.get_current_transport_info.return_value = {'current_transport_state': 'STOPPED'}
+        controller.volume = 10
+        controller.avTransport.subscribe.return_value = MagicMock(sid='av')
+        controller.renderingControl.subscribe.return_value = MagicMock(sid='rc')
+        controller.zoneGroupTopology.subscribe.return_value = MagicMock(sid='zg')
+
+        self.component = Component({'id': 's1', 'name': 'Sonos', 'ip_address': '127.0.0.1', 'station1': 'foo'})
+        self.component.nuimo = MagicMock()
+        self.component.last_request_time = 0
+
+    def test_events_of_all_subscriptions_are_received_from_one_queue(self):
+        self.component.start()
+
+        self.component.events.put(SimpleNamespace(sid='rc', variables={'volume': {'Master': '42'}}))
+        self.component.events.put(SimpleNamespace(sid='av', variables={'transport_state': 'PLAYING'}))
+        self.component.stop()
+        self.component.thread.join(timeout=1)
+
+        controller = self.soco_mock.return_value
+        self.assertIs(controller.avTransport.subscribe.call_args[1]['event_queue'], self.component.events)
+        self.assertIs(controller.renderingControl.subscribe.call_args[1]['event_queue'], self.component.events)
+        self.assertFalse(self.component.thread.is_alive())
+        self.assertEqual(self.component.volume, 42)
+        self.assertEqual(self.component.state, 'PLAYING')
+        controller.avTransport.subscribe.return_value.unsubscribe.assert_called_once_with()
+        controller.renderingControl.subscribe.return_value.unsubscribe.assert_called_once_with()
+
+    def test_stop_wakes_up_idle_loop(self):
+        self.component.start()
+        self.component.stop()
+        self.component.thread.join(timeout=1)
+        self.assertFalse(self.component.thread.is_alive())
+
+    @patch('senic_hub.nuimo_app.components.sonos.get_status_segment')
+    def test_group_changes_are_published(self, get_status_segment_mock):
+        controller = self.soco_mock.return_value
+        controller.group.members = [MagicMock(uid='a')]
+        self.component.start()
+
+        self.component.events.put(SimpleNamespace(sid='zg', variables={}))
+        self.component.events.put(SimpleNamespace(sid='zg', variables={}))
+        self.component.stop()
+        self.component.thread.join(timeout=1)
+        get_status_segment_mock.return_value.publish_change.assert_not_called()
+
+        controller.group.members = [MagicMock(uid='a'), MagicMock(uid='b')]
+        self.component.update_group_members()
+        get_status_segment_mock.return_value.publish_change.assert_called_once_with()
+        self.assertEqual(self.component.group_members, {'a', 'b'})
+
+    def test_volume_is_sent_to_joined_speakers_concurrently(self):
+        joined_controller = MagicMock(volume=10)
+        self.component.sonos_joined_controllers = [joined_controller]
+        self.component.state = 'PLAYING'
+        self.component.volume = 10
+
+        self.component.on_rotation(0.1)
+        self.component.volume_executor.shutdown(wait=True)
+
+        self.assertEqual(self.soco_mock.return_value.volume, 20)
+        self.assertEqual(joined_controller.volume, 20)
+
+    def test_only_latest_volume_is_sent_to_busy_speaker(self):
+        sent_volumes = []
+        release = Event()
+
+        class Controller:
+            @property
+            def volume(self):
+                return None
+
+            @volume.setter
+            def volume(self, volume):
+                release.wait(1)
+                sent_volumes.append(volume)
+
+        self.component.sonos_controller = Controller()
+        for volume in (1, 2, 3, 4):
+            self.component.send_volume(volume)
+        release.set()
+        self.component.volume_executor.shutdown(wait=True)
+
+        # the first volume might already be sent when the others are coalesced
+        self.assertIn(sent_volumes, ([1, 4], [4]))
+
+    def test_standby_keeps_receiving_events(self):
+        self.component.start()
+        thread = self.component.thread
+        self.component.standby()
+        self.component.events.put(SimpleNamespace(sid='rc', variables={'volume': {'Master': '42'}}))
+        self.component.start()
+        self.component.stop()
+        thread.join(timeout=1)
+
+        controller = self.soco_mock.return_value
+        self.assertIs(self.component.thread, thread)
+        self.assertEqual(controller.renderingControl.subscribe.call_count, 1)
+        self.assertEqual(self.component.volume, 42)
+        controller.renderingControl.subscribe.return_value.unsubscribe.assert_called_once_with()
@@ -0,0 +1,97 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from nuimo import Gesture
+
+from senic_hub.nuimo_app import NuimoApp
+
+
+def create_component(component_id, standby_memory=64):
+    return MagicMock(component_id=component_id, STANDBY_MEMORY=standby_memory, ip_address=None)
+
+
+class TestStandby(TestCase):
+
+    def setUp(self):
+        patcher = patch('senic_hub.nuimo_app.get_status_segment')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.app = NuimoApp('hci0', '00:00:00:00:00:00', [])
+        self.components = [create_component(i) for i in 'abcd']
+        self.app.set_components(self.components)
+
+    def test_deactivated_component_is_kept_in_standby(self):
+        a, b = self.components[:2]
+        self.app.set_active_component(b)
+
+        a.standby.assert_called_once_with()
+        a.stop.assert_not_called()
+        self.assertEqual(list(self.app.standby_components), ['a'])
+
+        self.app.set_active_component(a)
+        self.assertEqual(a.start.call_count, 2)
+        self.assertEqual(list(self.app.standby_components), ['b'])
+
+    def test_swiping_with_single_component_keeps_it_running(self):
+        a = self.components[0]
+        self.app.set_components([a])
+        self.app.show_active_component = MagicMock()
+        self.app.process_internal_gesture(Gesture.SWIPE_DOWN)
+        self.app.set_active_component()
+
+        a.standby.assert_not_called()
+        a.stop.assert_not_called()
+        self.assertEqual(a.start.call_count, 1)
+        self.assertEqual(list(self.app.standby_components), [])
+
+        self.app.disconnect()
+        a.stop.assert_called_once_with()
+
+    def test_queued_gestures_of_deactivated_component_are_dropped(self):
+        a, b = self.components[:2]
+        dispatchers = self.app.gesture_dispatchers = {'a': MagicMock(), 'b': MagicMock()}
+        self.app.set_active_component(b)
+
+        dispatchers['a'].clear.assert_called_once_with()
+        dispatchers['b'].clear.assert_not_called()
+
+        self.app.disconnect()
+        dispatchers['b'].clear.assert_called_once_with()
+
+    def test_least_recently_used_components_are_stopped(self):
+        a, b, c, d = self.components
+        self.app.MAX_STANDBY_COMPONENTS = 2
+        for component in (b, a, c, d):
+            self.app.set_active_component(component)
+
+        self.assertEqual(list(self.app.standby_components), ['a', 'c'])
+        b.stop.assert_called_once_with()
+
+    def test_components_are_stopped_beyond_memory_budget(self):
+        a, b, c = self.components[:3]
+        self.app.STANDBY_MEMORY_BUDGET = 100
+        self.app.set_active_component(b)
+        self.app.set_active_component(a)
+        self.app.set_active_component(c)
+
+        self.assertEqual(list(self.app.standby_components), ['a'])
+        a.stop.assert_not_called()
+        b.stop.assert_called_once_with()
+
+    def test_components_without_standby_arent_kept(self):
+        component = create_component('e', standby_memory=None)
+        self.app.set_components(self.components + [component])
+        self.app.set_active_component(component)
+        self.app.set_active_component(self.components[1])
+
+        component.standby.assert_called_once_with()
+        self.assertNotIn('e', self.app.standby_components)
+
+    def test_removed_components_in_standby_are_stopped(self):
+        a, b = self.components[:2]
+        self.app.set_active_component(b)
+        self.app.set_components([b])
+
+        a.stop.assert_called_once_with()
+        self.assertEqual(list(self.app.standby_components), [])
@@ -0,0 +1,124 @@
+import os
+import struct
+
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from senic_hub.nuimo_app.status import MAX_SLOTS, STATE_CONNECTED, STATE_DISCONNECTED, StatusSegment
+
+
+class TestStatusSegment(TestCase):
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.file_path = os.path.join(directory.name, 'status')
+        self.segment = StatusSegment(self.file_path, writable=True)
+
+    def test_new_slot_has_no_status(self):
+        self.segment.slot('00:00:00:00:00:0a')
+
+        self.assertEqual(self.segment.read('00:00:00:00:00:0a'), {
+            'battery_level': None,
+            'connection_state': 'disconnected',
+            'active_component': None,
+            'last_gesture_time': None,
+        })
+        self.assertIsNone(self.segment.read('00:00:00:00:00:0b'))
+
+    def test_updates_are_visible_to_readers(self):
+        reader = StatusSegment(self.file_path)
+        slot = self.segment.slot('00:00:00:00:00:0a')
+        slot.update(battery_level=80, connection_state=STATE_CONNECTED)
+        slot.update(active_component=1, last_gesture_time=1500000000.5)
+
+        self.assertEqual(reader.read_all(), {'00:00:00:00:00:0a': {
+            'battery_level': 80,
+            'connection_state': 'connected',
+            'active_component': 1,
+            'last_gesture_time': 1500000000.5,
+        }})
+
+    def test_nuimo_keeps_its_slot(self):
+        first = self.segment.slot('00:00:00:00:00:0a')
+        first.update(battery_level=80)
+        second = self.segment.slot('00:00:00:00:00:0b')
+        again = StatusSegment(self.file_path, writable=True).slot('00:00:00:00:00:0a')
+
+        self.assertEqual(again.offset, first.offset)
+        self.assertNotEqual(second.offset, first.offset)
+        self.assertIsNone(self.segment.read('00:00:00:00:00:0a')['battery_level'])
+
+    def test_released_slot_is_reused(self):
+        slot = self.segment.slot('00:00:00:00:00:0a')
+        slot.release()
+
+        self.assertEqual(self.segment.read_all(), {})
+        self.assertEqual(self.segment.slot('00:00:00:00:00:0b').offset, slot.offset)
+
+    def test_released_slot_ignores_updates(self):
+        slot = self.segment.slot('00:00:00:00:00:0a')
+        slot.release()
+        changes = self.segment.changes
+        slot.update(connection_state=STATE_DISCONNECTED, battery_level=10)
+
+        self.assertEqual(self.segment.read_all(), {})
+        self.assertEqual(self.segment.changes, changes)
+
+    def test_no_slot_left(self):
+        for i in range(MAX_SLOTS):
+            self.segment.slot('00:00:00:00:01:%02x' % i)
+        with self.assertRaises(RuntimeError):
+            self.segment.slot('00:00:00:00:00:0a')
+
+    def test_unknown_layout_is_rejected_by_readers(self):
+        with open(self.file_path, 'r+b') as f:
+            f.write(b'XXXX')
+        with self.assertRaises(ValueError):
+            StatusSegment(self.file_path)
+
+    def test_sequence_counter_stays_even(self):
+        slot = self.segment.slot('00:00:00:00:00:0a')
+        slot.update(battery_level=10)
+
+        seq = self.segment._read_slot(0)[0]
+        self.assertEqual(seq % 2, 0)
+        self.assertGreater(seq, 0)
+
+    def crash_while_writing(self, mac_address):
+        slot = self.segment.slot(mac_address)
+        slot.update(battery_level=80)
+        struct.pack_into('<I', self.segment.buffer, slot.offset, 7)
+        return slot
+
+    def test_slot_of_crashed_writer_can_be_read(self):
+        self.crash_while_writing('00:00:00:00:00:0a')
+        self.assertEqual(StatusSegment(self.file_path).read('00:00:00:00:00:0a')['battery_level'], 80)
+
+    def test_slot_of_crashed_writer_is_reset_when_allocated_again(self):
+        self.crash_while_writing('00:00:00:00:00:0a')
+        slot = StatusSegment(self.file_path, writable=True).slot('00:00:00:00:00:0a')
+        slot.update(battery_level=50)
+
+        self.assertEqual(struct.unpack_from('<I', self.segment.buffer, slot.offset)[0] % 2, 0)
+        self.assertEqual(self.segment.read('00:00:00:00:00:0a')['battery_level'], 50)
+
+    def test_connection_and_battery_changes_are_published(self):
+        slot = self.segment.slot('00:00:00:00:00:0a')
+        changes = self.segment.changes
+
+        slot.update(connection_state=STATE_CONNECTED)
+        slot.update(battery_level=80)
+        slot.update(battery_level=80, active_component=1, last_gesture_time=1500000000.5)
+        self.assertEqual(self.segment.changes, changes + 2)
+
+        slot.update(connection_state=STATE_DISCONNECTED)
+        slot.release()
+        self.assertEqual(self.segment.changes, changes + 4)
+
+    def test_wait_for_change(self):
+        changes = self.segment.changes
+        self.assertEqual(self.segment.wait_for_change(changes, 0.01), changes)
+
+        StatusSegment(self.file_path, writable=True).publish_change()
+        self.assertEqual(self.segment.wait_for_change(changes, 10), changes + 1)
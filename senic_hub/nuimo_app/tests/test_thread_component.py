@@ -0,0 +1,90 @@
+from threading import Timer
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from senic_hub.nuimo_app.components import ThreadComponent
+
+
+class FakeComponent(ThreadComponent):
+
+    def run(self):
+        pass
+
+
+class SyncingComponent(ThreadComponent):
+
+    def run(self):
+        while self.wait_for_sync(60):
+            pass
+
+
+class TestWaitForSync(TestCase):
+
+    def setUp(self):
+        self.component = FakeComponent({'id': 'a', 'name': 'A'})
+        self.component.wakeup_event = MagicMock(**{'wait.return_value': False})
+
+    def intervals(self, count, max_interval=5):
+        for _ in range(count):
+            self.assertTrue(self.component.wait_for_sync(max_interval))
+        return [c[0][0] for c in self.component.wakeup_event.wait.call_args_list[-count:]]
+
+    def test_interval_backs_off_while_idle(self):
+        self.assertEqual(self.intervals(5), [1, 2, 4, 5, 5])
+
+    def test_interval_is_reset_by_activity(self):
+        self.intervals(3)
+        self.component.notify_activity()
+        self.assertEqual(self.intervals(2), [1, 2])
+
+    def test_interval_is_reset_when_started_again(self):
+        self.intervals(3)
+        self.component.start()
+        self.assertEqual((self.component.idle_syncs, self.component.current_sync_interval), (0, 1))
+
+    def test_stopped_component_doesnt_sync(self):
+        self.component.stop()
+        self.assertFalse(self.component.wait_for_sync(5))
+        self.component.wakeup_event.wait.assert_not_called()
+
+
+class TestWakeup(TestCase):
+
+    def test_waiting_is_interrupted_by_stop(self):
+        component = FakeComponent({'id': 'a', 'name': 'A'})
+        Timer(0.05, component.stop).start()
+        self.assertFalse(component.wait_for_sync(60))
+
+    def test_activity_restarts_waiting_with_short_interval(self):
+        component = FakeComponent({'id': 'a', 'name': 'A'})
+        component.ACTIVE_SYNC_INTERVAL = 0.1
+        component.idle_syncs = 10
+        Timer(0.05, component.notify_activity).start()
+        self.assertTrue(component.wait_for_sync(60))
+        self.assertEqual(component.current_sync_interval, 0.1)
+
+
+class TestRestart(TestCase):
+
+    def test_restarting_leaves_one_run_thread(self):
+        component = SyncingComponent({'id': 'a', 'name': 'A'})
+        threads = []
+        for _ in range(5):
+            component.start()
+            threads.append(component.thread)
+            component.stop()
+        component.start()
+        self.addCleanup(component.stop)
+
+        for thread in threads:
+            thread.join(timeout=1)
+        self.assertEqual([t for t in threads + [component.thread] if t.is_alive()], [component.thread])
+        self.assertFalse(component.stopped)
+
+    def test_starting_running_component_does_nothing(self):
+        component = SyncingComponent({'id': 'a', 'name': 'A'})
+        component.start()
+        self.addCleanup(component.stop)
+        thread = component.thread
+        component.start()
+        self.assertIs(component.thread, thread)